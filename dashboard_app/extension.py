@@ -73,6 +73,7 @@ class DashboardExtension(LavaServerExtension):
         settings_module['DATAREPORT_DIRS'] = [
             os.path.join(root_dir, 'examples', 'reports'),
             os.path.join(root_dir, 'production', 'reports')]
+        settings_module['ASYNC_DESERIALIZATION'] = False
         prepend_label_apps = settings_module.get('STATICFILES_PREPEND_LABEL_APPS', [])
         if self.app_name in prepend_label_apps:
             prepend_label_apps.remove(self.app_name)
@@ -88,6 +89,10 @@ class DashboardExtension(LavaServerExtension):
             "DATAREPORTS_HIDE", False)
         settings_module['PM_QA_HIDE'] = settings_object._settings.get(
             "PM_QA_HIDE", True)
+        # Queue uploaded bundles for the deserialize_bundles workers
+        # instead of deserializing them in the XML-RPC request.
+        settings_module['ASYNC_DESERIALIZATION'] = settings_object._settings.get(
+            "ASYNC_DESERIALIZATION", False)
 
         # Enable constrained dataview database if requested
         if settings_object._settings.get("use_dataview_database"):
@@ -2,9 +2,14 @@
 Module with non-database helper classes
 """
 
+from collections import OrderedDict
+from cStringIO import StringIO
 from uuid import UUID
 import base64
+import decimal
+import json
 import logging
+import re
 import time
 
 from django.core.files.base import ContentFile
@@ -24,6 +29,65 @@ def is_postgres():
             == 'django.db.backends.postgresql_psycopg2')
 
 
+# Session local tables bundles are loaded into with COPY on PostgreSQL
+# before being merged into the dashboard tables. Temporary tables are not
+# written to the WAL, so they are as cheap as unlogged ones, without being
+# shared by concurrent imports.
+STAGING_TABLES = {
+    'dashboard_import_testresult': """
+        relative_index INTEGER,
+        timestamp      TIMESTAMP WITH TIME ZONE,
+        microseconds   BIGINT,
+        filename       TEXT,
+        result         SMALLINT,
+        measurement    CHARACTER VARYING(512),
+        message        TEXT,
+        test_case_id   TEXT,
+        units          TEXT,
+        lineno         INTEGER
+        """,
+    'dashboard_import_attribute': """
+        relative_index INTEGER,
+        name           TEXT,
+        value          TEXT
+        """,
+    'dashboard_import_package': """
+        name           TEXT,
+        version        TEXT
+        """,
+}
+
+
+def copy_text(value):
+    """
+    Formats value as a column of the text format of COPY.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif isinstance(value, float):
+        value = repr(value)
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r').encode('utf-8')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Loads rows, sequences of values for columns, into table with a single
+    COPY FROM STDIN.
+    """
+    data = StringIO()
+    for row in rows:
+        data.write('\t'.join(copy_text(value) for value in row))
+        data.write('\n')
+    data.seek(0)
+    cursor.copy_expert(
+        'COPY %s (%s) FROM STDIN' % (table, ', '.join(columns)), data)
+
+
 class IBundleFormatImporter(object):
     """
     Interface for bundle format importers.
@@ -59,11 +123,29 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         """
         Import specified bundle document into the database.
         """
-        self._content_files = []
         self._import_sanity_check(doc)
+        self._import_test_runs(s_bundle, doc.get("test_runs", []))
+
+    def import_test_runs(self, s_bundle, test_runs):
+        """
+        Import the test runs of a document as the test_runs iterable
+        yields them, checking each one just before its import, so that
+        the document does not have to be loaded at once.
+        """
+        self._import_test_runs(s_bundle, self._checked(test_runs))
+
+    def _checked(self, test_runs):
+        for test_run in test_runs:
+            self._check_test_run(test_run)
+            yield test_run
+
+    def _import_test_runs(self, s_bundle, test_runs):
+        self._content_files = []
+        self._staging = False
+        self._attributes = []
         try:
-            self._import_document_with_transaction(s_bundle, doc)
-        except IntegrityError:
+            self._import_document_with_transaction(s_bundle, test_runs)
+        except Exception:
             self._remove_created_files()
             raise
 
@@ -87,16 +169,19 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         The code copes with both (using transactions around _import_document()
         and _remove_created_files() that gets called if something is wrong)
         """
+        for test_run in doc.get("test_runs", []):
+            self._check_test_run(test_run)
+
+    def _check_test_run(self, test_run):
         from dashboard_app.models import TestRun
 
-        for test_run in doc.get("test_runs", []):
-            analyzer_assigned_uuid = test_run["analyzer_assigned_uuid"]
-            if TestRun.objects.filter(
-                    analyzer_assigned_uuid=analyzer_assigned_uuid).exists():
-                raise ValueError("A test with UUID {0} already exists".format(analyzer_assigned_uuid))
+        analyzer_assigned_uuid = test_run["analyzer_assigned_uuid"]
+        if TestRun.objects.filter(
+                analyzer_assigned_uuid=analyzer_assigned_uuid).exists():
+            raise ValueError("A test with UUID {0} already exists".format(analyzer_assigned_uuid))
 
     @transaction.atomic
-    def _import_document_with_transaction(self, s_bundle, doc):
+    def _import_document_with_transaction(self, s_bundle, test_runs):
         """
         Note: This function uses atomic to ensure the database is in a
         consistent state after IntegrityErrors that would clog the transaction
@@ -104,15 +189,38 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         the meantime there is a helper that cleans attachments in case
         something goes wrong.
         """
-        self._import_document(s_bundle, doc)
+        self._import_document(s_bundle, test_runs)
 
-    def _import_document(self, s_bundle, doc):
-        for c_test_run in doc.get("test_runs", []):
+    def _import_document(self, s_bundle, test_runs):
+        for c_test_run in test_runs:
             self._import_test_run(c_test_run, s_bundle)
+        if self._staging:
+            cursor = connection.cursor()
+            cursor.execute("DROP TABLE %s" % ", ".join(STAGING_TABLES))
+            cursor.close()
+            self._staging = False
 
     def __init__(self):
         self._qc = 0
         self._time = time.time()
+        self._staging = False
+        self._attributes = []
+
+    def _staging_cursor(self, *tables):
+        """
+        Returns a cursor, the staging tables being created for the import
+        if needed, and tables emptied.
+        """
+        cursor = connection.cursor()
+        if not self._staging:
+            for table, columns in STAGING_TABLES.iteritems():
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS %s (%s)" % (
+                        table, columns))
+            self._staging = True
+        if tables:
+            cursor.execute("TRUNCATE %s" % ", ".join(tables))
+        return cursor
 
     def _log(self, method_name):
         if PROFILE_LOGGING:
@@ -159,6 +267,7 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         self._import_software_context(c_test_run, s_test_run)
         self._log('software')
         self._import_attributes(c_test_run, s_test_run)
+        self._save_attributes()
         self._log('attributes')
         # collect all the changes that happen before the previous save
         s_test_run.save()
@@ -267,110 +376,126 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         cursor.close()
 
     def _import_test_results_pgsql(self, c_test_results, s_test_run):
-        cursor = connection.cursor()
-
-        # XXX I don't understand how the _order column that Django adds is
-        # supposed to work.  I just let it default to 0 here.
+        """
+        Import TestCase, TestResult and TestResult.attributes with one COPY
+        per staging table and one statement per destination table.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from dashboard_app.models import TestResult
 
-        data = []
+        cursor = self._staging_cursor(
+            'dashboard_import_testresult', 'dashboard_import_attribute')
 
-        for i in range(0, len(c_test_results), 1000):
+        results = []
+        attributes = []
+        for index, c_test_result in enumerate(c_test_results, 1):
 
-            cursor.execute(
-                """
-                CREATE TEMPORARY TABLE newtestresults (
-                    relative_index INTEGER,
-                    timestamp      TIMESTAMP WITH TIME ZONE,
-                    microseconds   BIGINT,
-                    filename       TEXT,
-                    result         SMALLINT,
-                    measurement    CHARACTER VARYING(512),
-                    message        TEXT,
-                    test_case_id   TEXT,
-                    lineno         INTEGER
-                    )
-                """)
-
-            data = []
-
-            for index, c_test_result in enumerate(c_test_results[i:i + 1000], i + 1):
-
-                timestamp = c_test_result.get("timestamp")
-                if timestamp:
-                    timestamp = datetime_extension.from_json(timestamp)
-                duration = c_test_result.get("duration", None)
-                if duration:
-                    duration = timedelta_extension.from_json(duration)
-                    duration = (duration.microseconds +
-                                (duration.seconds * 10 ** 6) +
-                                (duration.days * 24 * 60 * 60 * 10 ** 6))
-                result = self._translate_result_string(c_test_result["result"])
-
-                data.extend([
-                    index,
-                    timestamp,
-                    duration,
-                    c_test_result.get("log_filename", None),
-                    result,
-                    c_test_result.get("measurement", None),
-                    c_test_result.get("message", None),
-                    c_test_result.get("test_case_id", None),
-                    c_test_result.get("log_lineno", None),
-                ])
-
-            sequel = ',\n'.join(
-                ["(" + "%s" % (', '.join(['%s'] * 9),) + ")"] * (len(data) // 9))
+            timestamp = c_test_result.get("timestamp")
+            if timestamp:
+                timestamp = datetime_extension.from_json(timestamp)
+            duration = c_test_result.get("duration", None)
+            if duration:
+                duration = timedelta_extension.from_json(duration)
+                duration = (duration.microseconds +
+                            (duration.seconds * 10 ** 6) +
+                            (duration.days * 24 * 60 * 60 * 10 ** 6))
+            result = self._translate_result_string(c_test_result["result"])
 
-            cursor.execute(
-                """
-                INSERT INTO newtestresults (
-                    relative_index,
-                    timestamp,
-                    microseconds,
-                    filename,
-                    result,
-                    measurement,
-                    message,
-                    test_case_id,
-                    lineno
-                ) VALUES """ + sequel, data)
+            results.append((
+                index,
+                timestamp,
+                duration,
+                c_test_result.get("log_filename", None),
+                result,
+                c_test_result.get("measurement", None),
+                c_test_result.get("message", None),
+                c_test_result.get("test_case_id", None),
+                c_test_result.get("units", ""),
+                c_test_result.get("log_lineno", None),
+            ))
+            for name, value in c_test_result.get(
+                    "attributes", {}).iteritems():
+                attributes.append((index, str(name), str(value)))
+
+        copy_rows(cursor, 'dashboard_import_testresult', (
+            'relative_index',
+            'timestamp',
+            'microseconds',
+            'filename',
+            'result',
+            'measurement',
+            'message',
+            'test_case_id',
+            'units',
+            'lineno',
+        ), results)
+
+        # the units of a new test case are those of its first result
+        cursor.execute(
+            """
+            INSERT INTO
+                dashboard_app_testcase (test_id, units, name, test_case_id)
+            SELECT %s, units, E'', test_case_id FROM (
+                SELECT DISTINCT ON (test_case_id) test_case_id, units
+                    FROM dashboard_import_testresult
+                    WHERE test_case_id IS NOT NULL
+                    ORDER BY test_case_id, relative_index) AS newtestcases
+            WHERE NOT EXISTS (SELECT 1 FROM dashboard_app_testcase
+                              WHERE test_id = %s
+                                AND newtestcases.test_case_id
+                                  = dashboard_app_testcase.test_case_id)
+            """, [s_test_run.test.id, s_test_run.test.id])
 
-            cursor.execute(
-                """
-                INSERT INTO dashboard_app_testresult (
-                    test_run_id,
-                    _order,
-                    relative_index,
-                    timestamp,
-                    microseconds,
-                    filename,
-                    result,
-                    measurement,
-                    message,
-                    test_case_id,
-                    lineno
-                ) SELECT
-                    %s,
-                    %s,
-                    relative_index,
-                    timestamp,
-                    microseconds,
-                    filename,
-                    result,
-                    measurement,
-                    message,
-                    dashboard_app_testcase.id,
-                    lineno
-                    FROM newtestresults, dashboard_app_testcase
-                      WHERE dashboard_app_testcase.test_id = %s
-                        AND dashboard_app_testcase.test_case_id
-                          = newtestresults.test_case_id
-                """ % (s_test_run.id, 0, s_test_run.test.id))
+        # XXX I don't understand how the _order column that Django adds is
+        # supposed to work.  I just let it default to 0 here.
+        cursor.execute(
+            """
+            INSERT INTO dashboard_app_testresult (
+                test_run_id,
+                _order,
+                relative_index,
+                timestamp,
+                microseconds,
+                filename,
+                result,
+                measurement,
+                message,
+                test_case_id,
+                lineno
+            ) SELECT
+                %s,
+                0,
+                relative_index,
+                timestamp,
+                microseconds,
+                filename,
+                result,
+                measurement,
+                message,
+                dashboard_app_testcase.id,
+                lineno
+                FROM dashboard_import_testresult, dashboard_app_testcase
+                  WHERE dashboard_app_testcase.test_id = %s
+                    AND dashboard_app_testcase.test_case_id
+                      = dashboard_import_testresult.test_case_id
+            """, [s_test_run.id, s_test_run.test.id])
 
+        if attributes:
+            copy_rows(cursor, 'dashboard_import_attribute',
+                      ('relative_index', 'name', 'value'), attributes)
             cursor.execute(
                 """
-                DROP TABLE newtestresults
-                """)
+                INSERT INTO dashboard_app_namedattribute (
+                    content_type_id, object_id, name, value)
+                SELECT %s, dashboard_app_testresult.id,
+                       dashboard_import_attribute.name,
+                       dashboard_import_attribute.value
+                    FROM dashboard_import_attribute, dashboard_app_testresult
+                      WHERE dashboard_app_testresult.test_run_id = %s
+                        AND dashboard_app_testresult.relative_index
+                          = dashboard_import_attribute.relative_index
+                """, [ContentType.objects.get_for_model(TestResult).id,
+                      s_test_run.id])
 
         cursor.close()
 
@@ -385,24 +510,21 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         if not c_test_results:
             return
 
-        if is_postgres():
-            self._import_test_cases_pgsql(c_test_results, s_test_run.test)
-        else:
-            self._import_test_cases_sqlite(c_test_results, s_test_run.test)
-
         if is_postgres():
             self._import_test_results_pgsql(c_test_results, s_test_run)
-        else:
-            self._import_test_results_sqlite(c_test_results, s_test_run)
-
-        for index, c_test_result in enumerate(c_test_run.get("test_results", []), 1):
-            if c_test_result.get("attributes", {}):
-                try:
-                    s_test_result = TestResult.objects.get(
-                        relative_index=index, test_run=s_test_run)
-                    self._import_attributes(c_test_result, s_test_result)
-                except TestResult.DoesNotExist:
-                    continue
+            self._log('test result attributes')
+            return
+
+        self._import_test_cases_sqlite(c_test_results, s_test_run.test)
+        self._import_test_results_sqlite(c_test_results, s_test_run)
+
+        result_ids = dict(TestResult.objects.filter(
+            test_run=s_test_run).values_list('relative_index', 'id'))
+        for index, c_test_result in enumerate(c_test_results, 1):
+            # results without a test case were not imported
+            if index in result_ids:
+                self._add_attributes(
+                    c_test_result, TestResult, result_ids[index])
         self._log('test result attributes')
 
     def _import_test_cases_sqlite(self, c_test_results, s_test):
@@ -430,52 +552,6 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
             """, data)
         cursor.close()
 
-    def _import_test_cases_pgsql(self, c_test_results, s_test):
-        """
-        Import TestCase
-        """
-        id_units = {}
-        for c_test_result in c_test_results:
-            if "test_case_id" not in c_test_result:
-                continue
-            id_units.setdefault(
-                c_test_result["test_case_id"], c_test_result.get("units", ""))
-        id_units = id_units.items()
-
-        cursor = connection.cursor()
-        for i in range(0, len(id_units), 1000):
-
-            cursor.execute(
-                """
-                CREATE TEMPORARY TABLE
-                    newtestcases (test_case_id text, units text)
-                """)
-            data = []
-            for (id, units) in id_units[i:i + 1000]:
-                data.append(id)
-                data.append(units)
-            sequel = ',\n'.join(["(%s, %s)"] * (len(data) // 2))
-            cursor.execute(
-                """
-                INSERT INTO newtestcases (test_case_id, units) VALUES
-                """ + sequel, data)
-
-            cursor.execute(
-                """
-                INSERT INTO
-                    dashboard_app_testcase (test_id, units, name, test_case_id)
-                SELECT %s, units, E'', test_case_id FROM newtestcases
-                WHERE NOT EXISTS (SELECT 1 FROM dashboard_app_testcase
-                                  WHERE test_id = %s
-                                    AND newtestcases.test_case_id
-                                      = dashboard_app_testcase.test_case_id)
-                """ % (s_test.id, s_test.id))
-            cursor.execute(
-                """
-                drop table newtestcases
-                """)
-        cursor.close()
-
     def _import_packages_scratch_sqlite(self, cursor, packages):
         data = []
         for c_package in packages:
@@ -486,15 +562,29 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
                    (name, version) VALUES (%s, %s)
             """, data)
 
-    def _import_packages_scratch_pgsql(self, cursor, packages):
-        for i in range(0, len(packages), 1000):
-            data = []
-            for c_package in packages[i:i + 1000]:
-                data.append(c_package['name'])
-                data.append(c_package['version'])
-            sequel = ', '.join(["(%s, %s)"] * (len(data) // 2))
-            cursor.execute(
-                "INSERT INTO dashboard_app_softwarepackagescratch (name, version) VALUES " + sequel, data)
+    def _import_packages_pgsql(self, packages, s_test_run):
+        cursor = self._staging_cursor('dashboard_import_package')
+        copy_rows(cursor, 'dashboard_import_package', ('name', 'version'),
+                  [(c_package['name'], c_package['version'])
+                   for c_package in packages])
+        cursor.execute(
+            """
+            INSERT INTO dashboard_app_softwarepackage (name, version)
+            SELECT name, version FROM dashboard_import_package
+            EXCEPT SELECT name, version FROM dashboard_app_softwarepackage
+            """)
+        cursor.execute(
+            """
+            INSERT INTO
+                dashboard_app_testrun_packages (testrun_id, softwarepackage_id)
+            SELECT DISTINCT %s, dashboard_app_softwarepackage.id
+                FROM dashboard_app_softwarepackage, dashboard_import_package
+                  WHERE dashboard_app_softwarepackage.name
+                      = dashboard_import_package.name
+                    AND dashboard_app_softwarepackage.version
+                      = dashboard_import_package.version
+            """, [s_test_run.id])
+        cursor.close()
 
     def _import_packages(self, c_test_run, s_test_run):
         """
@@ -503,12 +593,12 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         packages = self._get_sw_context(c_test_run).get("packages", [])
         if not packages:
             return
+        if is_postgres():
+            self._import_packages_pgsql(packages, s_test_run)
+            return
         cursor = connection.cursor()
 
-        if is_postgres():
-            self._import_packages_scratch_pgsql(cursor, packages)
-        else:
-            self._import_packages_scratch_sqlite(cursor, packages)
+        self._import_packages_scratch_sqlite(cursor, packages)
 
         cursor.execute(
             """
@@ -540,23 +630,69 @@ class BundleFormatImporter_1_0(IBundleFormatImporter):
         """
         from dashboard_app.models import HardwareDevice
 
-        for c_device in self._get_hw_context(c_test_run).get("devices", []):
-            s_device = HardwareDevice.objects.create(
+        c_devices = self._get_hw_context(c_test_run).get("devices", [])
+        if not c_devices:
+            return
+        s_devices = [
+            HardwareDevice(
                 device_type=c_device["device_type"],
-                description=c_device["description"]
-            )
-            s_device.save()
+                description=c_device["description"])
+            for c_device in c_devices]
+        if is_postgres():
+            # bulk_create does not set the primary keys, which the
+            # attributes and test run link need
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO dashboard_app_hardwaredevice
+                    (device_type, description)
+                VALUES """ + ', '.join(['(%s, %s)'] * len(s_devices)) + """
+                RETURNING id
+                """, [value for s_device in s_devices
+                      for value in (s_device.device_type,
+                                    s_device.description)])
+            for s_device, (pk,) in zip(s_devices, cursor.fetchall()):
+                s_device.pk = pk
+            cursor.close()
+        else:
+            for s_device in s_devices:
+                s_device.save()
+        for c_device, s_device in zip(c_devices, s_devices):
             self._import_attributes(c_device, s_device)
-            s_test_run.devices.add(s_device)
+        s_test_run.devices.add(*s_devices)
 
     def _import_attributes(self, c_object, s_object):
         """
         Import attributes from any client-side object into any
         server-side object
         """
-        for name, value in c_object.get("attributes", {}).iteritems():
-            s_object.attributes.create(
-                name=str(name), value=str(value))
+        self._add_attributes(c_object, s_object.__class__, s_object.pk)
+
+    def _add_attributes(self, c_object, model, object_id):
+        """
+        Queue the attributes of a client-side object for the object_id
+        instance of model, until _save_attributes.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from dashboard_app.models import NamedAttribute
+
+        c_attributes = c_object.get("attributes", {})
+        if not c_attributes:
+            return
+        content_type = ContentType.objects.get_for_model(model)
+        for name, value in c_attributes.iteritems():
+            self._attributes.append(NamedAttribute(
+                content_type=content_type, object_id=object_id,
+                name=str(name), value=str(value)))
+
+    def _save_attributes(self):
+        """
+        Insert the queued attributes together.
+        """
+        from dashboard_app.models import NamedAttribute
+
+        NamedAttribute.objects.bulk_create(self._attributes)
+        self._attributes = []
 
     def _import_attachments(self, c_test_run, s_test_run):
         """
@@ -741,14 +877,16 @@ class BundleFormatImporter_1_5(BundleFormatImporter_1_4):
     def _import_test_results(self, c_test_run, s_test_run):
         from dashboard_app.models import TestResult
         super(BundleFormatImporter_1_5, self)._import_test_results(c_test_run, s_test_run)
-        for index, c_test_result in enumerate(c_test_run.get("test_results", []), 1):
-            if c_test_result.get("attachments", {}):
-                try:
-                    s_test_result = TestResult.objects.get(
-                        relative_index=index, test_run=s_test_run)
-                    self._import_test_result_attachments(c_test_result, s_test_result)
-                except TestResult.DoesNotExist:
-                    continue
+        c_test_results = dict(
+            (index, c_test_result) for index, c_test_result in enumerate(
+                c_test_run.get("test_results", []), 1)
+            if c_test_result.get("attachments", {}))
+        if not c_test_results:
+            return
+        for s_test_result in TestResult.objects.filter(
+                test_run=s_test_run, relative_index__in=list(c_test_results)):
+            self._import_test_result_attachments(
+                c_test_results[s_test_result.relative_index], s_test_result)
 
 
 class BundleFormatImporter_1_6(BundleFormatImporter_1_5):
@@ -859,6 +997,141 @@ class BundleFormatImporter_1_7_1(BundleFormatImporter_1_7):
             s_test_run.sources.add(s_source)
 
 
+class StreamingDocument(object):
+    """
+    Incremental reader of a bundle document, yielding its test runs one at
+    a time, so that only one test run has to be in memory at once.
+
+    The members of the document other than test_runs are kept in header.
+    The format member has to come before test_runs, as it does in the
+    documents written by DocumentIO, for the test runs to be checked as
+    they are read.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.header = {}
+        self._decoder = json.JSONDecoder(
+            parse_float=decimal.Decimal, object_pairs_hook=OrderedDict)
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._in_test_runs = False
+
+    def _read(self, size):
+        """
+        Read size more bytes, dropping the ones already parsed.
+        """
+        data = self.stream.read(size)
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        self._eof = not data
+        return not self._eof
+
+    def _peek(self):
+        """
+        Return the next character which is not whitespace.
+        """
+        while True:
+            self._pos = self.WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read(self.CHUNK_SIZE):
+                raise ValueError("Unexpected end of document")
+
+    def _expect(self, characters):
+        character = self._peek()
+        if character not in characters:
+            raise ValueError("Expecting one of %r at %r" % (
+                characters, self._buffer[self._pos:self._pos + 20]))
+        self._pos += 1
+        return character
+
+    def _end(self):
+        """
+        Check that only whitespace follows the document.
+        """
+        while True:
+            self._pos = self.WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                raise ValueError("Extra data after the document at %r" % (
+                    self._buffer[self._pos:self._pos + 20]))
+            if not self._read(self.CHUNK_SIZE):
+                return
+
+    def _value(self):
+        """
+        Decode the next JSON value, reading more of the document until it
+        is complete. Each read is as large as the buffer, so a large value
+        is only decoded a few times.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(
+                    self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+            else:
+                # a number can go on in the next read
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            self._read(max(self.CHUNK_SIZE, len(self._buffer) - self._pos))
+
+    def _members(self):
+        """
+        Read the members of the document into header, up to test_runs.
+        """
+        while True:
+            key = self._value()
+            if not isinstance(key, basestring):
+                raise ValueError("Expecting a member name, got %r" % key)
+            self._expect(':')
+            if key == 'test_runs':
+                self._expect('[')
+                self._in_test_runs = True
+                return
+            self.header[key] = self._value()
+            if self._expect(',}') == '}':
+                self._end()
+                return
+
+    def read_header(self):
+        """
+        Read the document up to its test runs.
+        :return: the format of the document, None when it comes after the
+        test runs
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            self._end()
+        else:
+            self._members()
+        return self.header.get('format')
+
+    def test_runs(self):
+        """
+        Yield the test runs of the document, reading the members after
+        them into header.
+        """
+        while self._in_test_runs:
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                yield self._value()
+                if self._expect(',]') == ',':
+                    continue
+            self._in_test_runs = False
+            if self._expect(',}') == ',':
+                self._members()
+
+
 class BundleDeserializer(object):
     """
     Helper class for de-serializing JSON bundle content into database models
@@ -901,8 +1174,10 @@ class BundleDeserializer(object):
                 When the text does not represent a correct JSON document.
         """
         assert s_bundle.is_deserialized is False
-        s_bundle.content.open('rb')
         logger = logging.getLogger(__name__)
+        if not prefer_evolution and self._deserialize_stream(s_bundle):
+            return
+        s_bundle.content.open('rb')
         try:
             logger.debug("Loading document")
             fmt, doc = DocumentIO.load(s_bundle.content)
@@ -924,3 +1199,35 @@ class BundleDeserializer(object):
         except Exception as exc:
             logger.debug("Exception while importing document: %r", exc)
             raise
+
+    def _deserialize_stream(self, s_bundle):
+        """
+        Deserialize the bundle one test run at a time, see
+        StreamingDocument.
+        :return: False if the document has to be loaded at once instead
+        """
+        logger = logging.getLogger(__name__)
+        s_bundle.content.open('rb')
+        try:
+            document = StreamingDocument(s_bundle.content)
+            fmt = document.read_header()
+            if fmt is None and document._in_test_runs:
+                logger.debug("Format after the test runs, loading document")
+                return False
+            DocumentIO.check(dict(document.header, test_runs=[]))
+            importer = self.IMPORTERS.get(fmt)
+            if importer is None:
+                raise DocumentFormatError(fmt)
+
+            def test_runs():
+                for c_test_run in document.test_runs():
+                    DocumentIO.check(
+                        dict(document.header, test_runs=[c_test_run]))
+                    yield c_test_run
+
+            logger.debug("Importing document")
+            importer().import_test_runs(s_bundle, test_runs())
+            logger.debug("Document import complete")
+        finally:
+            s_bundle.content.close()
+        return True
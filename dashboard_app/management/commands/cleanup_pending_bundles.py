@@ -0,0 +1,33 @@
+import datetime
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from dashboard_app.models import PendingBundle
+
+
+class Command(BaseCommand):
+
+    help = "Remove the pending MultiNode bundles which were never aggregated."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--older-than',
+                    type='int',
+                    dest='older_than',
+                    default=7,
+                    help="Only remove the groups whose last pending bundle "
+                         "is at least this many days old (default: 7)"),
+    )
+
+    def handle(self, *args, **options):
+        since = datetime.datetime.utcnow() - datetime.timedelta(
+            days=options['older_than'])
+        # a group still getting bundles is kept whole
+        active = PendingBundle.objects.filter(
+            uploaded_on__gte=since).values('group_name')
+        stale = PendingBundle.objects.exclude(group_name__in=active)
+        groups = stale.values_list('group_name', flat=True).distinct().count()
+        # file_cleanup removes their content
+        stale.delete()
+        self.stdout.write("Removed the pending bundles of %d group(s)." % groups)
@@ -0,0 +1,91 @@
+import logging
+import multiprocessing
+import socket
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from dashboard_app.models import Bundle, QueuedBundle
+
+
+def work(name, poll_interval, once):
+    """
+    Deserializes the queued bundles, waiting poll_interval seconds for new
+    ones whenever the queue is empty, or returning then if once is set.
+    """
+    logger = logging.getLogger('dashboard_app.deserialize_bundles')
+    while True:
+        close_old_connections()
+        try:
+            bundle_id = QueuedBundle.claim(name)
+            if bundle_id is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            try:
+                bundle = Bundle.objects.get(pk=bundle_id)
+            except Bundle.DoesNotExist:
+                # deleted since, along with its queue entry
+                continue
+            logger.info("%s: deserializing bundle %s", name,
+                        bundle.content_sha1)
+            # errors are recorded as a BundleDeserializationError
+            bundle.deserialize()
+            QueuedBundle.objects.filter(pk=bundle_id).delete()
+        except Exception:
+            logger.exception("%s: deserialization failed", name)
+            connection.close()
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+
+    help = "Deserialize the bundles queued when ASYNC_DESERIALIZATION is set."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=multiprocessing.cpu_count(),
+                    help="Number of worker processes "
+                         "(default: number of CPUs)"),
+        make_option('--poll-interval',
+                    type='float',
+                    dest='poll_interval',
+                    default=5,
+                    help="Seconds to wait for new bundles when the queue "
+                         "is empty (default: 5)"),
+        make_option('--once',
+                    action='store_true',
+                    dest='once',
+                    default=False,
+                    help="Exit once the queue is empty"),
+    )
+
+    def handle(self, *args, **options):
+        prefix = '%s-%d' % (socket.gethostname(),
+                            multiprocessing.current_process().pid)
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            work(prefix, options['poll_interval'], options['once'])
+            return
+        # the workers must not share the connection of this process
+        connection.close()
+        processes = [
+            multiprocessing.Process(
+                target=work,
+                args=('%s-%d' % (prefix, index), options['poll_interval'],
+                      options['once']))
+            for index in range(workers)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
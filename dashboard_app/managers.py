@@ -16,7 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with Launch Control.  If not, see <http://www.gnu.org/licenses/>.
 #
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.db import models, transaction, IntegrityError
 
 import logging
@@ -25,7 +25,12 @@ import logging
 class BundleManager(models.Manager):
 
     def create_with_content(self, bundle_stream, uploaded_by, content_filename, content):
+        """
+        Create a bundle with content, either a string or a File.
+        """
         logger = logging.getLogger(__name__)
+        if not isinstance(content, File):
+            content = ContentFile(content)
         logger.debug("Creating bundle object")
         bundle = self.create(
             bundle_stream=bundle_stream,
@@ -37,8 +42,7 @@ class BundleManager(models.Manager):
         bundle.save()
         try:
             logger.debug("saving bundle content (file) and bundle object")
-            bundle.content.save("bundle-{0}".format(bundle.pk),
-                                ContentFile(content))
+            bundle.content.save("bundle-{0}".format(bundle.pk), content)
         except IntegrityError as exc:
             logger.debug("integrity error: %r", exc)
             # https://docs.djangoproject.com/en/dev/topics/db/transactions/#handling-exceptions-within-postgresql-transactions
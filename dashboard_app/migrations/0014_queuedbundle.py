@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0013_auto_20150127_1341'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedBundle',
+            fields=[
+                ('bundle', models.OneToOneField(related_name='queued', primary_key=True, serialize=False, to='dashboard_app.Bundle')),
+                ('queued_on', models.DateTimeField(default=datetime.datetime.utcnow, db_index=True)),
+                ('claimed_by', models.CharField(max_length=128, blank=True)),
+                ('claimed_on', models.DateTimeField(null=True, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
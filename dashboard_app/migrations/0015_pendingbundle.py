@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import datetime
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard_app', '0014_queuedbundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingBundle',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('group_name', models.CharField(max_length=64, db_index=True)),
+                ('content', models.FileField(upload_to=b'pending-bundles')),
+                ('uploaded_on', models.DateTimeField(default=datetime.datetime.utcnow)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -593,6 +593,16 @@ class Bundle(models.Model):
         helper = BundleDeserializer()
         helper.deserialize(self, prefer_evolution)
 
+    def enqueue(self):
+        """
+        Queue this bundle for a deserialization worker, see QueuedBundle.
+        """
+        QueuedBundle.objects.get_or_create(bundle=self)
+
+    @property
+    def is_queued(self):
+        return QueuedBundle.objects.filter(bundle=self).exists()
+
     def get_summary_results(self):
         if self.is_deserialized:
             stats = TestResult.objects.filter(
@@ -702,6 +712,99 @@ class BundleDeserializationError(models.Model):
         return self.error_message
 
 
+class QueuedBundle(models.Model):
+    """
+    Model for bundles waiting to be deserialized.
+
+    With ASYNC_DESERIALIZATION set, put() stores the bundle and queues it
+    instead of deserializing it in the request. Each worker of the
+    deserialize_bundles command claims a queued bundle, deserializes it
+    and removes it from the queue. A claim older than a worker can take
+    to deserialize a bundle is considered to be from a dead worker, and
+    the bundle is claimed again.
+    """
+
+    bundle = models.OneToOneField(
+        Bundle,
+        primary_key=True,
+        related_name='queued'
+    )
+
+    queued_on = models.DateTimeField(
+        default=datetime.datetime.utcnow,
+        db_index=True
+    )
+
+    claimed_by = models.CharField(
+        max_length=128,
+        blank=True
+    )
+
+    claimed_on = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    # Longest time a worker is expected to take to deserialize a bundle.
+    STALE_AFTER = datetime.timedelta(hours=1)
+
+    def __unicode__(self):
+        return _(u"Queued bundle {0}").format(self.bundle_id)
+
+    @classmethod
+    def claim(cls, worker, bundle_id=None, stale_after=STALE_AFTER):
+        """
+        Claims the oldest queued bundle not claimed by a live worker, or
+        bundle_id.
+        :param worker: name of the worker, for the admin
+        :param stale_after: timedelta after which a claim is stale
+        :return: the id of the claimed bundle, or None
+        """
+        now = datetime.datetime.utcnow()
+        candidates = cls.objects.filter(
+            models.Q(claimed_on__isnull=True) |
+            models.Q(claimed_on__lt=now - stale_after))
+        if bundle_id is not None:
+            candidates = candidates.filter(bundle=bundle_id)
+        for pk, claimed_on in candidates.order_by(
+                'queued_on').values_list('pk', 'claimed_on')[:10]:
+            # only one worker updates the claim it read
+            if claimed_on is None:
+                claim = cls.objects.filter(pk=pk, claimed_on__isnull=True)
+            else:
+                claim = cls.objects.filter(pk=pk, claimed_on=claimed_on)
+            if claim.update(claimed_by=worker, claimed_on=now):
+                return pk
+        return None
+
+
+class PendingBundle(models.Model):
+    """
+    Model for the bundles of the nodes of a MultiNode group, stored by
+    put_pending until put_group aggregates them into the group bundle.
+
+    The content is kept with the other bundles, so that any web server can
+    aggregate the group. Groups which never get aggregated are removed by
+    the cleanup_pending_bundles command.
+    """
+
+    group_name = models.CharField(
+        max_length=64,
+        db_index=True
+    )
+
+    content = models.FileField(
+        upload_to='pending-bundles'
+    )
+
+    uploaded_on = models.DateTimeField(
+        default=datetime.datetime.utcnow
+    )
+
+    def __unicode__(self):
+        return _(u"Pending bundle of group {0}").format(self.group_name)
+
+
 class Test(models.Model):
     """
     Model for representing tests.
@@ -1520,9 +1623,9 @@ class BugLink(models.Model):
 def file_cleanup(sender, instance, **kwargs):
     """
     Signal receiver used for remove FieldFile attachments when removing
-    objects (Bundle and Attachment) from the database.
+    objects (Bundle, Attachment and PendingBundle) from the database.
     """
-    if instance is None or sender not in (Bundle, Attachment):
+    if instance is None or sender not in (Bundle, Attachment, PendingBundle):
         return
     meta = sender._meta
 
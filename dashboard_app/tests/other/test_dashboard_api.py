@@ -19,14 +19,21 @@
 """
 Unit tests for Dashboard API (XML-RPC interface)
 """
+import json
 import xmlrpclib
 
+from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django_testscenarios.ubertest import TransactionTestCase
 
-from dashboard_app.models import Bundle, BundleStream
+from dashboard_app.models import (
+    Bundle,
+    BundleStream,
+    PendingBundle,
+    QueuedBundle,
+)
 from dashboard_app.tests import fixtures
-from dashboard_app.tests.utils import DashboardXMLRPCViewsTestCase
+from dashboard_app.tests.utils import DashboardXMLRPCViewsTestCase, TestClient
 from dashboard_app.xmlrpc import errors
 
 
@@ -282,6 +289,49 @@ class DashboardAPIPutTests(DashboardXMLRPCViewsTestCase):
         self.assertEqual(self.bundle.content_filename, self.content_filename)
         self.assertEqual(self.bundle.bundle_stream.pathname, self.pathname)
 
+    def test_put_queued(self):
+        with self.settings(ASYNC_DESERIALIZATION=True):
+            content_sha1 = self.xml_rpc_call(
+                "put", self.content, self.content_filename, self.pathname)
+        self.bundle = Bundle.objects.get(content_sha1=content_sha1)
+        self.assertFalse(self.bundle.is_deserialized)
+        self.assertTrue(self.bundle.is_queued)
+        self.assertTrue(self.xml_rpc_call("bundles", self.pathname)[0]['is_queued'])
+        # a single worker gets the bundle
+        self.assertEqual(QueuedBundle.claim('worker-1'), self.bundle.pk)
+        self.assertIsNone(QueuedBundle.claim('worker-2'))
+
+
+class DashboardAPIPutGroupTests(DashboardXMLRPCViewsTestCase):
+
+    def setUp(self):
+        super(DashboardAPIPutGroupTests, self).setUp()
+        fixtures.create_bundle_stream('/anonymous/')
+        self.client = TestClient()
+        self.client.login_user(User.objects.create(
+            username='multinode', is_superuser=True))
+
+    def bundle(self, test_id):
+        return json.dumps({
+            "format": "Dashboard Bundle Format 1.0",
+            "test_runs": [{"test_id": test_id}]})
+
+    def test_put_group(self):
+        for role in ["client", "server"]:
+            self.xml_rpc_call(
+                "put_pending", self.bundle(role), '/anonymous/', 'group')
+        self.assertEqual(PendingBundle.objects.count(), 2)
+        self.xml_rpc_call(
+            "put_group", self.bundle("zero"), 'group.json', '/anonymous/',
+            'group')
+        bundle = Bundle.objects.get()
+        self.addCleanup(bundle.delete_files)
+        content = json.loads(bundle.content.read())
+        self.assertEqual(content["format"], "Dashboard Bundle Format 1.0")
+        self.assertEqual([run["test_id"] for run in content["test_runs"]],
+                         ["client", "server", "zero"])
+        self.assertFalse(PendingBundle.objects.exists())
+
 
 class DashboardAPIPutFailureTests(DashboardXMLRPCViewsTestCase):
 
@@ -21,6 +21,7 @@ Unit tests of the Dashboard application
 """
 import datetime
 import decimal
+from StringIO import StringIO
 
 from django_testscenarios.ubertest import (
     TestCase,
@@ -53,6 +54,8 @@ from dashboard_app.helpers import (
     IBundleFormatImporter,
     BundleFormatImporter_1_0,
     BundleFormatImporter_1_1,
+    StreamingDocument,
+    copy_text,
 )
 
 
@@ -64,6 +67,57 @@ class IBundleFormatImporterTests(TestCase):
                           importer.import_document, None, None)
 
 
+class CopyTextTests(TestCase):
+
+    def test_null(self):
+        self.assertEqual('\\N', copy_text(None))
+
+    def test_escapes(self):
+        self.assertEqual('a\\tb\\nc\\\\N',
+                         copy_text(u'a\tb\nc\\N'))
+
+    def test_values(self):
+        self.assertEqual('\xc3\xa9', copy_text(u'\xe9'))
+        self.assertEqual('42', copy_text(42))
+        self.assertEqual('0.1', copy_text(0.1))
+
+
+class StreamingDocumentTests(TestCase):
+
+    def test_test_runs(self):
+        document = StreamingDocument(StringIO(
+            '{"format": "f", "test_runs": [{"a": 1.5}, {}], "z": 12345}'))
+        document.CHUNK_SIZE = 4
+        self.assertEqual(document.read_header(), "f")
+        self.assertEqual(list(document.test_runs()),
+                         [{"a": decimal.Decimal("1.5")}, {}])
+        self.assertEqual(document.header, {"format": "f", "z": 12345})
+
+    def test_format_after_test_runs(self):
+        document = StreamingDocument(StringIO(
+            '{"test_runs": [], "format": "f"}'))
+        self.assertIsNone(document.read_header())
+
+    def test_truncated(self):
+        document = StreamingDocument(StringIO(
+            '{"format": "f", "test_runs": [{}, {"a"'))
+        document.read_header()
+        self.assertRaises(ValueError, list, document.test_runs())
+
+    def test_extra_data(self):
+        document = StreamingDocument(StringIO('{"format": "f"} garbage'))
+        self.assertRaises(ValueError, document.read_header)
+        document = StreamingDocument(StringIO(
+            '{"format": "f", "test_runs": [{}], "z": 1}\n}'))
+        document.CHUNK_SIZE = 4
+        document.read_header()
+        self.assertRaises(ValueError, list, document.test_runs())
+        document = StreamingDocument(StringIO(
+            '{"format": "f", "test_runs": []} \n'))
+        document.read_header()
+        self.assertEqual([], list(document.test_runs()))
+
+
 class TestHelper(object):
 
     def getUniqueString(self, prefix=None, max_length=None):
@@ -517,6 +571,10 @@ class BundleDeserializerSuccessTests(TestCaseWithScenarios):
                 ("attr1", "value1"),
                 ("attr2", "value2")]))
 
+    def test_NamedAttribute__saved_once(self):
+        # 2 result, 4 device and 2 test run attributes
+        self.assertEqual(NamedAttribute.objects.count(), 8)
+
 
 class Bundle13DeserializerSuccessTests(TestCase):
 
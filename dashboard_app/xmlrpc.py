@@ -28,8 +28,11 @@ import urllib2
 import xmlrpclib
 import hashlib
 import json
-import os
+import simplejson
+import tempfile
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.core.files.base import ContentFile, File
 from django.core.urlresolvers import reverse
 from django.db import IntegrityError, DatabaseError
 from linaro_django_xmlrpc.models import (
@@ -39,9 +42,12 @@ from linaro_django_xmlrpc.models import (
 )
 
 from dashboard_app.filters import evaluate_filter
+from dashboard_app.helpers import StreamingDocument
 from dashboard_app.models import (
     Bundle,
     BundleStream,
+    PendingBundle,
+    QueuedBundle,
     Test,
     TestRunFilter,
     TestDefinition,
@@ -135,8 +141,12 @@ class DashboardAPI(ExposedAPI):
             self.logger.exception("big oops")
             raise
         else:
-            self.logger.debug("Deserializing bundle")
-            bundle.deserialize()
+            if settings.ASYNC_DESERIALIZATION:
+                self.logger.debug("Queueing bundle for deserialization")
+                bundle.enqueue()
+            else:
+                self.logger.debug("Deserializing bundle")
+                bundle.deserialize()
             return bundle
 
     @xml_rpc_signature('str', 'str', 'str', 'str')
@@ -329,9 +339,9 @@ class DashboardAPI(ExposedAPI):
             sha1 = hashlib.sha1()
             sha1.update(content)
             hexdigest = sha1.hexdigest()
-            groupfile = "/tmp/%s" % group_name
-            with open(groupfile, "a+") as grp_file:
-                grp_file.write("%s\n" % content)
+            pending = PendingBundle(group_name=group_name)
+            pending.content.save("pending-{0}".format(hexdigest),
+                                 ContentFile(content))
             return hexdigest
         except Exception as e:
             self.logger.debug("Dashboard pending submission caused an exception: %s", e)
@@ -401,43 +411,44 @@ class DashboardAPI(ExposedAPI):
             - team streams are accessible to team members
 
         """
-        grp_file = "/tmp/%s" % group_name
-        bundle_set = {}
-        bundle_set[group_name] = []
-        if os.path.isfile(grp_file):
-            with open(grp_file, "r") as grp_data:
-                grp_list = grp_data.readlines()
-            for testrun in grp_list:
-                bundle_set[group_name].append(json.loads(testrun))
-        # Note: now that we have the data from the group, the group data file could be re-used
-        # as an error log which is simpler than debugging through XMLRPC.
-        else:
+        pending_bundles = PendingBundle.objects.filter(
+            group_name=group_name).order_by('id')
+        if not pending_bundles.exists():
             raise ValueError("Aggregation failure for %s - check coordinator rpc_delay?" % group_name)
-        group_tests = []
         try:
-            json_data = json.loads(content)
+            json_data = json.loads(content, parse_float=decimal.Decimal)
         except ValueError:
             self.logger.debug("Invalid JSON content within the sub_id zero bundle")
-            json_data = None
-        try:
-            bundle_set[group_name].append(json_data)
-        except Exception as e:
-            self.logger.debug("appending JSON caused exception %s", e)
-        try:
-            for bundle_list in bundle_set[group_name]:
-                for test_run in bundle_list['test_runs']:
-                    group_tests.append(test_run)
-        except Exception as e:
-            self.logger.debug("aggregating bundles caused exception %s", e)
-        group_content = json.dumps({"test_runs": group_tests, "format": json_data['format']})
-        bundle = self._put(group_content, content_filename, pathname)
+            raise
+        # The group bundle is written one test run at a time, reading the
+        # pending bundles back the same way, so that no more than one test
+        # run is in memory at once.
+        with tempfile.NamedTemporaryFile() as group_file:
+            group_file.write('{"format": %s, "test_runs": [' % simplejson.dumps(
+                json_data['format']))
+            separator = ''
+            for pending in pending_bundles:
+                pending.content.open('rb')
+                try:
+                    document = StreamingDocument(pending.content)
+                    document.read_header()
+                    for test_run in document.test_runs():
+                        group_file.write(separator + simplejson.dumps(test_run))
+                        separator = ', '
+                finally:
+                    pending.content.close()
+            for test_run in json_data.get('test_runs', []):
+                group_file.write(separator + simplejson.dumps(test_run))
+                separator = ', '
+            group_file.write(']}')
+            group_file.seek(0)
+            bundle = self._put(File(group_file), content_filename, pathname)
         self.logger.debug("Returning permalink to aggregated bundle for %s", group_name)
         permalink = self._context.request.build_absolute_uri(
             reverse('dashboard_app.views.redirect_to_bundle',
                     kwargs={'content_sha1': bundle.content_sha1}))
-        # only delete the group file when things go well.
-        if os.path.isfile(grp_file):
-            os.remove(grp_file)
+        # only delete the pending bundles when things go well.
+        pending_bundles.delete()
         return permalink
 
     def get(self, content_sha1):
@@ -586,6 +597,8 @@ class DashboardAPI(ExposedAPI):
             The size of the content
         `is_deserialized`: bool
             True if the bundle was de-serialized successfully, false otherwise
+        `is_queued`: bool
+            True if the bundle is waiting for a deserialization worker
         `associated_job`: int
             The job with which this bundle is associated
 
@@ -611,6 +624,9 @@ class DashboardAPI(ExposedAPI):
                 bundle_stream = BundleStream.objects.get(pathname=pathname)
             else:
                 bundle_stream = BundleStream.objects.accessible_by_principal(self.user).get(pathname=pathname)
+            queued = set(QueuedBundle.objects.filter(
+                bundle__bundle_stream=bundle_stream).values_list(
+                'bundle', flat=True))
             for bundle in bundle_stream.bundles.all().order_by("uploaded_on"):
                 job_id = 'NA'
                 try:
@@ -625,6 +641,7 @@ class DashboardAPI(ExposedAPI):
                     'content_sha1': bundle.content_sha1,
                     'content_size': bundle.content.size,
                     'is_deserialized': bundle.is_deserialized,
+                    'is_queued': bundle.pk in queued,
                     'associated_job': job_id
                 })
         except BundleStream.DoesNotExist:
@@ -670,7 +687,9 @@ class DashboardAPI(ExposedAPI):
 
         Description
         -----------
-        Deserialize bundle on the server
+        Deserialize bundle on the server. A bundle queued for the
+        deserialization workers is deserialized right away, unless a
+        worker is already deserializing it.
 
         Arguments
         ---------
@@ -688,7 +707,7 @@ class DashboardAPI(ExposedAPI):
         404
             Bundle not found
         409
-            Bundle import failed
+            Bundle import failed, or a worker is deserializing the bundle
         """
         try:
             bundle = Bundle.objects.get(content_sha1=content_sha1)
@@ -696,7 +715,14 @@ class DashboardAPI(ExposedAPI):
             raise xmlrpclib.Fault(errors.NOT_FOUND, "Bundle not found")
         if bundle.is_deserialized:
             return False
-        bundle.deserialize()
+        if bundle.is_queued:
+            if QueuedBundle.claim('deserialize', bundle.pk) is None:
+                raise xmlrpclib.Fault(
+                    errors.CONFLICT, "Bundle is being deserialized")
+            bundle.deserialize()
+            QueuedBundle.objects.filter(bundle=bundle).delete()
+        else:
+            bundle.deserialize()
         if bundle.is_deserialized is False:
             raise xmlrpclib.Fault(
                 errors.CONFLICT,
@@ -1,3 +1,11 @@
+import logging
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
 
 def debug_obj(obj):
     retval = ''
@@ -5,3 +13,46 @@ def debug_obj(obj):
         if hasattr(obj, attr):
             retval += ("%s = %s\n" % (attr, getattr(obj, attr)))
     return retval
+
+
+# Literals replaced to recognize the same query run for different rows.
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def query_shape(sql):
+    return SQL_LITERALS.sub('?', sql)
+
+
+class QueryCountMiddleware(object):
+    """
+    Counts the SQL queries of each request when DEBUG is set.
+
+    The count is returned in the X-Query-Count header and queries repeated
+    at least REPEAT_THRESHOLD times with different parameters are logged,
+    which is what a table querying once per row looks like.
+    """
+
+    REPEAT_THRESHOLD = 10
+
+    def __init__(self):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed()
+        self.logger = logging.getLogger('lava.utils.debug')
+
+    def process_request(self, request):
+        request._query_count_start = len(connection.queries)
+
+    def process_response(self, request, response):
+        start = getattr(request, '_query_count_start', None)
+        if start is None:
+            return response
+        queries = connection.queries[start:]
+        response['X-Query-Count'] = str(len(queries))
+        shapes = defaultdict(int)
+        for query in queries:
+            shapes[query_shape(query['sql'])] += 1
+        for shape, count in shapes.iteritems():
+            if count >= self.REPEAT_THRESHOLD:
+                self.logger.warning("query run %d times for %s: %s",
+                                    count, request.path, shape)
+        return response
@@ -0,0 +1,187 @@
+"""
+Keyset pagination of large tables.
+
+Instead of counting the rows and skipping the previous pages with OFFSET,
+which gets slower the deeper the page, a page is found by seeking past the
+last row of the previous page (or before the first row of the next page)
+on the keys the rows are ordered by, e.g. ('-submit_time', '-id'), which
+an index can answer directly. The keys have to be non null fields and end
+with a unique one.
+
+The page argument is either a page number, the first page being the only
+one reached that way, or a token naming the page number and the row the
+page comes after (or before), e.g. '3:a1234' or '2:b1200', as returned by
+KeysetPage.next_page_number and previous_page_number. The total is
+estimated by the database for large querysets.
+"""
+
+import json
+import math
+
+from django.db import connections
+from django.db.models import Q
+
+# Querysets estimated to have fewer rows than this are counted exactly.
+EXACT_COUNT_BELOW = 10000
+
+
+def estimated_count(queryset, exact_below=EXACT_COUNT_BELOW):
+    """
+    Returns (count, estimated), the count being the estimate of the query
+    planner on PostgreSQL unless that is below exact_below.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+    sql, params = queryset.order_by().query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    rows = int(plan[0]['Plan']['Plan Rows'])
+    if rows < exact_below:
+        return queryset.count(), False
+    return rows, True
+
+
+def parse_page(page):
+    """
+    Returns (number, direction, pk) from a page argument, direction being
+    'a' for the rows after pk, 'b' for the rows before it or None.
+    """
+    number, _, cursor = unicode(page).partition(':')
+    try:
+        number = max(int(number), 1)
+    except ValueError:
+        return 1, None, None
+    if cursor[:1] in ('a', 'b') and cursor[1:].isdigit():
+        return number, cursor[:1], int(cursor[1:])
+    return number, None, None
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, number, paginator, first, last,
+                 has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._first = first
+        self._last = last
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page %s of about %s>' % (self.number, self.paginator.num_pages)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def next_page_number(self):
+        return '%d:a%d' % (self.number + 1, self._last)
+
+    def previous_page_number(self):
+        if self.number == 2:
+            return 1
+        return '%d:b%d' % (self.number - 1, self._first)
+
+
+class KeysetPaginator(object):
+    """
+    Paginator of a queryset ordered by keys, see the module documentation.
+    :param wrap: called with the records of a page to build its object_list
+    """
+
+    def __init__(self, queryset, keys, per_page, wrap=list):
+        self.keys = [(key.lstrip('-'), key.startswith('-')) for key in keys]
+        self.queryset = queryset.order_by(*keys)
+        self.per_page = int(per_page)
+        self.wrap = wrap
+        self._count = None
+        self._pages_seen = 1
+        self._estimated = False
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count, self._estimated = estimated_count(self.queryset)
+        return self._count
+
+    @property
+    def estimated(self):
+        """
+        Whether count is an estimate.
+        """
+        self.count
+        return self._estimated
+
+    @property
+    def num_pages(self):
+        # the estimate can be below the pages actually reached
+        return max(int(math.ceil(self.count / float(self.per_page))),
+                   self._pages_seen)
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def _seek(self, values, forward):
+        """
+        Selects the rows after values in the order of the keys, or before
+        them when not forward.
+        """
+        q = Q()
+        for index, (key, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending == forward else 'gt'
+            match = Q(**{'%s__%s' % (key, lookup): values[index]})
+            for previous, value in zip(self.keys[:index], values):
+                match &= Q(**{previous[0]: value})
+            q |= match
+        return q
+
+    def page(self, page):
+        number, direction, pk = parse_page(page)
+        values = None
+        if direction:
+            fields = [key for key, descending in self.keys]
+            values = self.queryset.model._default_manager.filter(
+                pk=pk).values_list(*fields)[:1]
+        if not values:
+            rows = list(self.queryset[:self.per_page + 1])
+            number = 1
+            has_previous = False
+            has_next = len(rows) > self.per_page
+        elif direction == 'a':
+            rows = list(self.queryset.filter(
+                self._seek(values[0], True))[:self.per_page + 1])
+            number = max(number, 2)
+            has_previous = True
+            has_next = len(rows) > self.per_page
+        else:
+            reverse = ['%s%s' % ('' if descending else '-', key)
+                       for key, descending in self.keys]
+            rows = list(self.queryset.filter(
+                self._seek(values[0], False)).order_by(
+                *reverse)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            number = max(number, 2) if has_previous else 1
+            has_next = True
+        rows = rows[:self.per_page]
+        first = rows[0].pk if rows else None
+        last = rows[-1].pk if rows else None
+        has_next = has_next and last is not None
+        self._pages_seen = number + 1 if has_next else number
+        return KeysetPage(self.wrap(rows), number, self, first, last,
+                          has_previous, has_next)
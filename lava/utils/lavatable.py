@@ -1,7 +1,128 @@
+from datetime import datetime, timedelta
+
 import django_tables2 as tables
+from django_tables2.rows import BoundRows
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
 from django.utils.safestring import mark_safe
 from django.utils.html import escape
 from django.db.models import Q
+from django.db.models.query import QuerySet
+from lava.utils.keyset import KeysetPaginator, parse_page
+
+
+class TableQuery(object):
+    """
+    The searches, queries and times of the Meta of a table class, compiled
+    once per table class and model by TableQuery.compile:
+      searches - {field: lookup}, fields searched with the lookup, e.g.
+                 'contains', or 'startswith' and 'exact' which can use the
+                 index of the field
+      queries - {view method: request argument}, view methods returning a
+                Q() for a text search of a relational field
+      times - {field: unit}, fields searched by a duration in the unit,
+              as a timedelta argument
+    Terms which are not valid values of a searched field, e.g. text in an
+    'exact' search of an integer field, are skipped instead of failing.
+    """
+
+    _compiled = {}
+
+    def __init__(self, table_class, model):
+        meta = table_class.Meta
+        self.searches = []
+        self.queries = sorted(getattr(meta, 'queries', {}).items())
+        self.times = sorted(getattr(meta, 'times', {}).items())
+        self.search_labels = [argument for func, argument in self.queries]
+        self.time_labels = []
+        for key, lookup in sorted(getattr(meta, 'searches', {}).items()):
+            field = model._meta.get_field_by_name(key)[0]
+            # contains matches the text of any field
+            convert = None if lookup in ('contains', 'icontains') else field.to_python
+            self.searches.append(('%s__%s' % (key, lookup), key, convert))
+            self.search_labels.append(self._label(table_class, key, field))
+        for key, unit in self.times:
+            field = model._meta.get_field_by_name(key)[0]
+            self.time_labels.append("%s (%s)" % (self._label(table_class, key, field), unit))
+        self.search_labels.sort(key=lambda label: label.lower())
+        self.time_labels.sort()
+
+    @staticmethod
+    def _label(table_class, key, field):
+        column = table_class.base_columns.get(key)
+        if column and getattr(column, 'verbose_name', None) is not None:
+            return unicode(column.verbose_name)
+        if getattr(field, 'verbose_name', None) is not None:
+            return unicode(field.verbose_name)
+        return key
+
+    @classmethod
+    def compile(cls, table_class, model):
+        key = (table_class, model)
+        if key not in cls._compiled:
+            cls._compiled[key] = cls(table_class, model)
+        return cls._compiled[key]
+
+    def discrete(self, prefix=None):
+        """
+        Request arguments of the searches matching all their terms.
+        """
+        prefix = prefix or ''
+        discrete = ["%s%s" % (prefix, key) for lookup, key, convert in self.searches]
+        discrete.extend("%s%s" % (prefix, argument) for func, argument in self.queries)
+        return sorted(discrete, key=lambda argument: argument.lower())
+
+    def search(self, lookup, convert, term):
+        if convert:
+            try:
+                term = convert(term)
+            except ValidationError:
+                return None
+        return Q(**{lookup: term})
+
+    def build(self, view, params, prefix=None):
+        """
+        Builds the filter of the view for the request arguments.
+        :return: (Q, terms), terms being the labels of the searches used
+        """
+        prefix = prefix or ''
+        terms = {}
+        q = Q()
+        # discrete searches, all of which have to match
+        for lookup, key, convert in self.searches:
+            term = params.get("%s%s" % (prefix, key))
+            if term:
+                match = self.search(lookup, convert, term)
+                if match is not None:
+                    q &= match
+        for func, argument in self.queries:
+            term = params.get("%s%s" % (prefix, argument))
+            if term:
+                q &= getattr(view, func)(term)
+        # general search, any of the fields matching
+        term = params.get("%ssearch" % prefix)
+        if term:
+            terms['search'] = escape(term)
+            any_match = Q()
+            for lookup, key, convert in self.searches:
+                match = self.search(lookup, convert, term)
+                if match is not None:
+                    any_match |= match
+            for func, argument in self.queries:
+                any_match |= getattr(view, func)(term)
+            q &= any_match
+        # durations, e.g. submit_time=3 for jobs submitted within 3 hours
+        for key, unit in self.times:
+            value = params.get(key)
+            if not value:
+                continue
+            terms[key] = "%s within %s %s" % (key, escape(value), unit)
+            try:
+                delta = timedelta(**{unit: float(value)})
+            except (ValueError, OverflowError):
+                continue  # just skip this term - results in a query matching All.
+            q &= Q(**{'%s__gte' % key: datetime.now() - delta})
+        return q, terms
 
 
 class LavaView(tables.SingleTableView):
@@ -15,33 +136,6 @@ class LavaView(tables.SingleTableView):
         self.times = []
         self.discrete = []
 
-    def _time_filter(self, query):
-        """
-        bespoke time-based field handling
-        """
-        q = query
-        time_queries = {}
-        if hasattr(self.table_class.Meta, 'times'):
-            # filter the possible list by the request
-            for key, value in self.table_class.Meta.times.iteritems():
-                # check if the request includes the current time filter & get the value
-                match = self.request.GET.get(key)
-                if match and match != "":
-                    self.terms[key] = "%s within %s %s" % (key, match, value)  # the label for this query in the search list
-                    time_queries[key] = value
-            for key, value in time_queries.iteritems():
-                match = escape(self.request.GET.get(key))
-                # escape converts None into u'None'
-                if not match or match == "" or match == "None":
-                    continue
-                args = 'q = q.__and__(Q({0}__gte=datetime.now()-timedelta({1}={2})))'.format(key, value, match)
-                try:
-                    exec args  # sets the value of q
-                except SyntaxError:
-                    # should log the exception somewhere...
-                    continue  # just skip this term - results in a query matching All.
-        return q
-
     def get_table_data(self, prefix=None):
         """
         Takes the table data and adds filters based on the content of the request
@@ -51,102 +145,20 @@ class LavaView(tables.SingleTableView):
           queries - relational fields for which the table has explicit handlers for simple text searching
         - special knowledge of particular field types is handled as:
           times - fields which can be searched by a duration
+        See TableQuery.
         :return: filtered data
         """
-        distinct = {}
         data = self.get_queryset()
         if not self.table_class or not hasattr(self.table_class, 'Meta'):
             return data
-        if prefix:
-            table_search = "%ssearch" % prefix
-        else:
-            table_search = "search"
-        if hasattr(self.table_class.Meta, 'queries'):
-            self.search.extend(self.table_class.Meta.queries.values())
-            self.search.sort()
-        if hasattr(self.table_class.Meta, 'times'):
-            for key, value in self.table_class.Meta.times.iteritems():
-                field = self.model._meta.get_field_by_name(key)[0]
-                column = self.table_class.base_columns.get(key)
-                if column and hasattr(column, 'verbose_name') and column.verbose_name is not None:
-                    self.times.append("%s (%s)" % (unicode(column.verbose_name), value))
-                elif field and hasattr(field, 'verbose_name') and field.verbose_name is not None:
-                    self.times.append("%s (%s)" % (unicode(field.verbose_name), value))
-                else:
-                    self.times.append("%s (%s)" % (key, value))
-            self.times.sort()
-        if hasattr(self.table_class.Meta, 'searches'):
-            for key in self.table_class.Meta.searches.keys():
-                field = self.model._meta.get_field_by_name(key)[0]
-                column = self.table_class.base_columns.get(key)
-                if column and hasattr(column, 'verbose_name') and column.verbose_name is not None:
-                    self.search.append(column.verbose_name)
-                elif field and hasattr(field, 'verbose_name'):
-                    self.search.append(field.verbose_name)
-                else:
-                    self.search.append(field)
-                discrete_key = "%s%s" % (prefix, key) if prefix else key
-                self.discrete.append(discrete_key)
-                if self.request and self.request.GET.get(discrete_key):
-                    distinct[discrete_key] = escape(self.request.GET.get(discrete_key))
-            self.search = sorted(self.search, key=lambda s: s.lower())
-        if hasattr(self.table_class.Meta, 'queries'):
-            for func, argument in self.table_class.Meta.queries.iteritems():
-                request_argument = "%s%s" % (prefix, argument) if prefix else argument
-                self.discrete.append(request_argument)  # for __and__ queries
-                if self.request and self.request.GET.get(request_argument):
-                    distinct[func] = escape(self.request.GET.get(request_argument))
-            self.discrete = sorted(self.discrete, key=lambda s: s.lower())
+        query = TableQuery.compile(self.table_class, self.model)
+        self.search = list(query.search_labels)
+        self.times = list(query.time_labels)
+        self.discrete = query.discrete(prefix)
         if not self.request:
             return data
-        q = Q()
-        self.terms = {}
-        # discrete searches
-        for key, val in distinct.iteritems():
-            if key in self.table_class.Meta.searches:
-                args = 'q = q.__and__(Q({0}__contains="{1}"))'.format(key, val)
-                try:
-                    exec args  # sets the value of q
-                except SyntaxError:
-                    # should log exception somewhere...
-                    continue  # just skip this term - results in a query matching All.
-            if hasattr(self.table_class.Meta, 'queries') and key in self.table_class.Meta.queries.keys():
-                # note that this calls the function 'key' with the argument from the search
-                args = 'q = q.__and__(self.{0}("{1}"))'.format(key, val)
-                try:
-                    exec args
-                except SyntaxError:
-                    # should log exception somewhere...
-                    continue
-        # general OR searches
-        if self.request.GET.get(table_search):
-            self.terms["search"] = escape(self.request.GET.get(table_search))
-        if hasattr(self.table_class.Meta, 'searches') and 'search' in self.terms:
-            for key, val in self.table_class.Meta.searches.iteritems():
-                # this is a little bit of magic - creates an OR clause in the query based
-                # on the iterable search hash passed in via the table_class
-                # e.g. self.searches = {'id', 'contains'}
-                # so every simple search column in the table is queried at the same time with OR
-                args = 'q = q.__or__(Q({0}__{1}=self.terms["search"]))'.format(key, val)
-                try:
-                    exec args  # sets the value of q
-                except SyntaxError:
-                    # should log exception somewhere...
-                    continue  # just skip this term - results in a query matching All.
-            # call explicit handlers as simple text searches of relational fields.
-            if hasattr(self.table_class.Meta, 'queries'):
-                for key in self.table_class.Meta.queries:
-                    # note that this calls the function 'key' with the argument from the search
-                    args = 'q = q.__or__(self.{0}("{1}"))'.format(key, self.terms["search"])
-                    try:
-                        exec args
-                    except SyntaxError:
-                        # should log exception somewhere...
-                        continue
-        # now add "class specials" - from an iterable hash
-        # datetime uses (start_time__lte=datetime.now()-timedelta(days=3)
-        data = data.filter(self._time_filter(q))
-        return data
+        q, self.terms = query.build(self, self.request.GET, prefix)
+        return data.filter(q)
 
 
 class LavaTable(tables.Table):
@@ -158,8 +170,29 @@ class LavaTable(tables.Table):
     def __init__(self, *args, **kwargs):
         super(LavaTable, self).__init__(*args, **kwargs)
         self.length = 10
+        # raw page of the request, set by LavaRequestConfig
+        self.page_token = None
         self._empty_text = mark_safe('<div style="text-align: center">No data available in table</div>')
 
+    def paginate(self, klass=Paginator, per_page=None, page=1, *args, **kwargs):
+        """
+        Tables declaring keyset in their Meta, e.g. ('-submit_time', '-id'),
+        are paged with a KeysetPaginator while they are not sorted by one
+        of their columns, see lava.utils.keyset.
+        """
+        if self.page_token:
+            page = self.page_token
+        keyset = getattr(getattr(self, 'Meta', None), 'keyset', None)
+        queryset = getattr(self.data, 'queryset', None)
+        if keyset and isinstance(queryset, QuerySet) and not self.order_by:
+            self.paginator = KeysetPaginator(
+                queryset, keyset, per_page or self._meta.per_page,
+                wrap=lambda records: BoundRows(records, self))
+            self.page = self.paginator.page(page)
+            return
+        number, direction, pk = parse_page(page)
+        super(LavaTable, self).paginate(klass, per_page, number, *args, **kwargs)
+
     def prepare_search_data(self, data):
         if not hasattr(data, "search"):
             return {}
@@ -203,3 +236,15 @@ class LavaTable(tables.Table):
         attrs = {"class": "table table-striped", "width": "100%"}
         template = "tables.html"
         per_page_field = "length"
+
+
+class LavaRequestConfig(tables.RequestConfig):
+    """
+    RequestConfig handing the page of the request to LavaTable.paginate
+    as it is: the stock one only keeps page numbers, which would drop the
+    keyset tokens such as 3:a1234 and reload the first page.
+    """
+    def configure(self, table):
+        if isinstance(table, LavaTable):
+            table.page_token = self.request.GET.get(table.prefixed_page_field)
+        super(LavaRequestConfig, self).configure(table)
@@ -1,6 +1,7 @@
 import xmlrpclib
 from django.core.exceptions import PermissionDenied
 from simplejson import JSONDecodeError
+from django.db import transaction
 from django.db.models import Count
 from linaro_django_xmlrpc.models import ExposedAPI
 from lava_scheduler_app.models import (
@@ -8,6 +9,7 @@ from lava_scheduler_app.models import (
     DeviceType,
     JSONDataError,
     DevicesUnavailableException,
+    SubmissionLookups,
     TestJob,
     Worker,
 )
@@ -19,28 +21,7 @@ from lava_scheduler_app.views import (
 
 class SchedulerAPI(ExposedAPI):
 
-    def submit_job(self, job_data):
-        """
-        Name
-        ----
-        `submit_job` (`job_data`)
-
-        Description
-        -----------
-        Submit the given job data which is in LAVA job JSON format as a new
-        job to LAVA scheduler.
-
-        Arguments
-        ---------
-        `job_data`: string
-            Job JSON string.
-
-        Return value
-        ------------
-        This function returns an XML-RPC integer which is the newly created
-        job's id,  provided the user is authenticated with an username and
-        token.
-        """
+    def _check_submit_permission(self):
         if not self.user:
             raise xmlrpclib.Fault(
                 401, "Authentication with user and token required for this "
@@ -50,8 +31,11 @@ class SchedulerAPI(ExposedAPI):
                 403, "Permission denied.  User %r does not have the "
                 "'lava_scheduler_app.add_testjob' permission.  Contact "
                 "the administrators." % self.user.username)
+
+    def _submit(self, job_data, lookups=None):
         try:
-            job = TestJob.from_json_and_user(job_data, self.user)
+            job = TestJob.from_json_and_user(job_data, self.user,
+                                             lookups=lookups)
         except JSONDecodeError as e:
             raise xmlrpclib.Fault(400, "Decoding JSON failed: %s." % e)
         except (JSONDataError, ValueError) as e:
@@ -67,6 +51,77 @@ class SchedulerAPI(ExposedAPI):
         else:
             return job.id
 
+    def submit_job(self, job_data):
+        """
+        Name
+        ----
+        `submit_job` (`job_data`)
+
+        Description
+        -----------
+        Submit the given job data which is in LAVA job JSON format as a new
+        job to LAVA scheduler.
+
+        Arguments
+        ---------
+        `job_data`: string
+            Job JSON string.
+
+        Return value
+        ------------
+        This function returns an XML-RPC integer which is the newly created
+        job's id,  provided the user is authenticated with an username and
+        token.
+        """
+        self._check_submit_permission()
+        return self._submit(job_data)
+
+    def submit_jobs(self, job_data_list):
+        """
+        Name
+        ----
+        `submit_jobs` (`job_data_list`)
+
+        Description
+        -----------
+        Submit several jobs at once, each given in LAVA job JSON format.
+        All the jobs are submitted in a single transaction, a job which
+        fails to be submitted does not prevent the others from being
+        submitted.
+
+        Arguments
+        ---------
+        `job_data_list`: array of strings
+            Job JSON strings.
+
+        Return value
+        ------------
+        This function returns an XML-RPC array with one struct per job, in
+        the same order as `job_data_list`, provided the user is
+        authenticated with an username and token. The struct either has an
+        `id` key holding the newly created job's id (or the list of sub ids
+        of a multinode or vm group job) or `error` and `code` keys
+        describing why the job was not submitted.
+        """
+        self._check_submit_permission()
+        if not isinstance(job_data_list, list):
+            raise xmlrpclib.Fault(400, "An array of job definitions is required.")
+        results = []
+        lookups = SubmissionLookups()
+        with transaction.atomic():
+            for job_data in job_data_list:
+                if not isinstance(job_data, basestring):
+                    results.append({'error': "Job definition must be a string.",
+                                    'code': 400})
+                    continue
+                try:
+                    with transaction.atomic():
+                        results.append({'id': self._submit(job_data, lookups)})
+                except xmlrpclib.Fault as e:
+                    results.append({'error': e.faultString,
+                                    'code': e.faultCode})
+        return results
+
     def resubmit_job(self, job_id):
         """
         Name
@@ -136,11 +191,11 @@ class SchedulerAPI(ExposedAPI):
             job.cancel(self.user)
         return True
 
-    def job_output(self, job_id):
+    def job_output(self, job_id, offset=0, length=-1):
         """
         Name
         ----
-        `job_output` (`job_id`)
+        `job_output` (`job_id`, `offset`=0, `length`=-1)
 
         Description
         -----------
@@ -150,6 +205,12 @@ class SchedulerAPI(ExposedAPI):
         ---------
         `job_id`: string
             Job id for which the output is required.
+        `offset`: integer
+            Optional byte offset in the output at which to start.
+        `length`: integer
+            Optional maximum number of bytes to return, all the output after
+            `offset` is returned by default. Large outputs should be fetched
+            in several calls.
 
         Return value
         ------------
@@ -166,7 +227,16 @@ class SchedulerAPI(ExposedAPI):
         except TestJob.DoesNotExist:
             raise xmlrpclib.Fault(404, "Specified job not found.")
 
-        return xmlrpclib.Binary(job.output_file().read())
+        if offset < 0:
+            raise xmlrpclib.Fault(400, "Offset must not be negative.")
+        log_file = job.output_file()
+        if not log_file:
+            raise xmlrpclib.Fault(404, "Job output not found.")
+        try:
+            log_file.seek(offset)
+            return xmlrpclib.Binary(log_file.read(length))
+        finally:
+            log_file.close()
 
     def all_devices(self):
         """
@@ -230,9 +300,7 @@ class SchedulerAPI(ExposedAPI):
         all_device_types = []
         keys = ['busy', 'name', 'idle', 'offline']
 
-        for dev_type in DeviceType.objects.all():
-            if len(dev_type.devices_visible_to(self.user)) == 0:
-                continue
+        for dev_type in DeviceType.objects.visible_to(self.user):
             device_type_names.append(dev_type.name)
 
         device_types = DeviceType.objects.filter(display=True).annotate(
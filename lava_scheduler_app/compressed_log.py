@@ -0,0 +1,168 @@
+"""
+Compressed storage of finished job logs.
+
+A log is compressed by blocks of BLOCK_SIZE bytes, each block being a
+separate gzip member, so the result is still a plain gzip file which zcat
+and friends can read. The uncompressed and compressed offset of each block
+are kept in a JSON index next to it (output.txt.gz.idx), which lets
+CompressedLogFile seek anywhere in the log by decompressing a single block.
+"""
+
+import bisect
+import gzip
+import os
+import zlib
+
+import simplejson
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def compress_log(path, block_size=BLOCK_SIZE):
+    """
+    Compresses the log file at path into path.gz and its index, then
+    removes path. Returns the path of the compressed log.
+    """
+    gz_path = path + '.gz'
+    tmp_path = '%s.%d.tmp' % (gz_path, os.getpid())
+    tmp_index_path = '%s.%d.tmp' % (index_path(gz_path), os.getpid())
+    blocks = []
+    size = 0
+    try:
+        with open(path, 'rb') as log_file:
+            with open(tmp_path, 'wb') as gz_file:
+                while True:
+                    data = log_file.read(block_size)
+                    if not data:
+                        break
+                    blocks.append([size, gz_file.tell()])
+                    member = gzip.GzipFile(filename='', mode='wb',
+                                           fileobj=gz_file, mtime=0)
+                    member.write(data)
+                    member.close()
+                    size += len(data)
+        with open(tmp_index_path, 'w') as f:
+            simplejson.dump({'size': size, 'blocks': blocks}, f)
+        # The plain log is still used while it exists, so the index and
+        # the compressed log are in place before it goes away.
+        os.rename(tmp_index_path, index_path(gz_path))
+        os.rename(tmp_path, gz_path)
+    except:
+        for tmp in tmp_path, tmp_index_path:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        raise
+    os.unlink(path)
+    return gz_path
+
+
+class CompressedLogFile(object):
+    """
+    Read only file object over a log compressed by compress_log.
+
+    Supports read, readline, iteration, seek and tell with uncompressed
+    offsets. Only the block holding the current position is kept in memory.
+    """
+
+    def __init__(self, path):
+        self.name = path
+        with open(index_path(path)) as f:
+            index = simplejson.load(f)
+        self.size = index['size']
+        self._blocks = index['blocks']
+        self._starts = [block[0] for block in self._blocks]
+        self._file = open(path, 'rb')
+        self._pos = 0
+        self._block_number = None
+        self._block = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        self._block = ''
+        self._block_number = None
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError("Invalid argument")
+        self._pos = offset
+
+    def _load(self, number):
+        if number == self._block_number:
+            return self._block
+        start = self._blocks[number][1]
+        self._file.seek(start)
+        if number + 1 < len(self._blocks):
+            data = self._file.read(self._blocks[number + 1][1] - start)
+        else:
+            data = self._file.read()
+        self._block = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        self._block_number = number
+        return self._block
+
+    def _current(self):
+        """
+        Returns the block holding the current position and the position
+        in that block, or (None, 0) at the end of the log.
+        """
+        if self._pos >= self.size:
+            return None, 0
+        number = bisect.bisect_right(self._starts, self._pos) - 1
+        return self._load(number), self._pos - self._starts[number]
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.size - self._pos, 0)
+        chunks = []
+        while size > 0:
+            block, start = self._current()
+            if block is None:
+                break
+            data = block[start:start + size]
+            chunks.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return ''.join(chunks)
+
+    def readline(self, size=-1):
+        chunks = []
+        while size != 0:
+            block, start = self._current()
+            if block is None:
+                break
+            end = block.find('\n', start) + 1 or len(block)
+            if size > 0:
+                end = min(end, start + size)
+                size -= end - start
+            chunks.append(block[start:end])
+            self._pos += end - start
+            if block[end - 1] == '\n':
+                break
+        return ''.join(chunks)
@@ -0,0 +1,141 @@
+# Copyright (C) 2015 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Counters shown on the scheduler front page.
+
+The number of devices per status and device type, of queued jobs per
+device type and of recent health checks are computed together with three
+grouped queries and kept in the cache. The scheduler daemon refreshes them
+on its scheduling passes and the web pages only read them, computing them
+themselves when the cache has expired or is not shared with the daemon.
+"""
+
+import datetime
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from lava_scheduler_app.models import Device, TestJob
+
+COUNTERS_KEY = 'lava_scheduler_app.counters'
+# Longest time the counters are used for, in seconds.
+COUNTERS_TIMEOUT = 60
+# Hours of health checks counted on the front page.
+HEALTH_CHECK_HOURS = 24
+
+DEVICE_TYPE_COUNTERS = ('idle', 'offline', 'busy', 'restricted', 'queue')
+
+
+def compute_counters():
+    """
+    Returns the front page counters:
+        device_types: dict of the idle, offline, busy and restricted
+                      devices and queued jobs of each device type
+        num_online: number of devices not retired and not offline
+        num_not_retired: number of devices not retired
+        hc_total: number of devices with a finished health check over
+                  the last HEALTH_CHECK_HOURS hours
+        hc_completed: number of those devices with a complete health check
+    """
+    device_types = {}
+
+    def counters_of(name):
+        if name not in device_types:
+            device_types[name] = dict.fromkeys(DEVICE_TYPE_COUNTERS, 0)
+        return device_types[name]
+
+    offline = total = 0
+    devices = Device.objects.values(
+        'device_type', 'status', 'is_public').annotate(
+        count=Count('hostname')).order_by()
+    for row in devices:
+        counters = counters_of(row['device_type'])
+        status, count = row['status'], row['count']
+        if status == Device.IDLE:
+            counters['idle'] += count
+        elif status in [Device.OFFLINE, Device.OFFLINING]:
+            counters['offline'] += count
+            offline += count
+        elif status in [Device.RUNNING, Device.RESERVED]:
+            counters['busy'] += count
+        if status != Device.RETIRED:
+            total += count
+            if not row['is_public']:
+                counters['restricted'] += count
+
+    queued = TestJob.objects.filter(status=TestJob.SUBMITTED).values(
+        'requested_device_type', 'requested_device__device_type').annotate(
+        count=Count('id')).order_by()
+    for row in queued:
+        name = row['requested_device_type'] or \
+            row['requested_device__device_type']
+        if name:
+            counters_of(name)['queue'] += row['count']
+
+    since = datetime.datetime.now() - datetime.timedelta(
+        hours=HEALTH_CHECK_HOURS)
+    checked = set()
+    completed = set()
+    health_checks = TestJob.objects.filter(
+        health_check=True, start_time__gte=since).exclude(
+        status__in=[TestJob.SUBMITTED, TestJob.RUNNING]).values_list(
+        'actual_device', 'status').distinct()
+    for device, status in health_checks:
+        checked.add(device)
+        if status == TestJob.COMPLETE:
+            completed.add(device)
+
+    return {
+        'device_types': device_types,
+        'num_online': total - offline,
+        'num_not_retired': total,
+        'hc_total': len(checked),
+        'hc_completed': len(completed),
+    }
+
+
+def refresh_counters():
+    counters = compute_counters()
+    cache.set(COUNTERS_KEY, counters, COUNTERS_TIMEOUT)
+    return counters
+
+
+def get_counters():
+    """
+    Returns the counters from the cache, see compute_counters.
+    """
+    counters = cache.get(COUNTERS_KEY)
+    if counters is None:
+        counters = refresh_counters()
+    return counters
+
+
+def device_type_rows(device_types, counters=None):
+    """
+    Returns the device types as a list, with the counters of each set as
+    attributes, for DeviceTypeTable.
+    """
+    if counters is None:
+        counters = get_counters()
+    rows = []
+    empty = dict.fromkeys(DEVICE_TYPE_COUNTERS, 0)
+    for device_type in device_types:
+        for name, value in counters['device_types'].get(
+                device_type.name, empty).iteritems():
+            setattr(device_type, name, value)
+        rows.append(device_type)
+    return rows
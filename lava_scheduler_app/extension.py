@@ -79,6 +79,20 @@ class SchedulerExtension(LavaServerExtension):
             # Jobs always specify a timeout, but I suspect its often too low.
             # So we don't let it go below this value, which defaults to a day.
             'MIN_JOB_TIMEOUT': 24 * 60 * 60,
+            # Seconds between two scheduling passes.
+            'POLL_INTERVAL': 20,
+            # Wake up the scheduler on job submission, cancellation and
+            # device state changes. When enabled, the scheduler only polls
+            # every FALLBACK_POLL_INTERVAL seconds.
+            'USE_NOTIFY': True,
+            'FALLBACK_POLL_INTERVAL': 120,
+            # Run the dispatchers from the scheduler daemon instead of one
+            # schedulermonitor process per job, at most MAX_RUNNING_JOBS at
+            # a time (0 for no limit), checking their cancellation every
+            # CANCEL_CHECK_INTERVAL seconds.
+            'SUPERVISE_JOBS': False,
+            'MAX_RUNNING_JOBS': 0,
+            'CANCEL_CHECK_INTERVAL': 10,
         }
         settings_module['SCHEDULER_DAEMON_OPTIONS'].update(from_module)
         prepend_label_apps = settings_module.get('STATICFILES_PREPEND_LABEL_APPS', [])
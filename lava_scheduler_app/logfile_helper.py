@@ -1,101 +1,369 @@
+import logging
+import os
 import re
+import simplejson
+import StringIO
 
 
-def getDispatcherErrors(logfile):
-    errors = []
-    error_types = ["Infrastructure Error:",
-                   "Bootloader Error:",
-                   "Kernel Error:",
-                   "Userspace Error:",
-                   "Test Shell Error:",
-                   "Master Image Error:",
-                   "OperationFailed:"]
-
-    for line in logfile:
-        for error in error_types:
-            index = line.find(error)
-            print line
-            print error
-            if index != -1:
-                print line[index:]
-                errors.append(line[index:])
-
-    return list(set(errors))
+LOG_PREFIX = '<LAVA_DISPATCHER>'
 
+ACTION_BEGIN = '[ACTION-B]'
 
-def getDispatcherLogMessages(logfile):
-    logs = []
-    log_prefix = '<LAVA_DISPATCHER>'
-    action_begin = '[ACTION-B]'
-    level_pattern = re.compile('....-..-.. (..:..:.. .. ([A-Z]+): .*)')
-    for line in logfile:
-        # log_prefix not always start at beginning of the line
-        pos = line.find(log_prefix)
-        if pos == -1:  # log_prefix not found
-            continue
-        if pos > 0:  # remove log_prefix leading characters
-            line = line[pos:-1]
-
-        line = line[len(log_prefix):].strip()
-        match = level_pattern.match(line)
-        if not match:
-            continue
-        line = match.group(1)
-        if len(line) > 120:
-            line = line[:120] + '...'
-        if line.find(action_begin) != -1:
-            logs.append((match.group(2), line, "action"))
-        else:
-            logs.append((match.group(2), line, ""))
-    return logs
+TRACEBACK = 'Traceback (most recent call last):\n'
 
+ERROR_TYPES = ["Infrastructure Error:",
+               "Bootloader Error:",
+               "Kernel Error:",
+               "Userspace Error:",
+               "Test Shell Error:",
+               "Master Image Error:",
+               "OperationFailed:"]
 
-class Sections:
-    def __init__(self):
+# Everything a line is classified on, so that most lines (console output)
+# are dealt with by a single regular expression search.
+LINE_TOKENS = re.compile('|'.join(
+    re.escape(token) for token in
+    [LOG_PREFIX, 'lava_dispatcher', 'CriticalError:'] + ERROR_TYPES))
+
+# Lines which do not match this are console output, unless they are part of
+# a traceback.
+BLOCK_TOKENS = re.compile('|'.join(
+    re.escape(token) for token in
+    [LOG_PREFIX, 'lava_dispatcher', 'CriticalError:', TRACEBACK[:-1]] +
+    ERROR_TYPES))
+
+LEVEL_PATTERN = re.compile('....-..-.. (..:..:.. .. ([A-Z]+): .*)')
+
+LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def parse_message(line, pos):
+    """
+    Returns the (level, message, "action" or "") of the dispatcher log
+    message of line, the log prefix being at pos, or None if it has none.
+    """
+    # the log prefix is not always at the beginning of the line
+    if pos > 0:
+        line = line[pos:-1]
+    line = line[len(LOG_PREFIX):].strip()
+    match = LEVEL_PATTERN.match(line)
+    if not match:
+        return None
+    line = match.group(1)
+    if len(line) > 120:
+        line = line[:120] + '...'
+    kind = "action" if line.find(ACTION_BEGIN) != -1 else ""
+    return match.group(2), unicode(line, 'utf-8', 'replace'), kind
+
+
+def message_levels(messages):
+    """
+    Returns the (level, count) pairs of the dispatcher log messages,
+    sorted by severity.
+    """
+    levels = dict((level, 0) for level in LEVELS)
+    for level, msg, _ in messages:
+        levels[level] = levels.get(level, 0) + 1
+    return sorted(levels.items(),
+                  key=lambda (k, v): logging._levelNames.get(k))
+
+
+class LogClassifier(object):
+    """
+    Classifies the lines of a job log in a single pass, collecting at once:
+
+    - the sections of the log ('console', 'log' or 'traceback'), as
+      [type, start offset, end offset, number of lines]
+    - the dispatcher log messages, as (level, message, "action" or "")
+    - the dispatcher errors, without duplicates, in order of appearance
+
+    When keep_content is set the text of each section is kept as well, see
+    formatted_sections().
+
+    section_type is the type of the section the previous line belongs to.
+    It can be given to carry on classifying a log from where another
+    classifier stopped.
+    """
+
+    def __init__(self, keep_content=False, section_type=None):
         self.sections = []
-        self.cur_section_type = None
-        self.cur_section = []
+        self.section_type = section_type
+        self.messages = []
+        self.errors = []
+        self._content = [] if keep_content else None
 
-    def push(self, sect_type, line):
-        if sect_type != self.cur_section_type:
-            self.close()
-            self.cur_section_type = sect_type
-        self.cur_section.append(line)
+    @property
+    def levels(self):
+        """
+        Returns the (level, count) pairs of the dispatcher log messages,
+        sorted by severity.
+        """
+        return message_levels(self.messages)
 
-    def close(self):
-        if self.cur_section_type is not None:
-            self.sections.append(
-                (self.cur_section_type,
-                 len(self.cur_section),
-                 ''.join(self.cur_section)))
-        self.cur_section_type = None
-        self.cur_section = []
+    def classify(self, logfile, offset=0, final=True):
+        """
+        Classifies the content of logfile from its current position, which
+        is at byte offset in the log.
 
+        The log is read in chunks and runs of plain console output are
+        skipped with a single search, only the lines which may be something
+        else are looked at one by one.
 
-def formatLogFile(logfile):
-    if not logfile:
-        return [('log', 1, "Log file is missing")]
+        A last line without a newline is only classified when final is set.
+        Returns the offset following the last classified line.
+        """
+        pending = ''
+        while True:
+            data = logfile.read(CHUNK_SIZE)
+            if not data:
+                break
+            data = pending + data
+            cut = data.rfind('\n') + 1
+            if cut:
+                self._classify_lines(data[:cut], offset)
+                offset += cut
+            pending = data[cut:]
+        if pending and final:
+            self.feed(pending, offset)
+            offset += len(pending)
+        return offset
 
-    sections = Sections()
+    def _classify_lines(self, data, offset):
+        # data only holds complete lines
+        pos = 0
+        size = len(data)
+        while pos < size:
+            if self.section_type == 'traceback':
+                end = data.find('\n', pos) + 1
+                self.feed(data[pos:end], offset + pos)
+                pos = end
+                continue
+            match = BLOCK_TOKENS.search(data, pos)
+            if match is None:
+                line_start = size
+            else:
+                line_start = data.rfind('\n', pos, match.start()) + 1 or pos
+            if line_start > pos:
+                self._console(data, pos, line_start, offset)
+            if match is None:
+                break
+            end = data.find('\n', match.start()) + 1
+            self.feed(data[line_start:end], offset + line_start)
+            pos = end
+
+    def _console(self, data, start, end, offset):
+        lines = data.count('\n', start, end)
+        if self.section_type != 'console' or not self.sections:
+            self.section_type = 'console'
+            self.sections.append(['console', offset + start, offset + end, lines])
+            if self._content is not None:
+                self._content.append([])
+        else:
+            self.sections[-1][2] = offset + end
+            self.sections[-1][3] += lines
+        if self._content is not None:
+            self._content[-1].append(data[start:end].replace('\r', ''))
+
+    def _push(self, section_type, start, end, line):
+        if section_type != self.section_type or not self.sections:
+            self.section_type = section_type
+            self.sections.append([section_type, start, end, 1])
+            if self._content is not None:
+                self._content.append([line])
+        else:
+            self.sections[-1][2] = end
+            self.sections[-1][3] += 1
+            if self._content is not None:
+                self._content[-1].append(line)
+
+    def feed(self, raw_line, start):
+        """
+        Classifies one line of the log, starting at offset start.
+        """
+        end = start + len(raw_line)
+        line = raw_line.replace('\r', '')
+        tokens = {}
+        for match in LINE_TOKENS.finditer(raw_line):
+            tokens.setdefault(match.group(), match.start())
 
-    for line in logfile:
-        line = line.replace('\r', '')
-        line = unicode(line, 'ascii', 'replace')
         if not line:
-            continue
-        if line == 'Traceback (most recent call last):\n':
-            sections.push('traceback', line)
-        elif sections.cur_section_type == 'traceback':
-            sections.push('traceback', line)
+            pass
+        elif line == TRACEBACK:
+            self._push('traceback', start, end, line)
+        elif self.section_type == 'traceback':
+            self._push('traceback', start, end, line)
             if not line.startswith(' '):
-                sections.close()
-            continue
-        elif line.find("<LAVA_DISPATCHER>") != -1 \
-                or line.find("lava_dispatcher") != -1 \
-                or line.find("CriticalError:") != -1:
-            sections.push('log', line)
+                self.section_type = None
+        elif LOG_PREFIX in tokens or 'lava_dispatcher' in tokens \
+                or 'CriticalError:' in tokens:
+            self._push('log', start, end, line)
         else:
-            sections.push('console', line)
-    sections.close()
+            self._push('console', start, end, line)
+
+        if LOG_PREFIX in tokens:
+            self._message(raw_line, tokens[LOG_PREFIX])
+        for error in ERROR_TYPES:
+            if error in tokens:
+                error = unicode(raw_line[tokens[error]:], 'utf-8', 'replace')
+                if error not in self.errors:
+                    self.errors.append(error)
+
+    def _message(self, line, pos):
+        message = parse_message(line, pos)
+        if message is not None:
+            self.messages.append(message)
+
+    def formatted_sections(self):
+        """
+        Returns the (type, number of lines, text) of each section, only
+        available with keep_content.
+        """
+        return [(section[0], section[3],
+                 unicode(''.join(content), 'ascii', 'replace'))
+                for section, content in zip(self.sections, self._content)]
+
+
+def getDispatcherErrors(logfile):
+    classifier = LogClassifier()
+    classifier.classify(logfile)
+    return classifier.errors
+
+
+def getDispatcherLogMessages(logfile):
+    classifier = LogClassifier()
+    classifier.classify(logfile)
+    return classifier.messages
+
+
+def formatLogFile(logfile):
+    if not logfile:
+        return [('log', 1, "Log file is missing")]
+
+    classifier = LogClassifier(keep_content=True)
+    classifier.classify(logfile)
+    return classifier.formatted_sections()
+
+
+class LogIndex(LogClassifier):
+    """
+    Index of a job log file, built incrementally as the log grows.
+
+    Holds the byte offsets of the sections shown by formatLogFile and the
+    errors of getDispatcherErrors. The dispatcher log messages are not kept
+    but read from the sections which can hold them, see read_messages. It
+    is saved as a JSON sidecar file next to the log, so only the lines
+    added since the last update have to be parsed.
+    """
+
+    VERSION = 2
+
+    def __init__(self):
+        super(LogIndex, self).__init__()
+        # number of bytes of the log file which have been indexed, always
+        # the end of a line.
+        self.offset = 0
+        # size of the log file at the last update.
+        self.size = 0
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the index saved in path, or an empty index if there is none
+        or it cannot be used.
+        """
+        index = cls()
+        try:
+            with open(path) as f:
+                data = simplejson.load(f)
+        except (IOError, ValueError):
+            return index
+        if data.get('version') != cls.VERSION:
+            return index
+        index.offset = data['offset']
+        index.sections = data['sections']
+        index.section_type = data['section_type']
+        index.errors = data['errors']
+        return index
+
+    def save(self, path):
+        """
+        Saves the index in path. Failing to save is not an error, the
+        index will just be rebuilt next time.
+        """
+        data = {
+            'version': self.VERSION,
+            'offset': self.offset,
+            'sections': self.sections,
+            'section_type': self.section_type,
+            'errors': self.errors,
+        }
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                simplejson.dump(data, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+        return True
+
+    def _message(self, line, pos):
+        pass
+
+    def update(self, logfile, size, final=False):
+        """
+        Indexes the part of logfile after the already indexed offset.
+
+        A last line without a newline is only indexed when final is set
+        (the log will not grow anymore), otherwise it is left for the next
+        update. A log smaller than what was indexed has been replaced, it
+        is indexed again from the start.
+
+        Returns True if the index changed.
+        """
+        if size < self.offset:
+            self.__init__()
+        self.size = size
+        if size == self.offset:
+            return False
+        logfile.seek(self.offset)
+        offset = self.classify(logfile, self.offset, final)
+        changed = offset != self.offset
+        self.offset = offset
+        return changed
+
+    def read_sections(self, logfile):
+        """
+        Returns the sections of the log as formatLogFile does, reading each
+        of them directly from logfile.
+        """
+        sections = []
+        for section_type, start, end, lines in self.sections:
+            logfile.seek(start)
+            content = logfile.read(end - start).replace('\r', '')
+            sections.append(
+                (section_type, lines, unicode(content, 'ascii', 'replace')))
+        return sections
 
-    return sections.sections
+    def read_messages(self, logfile):
+        """
+        Returns the dispatcher log messages as getDispatcherLogMessages
+        does, reading only the sections of logfile which are not console
+        output: a line with a message is never console output.
+        """
+        messages = []
+        for section_type, start, end, lines in self.sections:
+            if section_type == 'console':
+                continue
+            logfile.seek(start)
+            for line in StringIO.StringIO(logfile.read(end - start)):
+                pos = line.find(LOG_PREFIX)
+                if pos == -1:
+                    continue
+                message = parse_message(line, pos)
+                if message is not None:
+                    messages.append(message)
+        return messages
@@ -0,0 +1,46 @@
+import datetime
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from lava_scheduler_app.models import TestJob
+
+
+class Command(BaseCommand):
+
+    help = "Compress the output of finished jobs."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--older-than',
+                    type='int',
+                    dest='older_than',
+                    default=60,
+                    help="Only compress the output of jobs which finished "
+                         "at least this many minutes ago (default: 60)"),
+        make_option('--newer-than',
+                    type='int',
+                    dest='newer_than',
+                    default=None,
+                    help="Only look at jobs which finished at most this "
+                         "many days ago (default: all finished jobs)"),
+    )
+
+    def handle(self, *args, **options):
+        now = datetime.datetime.now()
+        jobs = TestJob.objects.filter(
+            Q(status=TestJob.COMPLETE) | Q(status=TestJob.INCOMPLETE) |
+            Q(status=TestJob.CANCELED),
+            end_time__lt=now - datetime.timedelta(minutes=options['older_than']))
+        if options['newer_than'] is not None:
+            jobs = jobs.filter(
+                end_time__gte=now - datetime.timedelta(days=options['newer_than']))
+        compressed = 0
+        for job in jobs.only('id', 'status').order_by('id').iterator():
+            try:
+                if job.compress_output():
+                    compressed += 1
+            except (IOError, OSError) as exc:
+                self.stderr.write("job %d: %s" % (job.id, exc))
+        self.stdout.write("Compressed the output of %d job(s)." % compressed)
@@ -44,6 +44,7 @@ class Command(SchedulerCommand):
         from twisted.internet import reactor
 
         from lava_scheduler_daemon.service import JobQueue
+        from lava_scheduler_daemon.notifier import get_notifier
         from lava_scheduler_daemon.worker import WorkerData
         from lava_scheduler_daemon.dbjobsource import DatabaseJobSource
         import xmlrpclib
@@ -71,6 +72,7 @@ class Command(SchedulerCommand):
 
         # Start scheduler service.
         service = JobQueue(
-            source, dispatcher, reactor, daemon_options=daemon_options)
+            source, dispatcher, reactor, daemon_options=daemon_options,
+            notifier=get_notifier(reactor, daemon_options))
         reactor.callWhenRunning(service.startService)
         reactor.run()
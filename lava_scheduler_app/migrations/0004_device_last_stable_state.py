@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# Device.RUNNING, Device.RESERVED and Device.OFFLINING
+BUSY_STATES = (2, 5, 3)
+
+
+def forwards_func(apps, schema_editor):
+    Device = apps.get_model("lava_scheduler_app", "Device")
+    DeviceStateTransition = apps.get_model(
+        "lava_scheduler_app", "DeviceStateTransition")
+    db_alias = schema_editor.connection.alias
+    for hostname in Device.objects.using(db_alias).values_list(
+            'hostname', flat=True):
+        last = DeviceStateTransition.objects.using(db_alias).filter(
+            device_id=hostname).exclude(old_state__in=BUSY_STATES).order_by(
+            '-created_on').values_list('old_state', flat=True)[:1]
+        if last:
+            Device.objects.using(db_alias).filter(hostname=hostname).update(
+                last_stable_state=last[0])
+
+
+def backwards_func(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lava_scheduler_app', '0003_populate_master_node'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_stable_state',
+            field=models.IntegerField(blank=True, editable=False, choices=[(0, b'Offline'), (1, b'Idle'), (2, b'Running'), (3, b'Going offline'), (4, b'Retired'), (5, b'Reserved')], help_text='Last status, other than a busy one, the device left. Maintained by DeviceStateTransition.', null=True, verbose_name='Last stable status'),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='devicestatetransition',
+            index_together=set([('device', 'created_on')]),
+        ),
+        migrations.RunPython(
+            forwards_func,
+            backwards_func,
+        ),
+    ]
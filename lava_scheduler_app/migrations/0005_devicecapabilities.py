@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lava_scheduler_app', '0004_device_last_stable_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceCapabilities',
+            fields=[
+                ('device', models.OneToOneField(related_name='capabilities', primary_key=True, serialize=False, to='lava_scheduler_app.Device')),
+                ('capabilities_date', models.DateTimeField(null=True, blank=True)),
+                ('processor', models.TextField(null=True, blank=True)),
+                ('cpu_models', models.TextField(null=True, blank=True)),
+                ('cores', models.IntegerField(default=0)),
+                ('emulated', models.BooleanField(default=False)),
+                ('flags', models.TextField(null=True, blank=True)),
+                ('job', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='lava_scheduler_app.TestJob', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lava_scheduler_app', '0005_devicecapabilities'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testjob',
+            name='description',
+            field=models.CharField(default=None, max_length=200, null=True, verbose_name='Description', db_index=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -10,6 +10,7 @@ import socket
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
 from django.core.exceptions import (
     ImproperlyConfigured,
@@ -20,6 +21,13 @@ from django.core.exceptions import (
 from django.core.mail import send_mail
 from django.core.validators import validate_email
 from django.db import models
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+)
+from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404
@@ -27,9 +35,12 @@ from django.shortcuts import get_object_or_404
 from django_restricted_resource.models import RestrictedResource
 
 from dashboard_app.models import Bundle, BundleStream
+from dashboard_app.signals import bundle_was_deserialized
 
 from lava_dispatcher.job import validate_job_data
 from lava_scheduler_app import utils
+from lava_scheduler_app.compressed_log import CompressedLogFile, compress_log
+from lava_scheduler_app.logfile_helper import LogIndex
 
 from linaro_django_xmlrpc.models import AuthToken
 
@@ -60,6 +71,64 @@ def validate_job_json(data):
         raise ValidationError(e)
 
 
+# How long the device types visible to a user are cached, in seconds. The
+# cache is invalidated whenever visibility may change, this only bounds how
+# stale other processes can be when the cache is not shared between them.
+VISIBILITY_CACHE_TIMEOUT = 300
+VISIBILITY_GENERATION_KEY = 'lava_scheduler_app.visibility.generation'
+
+
+def _visibility_generation():
+    generation = cache.get(VISIBILITY_GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.add(VISIBILITY_GENERATION_KEY, generation, None)
+        generation = cache.get(VISIBILITY_GENERATION_KEY, generation)
+    return generation
+
+
+def invalidate_visibility_cache():
+    """
+    Forgets the device types visible to every user.
+    """
+    cache.set(VISIBILITY_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def visible_device_type_names(user):
+    """
+    Returns the set of the names of the device types with at least one
+    device the user can see, see DeviceType.devices_visible_to.
+
+    Computed with a single query and cached per user until the owners of a
+    device, the owners_only flag of a device type or the groups of a user
+    change.
+    """
+    if user is None or not user.is_authenticated():
+        user = None
+    key = 'lava_scheduler_app.visibility.%s.%s' % (
+        _visibility_generation(), user.pk if user else 'anonymous')
+    names = cache.get(key)
+    if names is None:
+        visible = models.Q(owners_only=False, device__isnull=False)
+        if user:
+            visible |= models.Q(device__user=user)
+            visible |= models.Q(device__group__in=user.groups.all())
+        names = frozenset(DeviceType.objects.filter(visible).values_list(
+            'name', flat=True).distinct())
+        cache.set(key, names, VISIBILITY_CACHE_TIMEOUT)
+    return names
+
+
+class DeviceTypeManager(models.Manager):
+
+    def visible_to(self, user):
+        """
+        Filters the device types which have at least one device the user
+        can see.
+        """
+        return self.filter(name__in=visible_device_type_names(user))
+
+
 class DeviceType(models.Model):
     """
     A class of device, for example a pandaboard or a snowball.
@@ -67,6 +136,8 @@ class DeviceType(models.Model):
 
     name = models.SlugField(primary_key=True)
 
+    objects = DeviceTypeManager()
+
     def __unicode__(self):
         return self.name
 
@@ -102,6 +173,15 @@ class DeviceType(models.Model):
         else:
             return q
 
+    def is_visible_to(self, user):
+        """
+        Checks if the user can see at least one device of this DeviceType,
+        without loading the devices.
+        :param user: User to check
+        :return: True if devices_visible_to would not be empty
+        """
+        return self.name in visible_device_type_names(user)
+
 
 class DefaultDeviceOwner(models.Model):
     """
@@ -397,6 +477,9 @@ class Device(RestrictedResource):
         (RESERVED, 'Reserved')
     )
 
+    # States a device only goes through while a job is using it
+    BUSY_STATES = (RUNNING, RESERVED, OFFLINING)
+
     # A device health shows a device is ready to test or not
     HEALTH_UNKNOWN, HEALTH_PASS, HEALTH_FAIL, HEALTH_LOOPING = range(4)
     HEALTH_CHOICES = (
@@ -459,6 +542,16 @@ class Device(RestrictedResource):
         verbose_name=_(u"Device status"),
     )
 
+    last_stable_state = models.IntegerField(
+        choices=STATUS_CHOICES,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_(u"Last stable status"),
+        help_text=_(u"Last status, other than a busy one, the device left."
+                    u" Maintained by DeviceStateTransition."),
+    )
+
     health_status = models.IntegerField(
         choices=HEALTH_CHOICES,
         default=HEALTH_UNKNOWN,
@@ -554,7 +647,7 @@ class Device(RestrictedResource):
         if self.device_type.owners_only:
             if not user:
                 return False
-            if len(self.device_type.devices_visible_to(user)) == 0:
+            if not self.device_type.is_visible_to(user):
                 return False
         if not self.is_public:
             if not user:
@@ -584,6 +677,7 @@ class Device(RestrictedResource):
             new_state=new_status, message=message, job=job).save()
         self.status = new_status
         self.save()
+        utils.notify_scheduler('device %s' % self.hostname)
 
     def put_into_maintenance_mode(self, user, reason, notify=None):
         if self.status in [self.RESERVED, self.OFFLINING]:
@@ -678,17 +772,43 @@ class Device(RestrictedResource):
             Device.RESERVED
             Device.OFFLINING
 
-        We find a non-busy state by back-tracking in status transition logs.
+        This is the old state of the latest transition out of a non-busy
+        state, kept in last_stable_state as transitions are recorded, or
+        None if there is no such transition.
         """
-        busy_states = [Device.RUNNING, Device.RESERVED, Device.OFFLINING]
-        previous_transitions = DeviceStateTransition.objects.filter(
-            device=self).order_by('-created_on')
-        if len(previous_transitions) > 0:
-            for previous_transition in previous_transitions:
-                if previous_transition.old_state not in busy_states:
-                    return previous_transition.old_state
-        else:
-            return None
+        return self.last_stable_state
+
+    def state_timeline(self, start=None, end=None):
+        """Returns the states of the device between start and end as a list
+        of (state, since, until) periods, oldest first.
+
+        Consecutive transitions to the same state, such as restrictions or
+        repeated health checks, are merged into a single period. The first
+        period starts at start (None for the whole history) and until is
+        None for the current state when end is not given.
+        """
+        transitions = DeviceStateTransition.objects.filter(device=self)
+        timeline = []
+        if start is not None:
+            before = transitions.filter(created_on__lt=start).order_by(
+                '-created_on').values_list('new_state', flat=True)[:1]
+            if before:
+                timeline.append([before[0], start, None])
+            transitions = transitions.filter(created_on__gte=start)
+        if end is not None:
+            transitions = transitions.filter(created_on__lt=end)
+        transitions = transitions.order_by('created_on', 'id').values_list(
+            'created_on', 'old_state', 'new_state')
+        for created_on, old_state, new_state in transitions.iterator():
+            if not timeline:
+                timeline.append([old_state, start, None])
+            if new_state == timeline[-1][0]:
+                continue
+            timeline[-1][2] = created_on
+            timeline.append([new_state, created_on, None])
+        if end is not None and timeline:
+            timeline[-1][2] = end
+        return [tuple(period) for period in timeline]
 
 
 class TemporaryDevice(Device):
@@ -712,6 +832,73 @@ class TemporaryDevice(Device):
         pass
 
 
+# The owners and device type of each device as loaded, to only invalidate
+# the visibility cache when they change, not on every status change.
+VISIBILITY_FIELDS = ('user_id', 'group_id', 'device_type_id')
+
+
+# What the capability index holds about each device, see CapabilityIndex.
+CAPABILITY_FIELDS = ('device_type_id', 'is_public', 'user_id', 'group_id')
+
+
+def _capability(device):
+    return tuple(getattr(device, field) for field in CAPABILITY_FIELDS) + (
+        device.status == Device.RETIRED,)
+
+
+@receiver(post_init, sender=Device)
+@receiver(post_init, sender=TemporaryDevice)
+def device_init_handler(sender, instance, **kwargs):
+    instance._visibility = tuple(
+        getattr(instance, field) for field in VISIBILITY_FIELDS)
+    instance._capability = _capability(instance)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=TemporaryDevice)
+def device_save_handler(sender, instance, created, **kwargs):
+    visibility = tuple(
+        getattr(instance, field) for field in VISIBILITY_FIELDS)
+    if created or visibility != instance._visibility:
+        invalidate_visibility_cache()
+    instance._visibility = visibility
+    capability = _capability(instance)
+    if created or capability != instance._capability:
+        invalidate_capability_index()
+    instance._capability = capability
+
+
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=TemporaryDevice)
+def device_delete_handler(sender, **kwargs):
+    invalidate_visibility_cache()
+    invalidate_capability_index()
+
+
+@receiver(post_save, sender=DeviceType)
+@receiver(post_delete, sender=DeviceType)
+@receiver(post_delete, sender=Group)
+def visibility_change_handler(sender, **kwargs):
+    invalidate_visibility_cache()
+
+
+@receiver(post_delete, sender=Tag)
+def tag_delete_handler(sender, **kwargs):
+    invalidate_capability_index()
+
+
+@receiver(m2m_changed, sender=Device.tags.through)
+def device_tags_handler(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_capability_index()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_handler(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_visibility_cache()
+
+
 class JobFailureTag(models.Model):
     """
     Allows us to maintain a set of common ways jobs fail. These can then be
@@ -744,7 +931,115 @@ def _get_tag_list(tags):
     return taglist
 
 
-def _check_tags(taglist, device_type=None, hostname=None):
+# How long the capability index is cached, in seconds. Like the visibility
+# cache, it is invalidated on changes and this only bounds how stale other
+# processes can be when the cache is not shared between them.
+CAPABILITY_INDEX_TIMEOUT = 300
+CAPABILITY_GENERATION_KEY = 'lava_scheduler_app.capabilities.generation'
+
+
+def invalidate_capability_index():
+    cache.set(CAPABILITY_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+class CapabilityIndex(object):
+    """
+    The devices which are not retired, by device type, with their tags and
+    owners, loaded with three queries. Used by the checks of job
+    submissions, which then only look up dictionaries however large the
+    lab and however many multinode roles the job has.
+
+    Get it with CapabilityIndex.get(), which keeps it in the cache until a
+    device, its tags or a tag change, see invalidate_capability_index.
+    """
+
+    def __init__(self):
+        self.device_types = dict(
+            DeviceType.objects.values_list('pk', 'name'))
+        self.devices = {}
+        self.by_type = {}
+        devices = Device.objects.exclude(status=Device.RETIRED).values_list(
+            'hostname', 'device_type', 'is_public', 'user', 'group')
+        for hostname, device_type, is_public, user, group in devices:
+            self.devices[hostname] = {
+                'device_type': device_type,
+                'is_public': is_public,
+                'user': user,
+                'group': group,
+                'tags': set(),
+            }
+            self.by_type.setdefault(device_type, []).append(hostname)
+        tags = Device.tags.through.objects.exclude(
+            device__status=Device.RETIRED).values_list('device', 'tag')
+        for hostname, tag in tags:
+            if hostname in self.devices:
+                self.devices[hostname]['tags'].add(tag)
+
+    @classmethod
+    def get(cls):
+        generation = cache.get(CAPABILITY_GENERATION_KEY)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            cache.add(CAPABILITY_GENERATION_KEY, generation, None)
+            generation = cache.get(CAPABILITY_GENERATION_KEY, generation)
+        key = 'lava_scheduler_app.capabilities.%s' % generation
+        index = cache.get(key)
+        if index is None:
+            index = cls()
+            cache.set(key, index, CAPABILITY_INDEX_TIMEOUT)
+        return index
+
+    def devices_of_type(self, device_type):
+        """
+        Hostnames of the devices of device_type, a DeviceType or its name,
+        which are not retired.
+        """
+        if isinstance(device_type, DeviceType):
+            device_type = device_type.pk
+        return list(self.by_type.get(device_type, []))
+
+    def devices_with_tags(self, tag_ids, device_type=None, hostname=None):
+        """
+        Hostnames of the devices of device_type, or the device called
+        hostname, which have all the tags.
+        """
+        if hostname:
+            hostnames = [hostname] if hostname in self.devices else []
+        else:
+            hostnames = self.by_type.get(device_type.pk, [])
+        tag_ids = set(tag_ids)
+        return [name for name in hostnames
+                if tag_ids <= self.devices[name]['tags']]
+
+    def can_submit(self, hostname, user, group_ids):
+        """
+        Same as Device.can_submit, group_ids being the groups of user.
+        """
+        device = self.devices.get(hostname)
+        if device is None:
+            return False
+        if device['is_public'] or user.username == "lava-health":
+            return True
+        if not user.is_authenticated() or not user.is_active:
+            return False
+        if device['user'] is not None:
+            return device['user'] == user.pk
+        return device['group'] in group_ids
+
+    def device_type_counts(self):
+        """
+        Number of devices which are not retired of each device type, by name.
+        """
+        return dict((self.device_types[device_type], len(hostnames))
+                    for device_type, hostnames in self.by_type.iteritems()
+                    if hostnames)
+
+
+def _hostname(device):
+    return device.hostname if isinstance(device, Device) else device
+
+
+def _check_tags(taglist, device_type=None, hostname=None, index=None):
     """
     Checks each available device against required tags
     :param taglist: list of Tag objects (not strings) for this job
@@ -752,7 +1047,8 @@ def _check_tags(taglist, device_type=None, hostname=None):
     called during submission.
     :param hostname: check if this device can satisfy the tags - called
     from the daemon when scheduling from the queue.
-    :return: a list of devices suitable for all the specified tags
+    :param index: the CapabilityIndex to use
+    :return: the hostnames of the devices suitable for all the specified tags
     :raise: DevicesUnavailableException if no devices can satisfy the
     combination of tags.
     """
@@ -762,17 +1058,19 @@ def _check_tags(taglist, device_type=None, hostname=None):
     if len(taglist) == 0:
         # no tags specified in the job, any device can be used.
         return []
-    q = models.Q()
-    if device_type:
-        q = q.__and__(models.Q(device_type=device_type))
+    if index is None:
+        index = CapabilityIndex.get()
     if hostname:
-        q = q.__and__(models.Q(hostname=hostname))
-    q = q.__and__(~models.Q(status=Device.RETIRED))
-    tag_devices = set(Device.objects.filter(q))
-    matched_devices = []
-    for device in tag_devices:
-        if set(device.tags.all()) & set(taglist) == set(taglist):
-            matched_devices.append(device)
+        hostname = _hostname(hostname)
+        matched_devices = index.devices_with_tags(
+            [tag.pk for tag in taglist], hostname=hostname)
+        if device_type:
+            matched_devices = [
+                name for name in matched_devices
+                if index.devices[name]['device_type'] == device_type.pk]
+    else:
+        matched_devices = index.devices_with_tags(
+            [tag.pk for tag in taglist], device_type=device_type)
     if len(matched_devices) == 0 and device_type:
         raise DevicesUnavailableException(
             "No devices of type %s are available which have all of the tags '%s'."
@@ -781,16 +1079,18 @@ def _check_tags(taglist, device_type=None, hostname=None):
         raise DevicesUnavailableException(
             "Device %s does not support all of the tags '%s'."
             % (hostname, ", ".join([x.name for x in taglist])))
-    return list(set(matched_devices))
+    return matched_devices
 
 
-def _check_submit_to_device(device_list, user):
+def _check_submit_to_device(device_list, user, index=None, group_ids=None):
     """
     Handles the affects of Device Ownership on job submission
-    :param device_list: A list of device objects to check
+    :param device_list: A list of devices or hostnames to check
     :param user: The user submitting the job
-    :return: a subset of the device_list to which the user
-    is allowed to submit a TestJob.
+    :param index: the CapabilityIndex to use
+    :param group_ids: the ids of the groups of the user, if known
+    :return: the hostnames of the devices of device_list to which
+    the user is allowed to submit a TestJob.
     :raise: DevicesUnavailableException if none of the
     devices in device_list are available for submission by this user.
     """
@@ -798,9 +1098,14 @@ def _check_submit_to_device(device_list, user):
     if type(device_list) != list or len(device_list) == 0:
         # logic error
         return allow
+    if index is None:
+        index = CapabilityIndex.get()
+    if group_ids is None:
+        group_ids = set(user.groups.values_list('pk', flat=True))
     for device in device_list:
-        if device.status != Device.RETIRED and device.can_submit(user):
-            allow.append(device)
+        hostname = _hostname(device)
+        if index.can_submit(hostname, user, group_ids):
+            allow.append(hostname)
     if len(allow) == 0:
         raise DevicesUnavailableException(
             "No devices of the requested type are currently available to user %s"
@@ -814,9 +1119,9 @@ def _check_tags_support(tag_devices, device_list):
     returns any devices which meet both criteria.
     If neither the job nor the device have any tags, tag_devices will
     be empty, so the check will pass.
-    :param tag_devices: A list of devices which meet the tag
+    :param tag_devices: hostnames of the devices which meet the tag
     requirements
-    :param device_list: A list of devices to which the user is able
+    :param device_list: hostnames of the devices to which the user is able
     to submit a TestJob
     :raise: DevicesUnavailableException if there is no overlap between
     the two sets.
@@ -842,44 +1147,119 @@ def _get_device_type(user, name):
         msg = "Device type '%s' is unavailable. %s" % (name, e)
         logger.error(msg)
         raise DevicesUnavailableException(msg)
-    if len(device_type.devices_visible_to(user)) == 0:
+    if not device_type.is_visible_to(user):
         msg = "Device type '%s' is unavailable to user '%s'" % (name, user.username)
         logger.error(msg)
         raise DevicesUnavailableException(msg)
     return device_type
 
 
-def _check_device_types(user):
+def _check_device_types(user, index=None):
     """
-    Filters the list of device types to exclude types which are
-    owner_only if the user is not an owner of one of those devices.
+    Counts the devices of each device type available for scheduling,
+    i.e. which are not retired.
+    Hidden device types are counted in full: _get_device_type has already
+    checked that the user owns some of their devices.
     :param user: the user submitting the TestJob
+    :param index: the CapabilityIndex to use
+    :return: the number of devices of each device type, by name
     """
+    if index is None:
+        index = CapabilityIndex.get()
+    return index.device_type_counts()
+
+
+class SubmissionLookups(object):
+    """
+    Remembers the database lookups done while submitting jobs, so that
+    submitting a batch of jobs resolves each tag, device, device type and
+    bundle stream only once. Failed lookups are remembered as well and
+    raise the same exception again.
+
+    Only meant to live for the duration of one submission request.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        The CapabilityIndex the checks of the batch use.
+        """
+        if self._index is None:
+            self._index = CapabilityIndex.get()
+        return self._index
+
+    def _lookup(self, key, func, *args, **kwargs):
+        if key not in self._cache:
+            try:
+                self._cache[key] = (func(*args, **kwargs), None)
+            except (JSONDataError, DevicesUnavailableException) as e:
+                self._cache[key] = (None, e)
+        value, error = self._cache[key]
+        if error is not None:
+            raise error
+        return value
+
+    def tag_list(self, tags):
+        if type(tags) != list:
+            return _get_tag_list(tags)
+        return self._lookup(('tags', tuple(tags)), _get_tag_list, tags)
+
+    def device(self, hostname):
+        def get_device():
+            try:
+                return Device.objects.filter(
+                    ~models.Q(status=Device.RETIRED)).get(hostname=hostname)
+            except Device.DoesNotExist:
+                raise DevicesUnavailableException(
+                    "Requested device %s is unavailable." % hostname)
+        return self._lookup(('device', hostname), get_device)
+
+    def device_type(self, user, name):
+        return self._lookup(('device_type', user.pk, name),
+                            _get_device_type, user, name)
+
+    def devices_of_type(self, device_type):
+        return self.index.devices_of_type(device_type)
+
+    def group_ids(self, user):
+        return self._lookup(
+            ('groups', user.pk),
+            lambda: set(user.groups.values_list('pk', flat=True)))
+
+    def check_submit_to_device(self, device_list, user):
+        key = ('submit', user.pk, tuple(_hostname(d) for d in device_list))
+        return self._lookup(key, _check_submit_to_device, device_list, user,
+                            self.index, self.group_ids(user))
+
+    def check_tags(self, taglist, device_type=None, hostname=None):
+        key = ('check_tags', tuple(tag.pk for tag in taglist),
+               device_type.pk if device_type else None, _hostname(hostname))
+        return self._lookup(key, _check_tags, taglist,
+                            device_type=device_type, hostname=hostname,
+                            index=self.index)
+
+    def device_types(self, user):
+        return self._lookup(('device_types', user.pk),
+                            _check_device_types, user, self.index)
+
+    def bundle_stream(self, pathname):
+        """
+        Returns the bundle stream or None if it does not exist.
+        """
+        def get_stream():
+            try:
+                return BundleStream.objects.get(pathname=pathname)
+            except BundleStream.DoesNotExist:
+                return None
+        return self._lookup(('stream', pathname), get_stream)
 
-    # Get all device types that are available for scheduling.
-    device_types = DeviceType.objects.values_list('name').filter(
-        models.Q(device__status=Device.IDLE) |
-        models.Q(device__status=Device.RUNNING) |
-        models.Q(device__status=Device.RESERVED) |
-        models.Q(device__status=Device.OFFLINE) |
-        models.Q(device__status=Device.OFFLINING))\
-        .annotate(num_count=models.Count('name')).order_by('name')
-
-    # Count each of the device types available.
-    # reduce the count by the number of devices available to that user
-    # if this type is hidden  Skip if this results in zero devices of that type.
-    all_devices = {}
-    for dt in device_types:
-        # dt[0] -> device type name
-        # dt[1] -> device type count
-        device_type = DeviceType.objects.get(name=dt[0])
-        if device_type.owners_only:
-            count = len(device_type.devices_visible_to(user))
-            if count > 0:
-                all_devices[dt[0]] = count
-        if dt[1] > 0:
-            all_devices[dt[0]] = dt[1]
-    return all_devices
+    def can_upload(self, bundle_stream, user):
+        return self._lookup(('can_upload', bundle_stream.pk, user.pk),
+                            bundle_stream.can_upload, user)
 
 
 class TestJob(RestrictedResource):
@@ -951,7 +1331,8 @@ class TestJob(RestrictedResource):
         max_length=200,
         null=True,
         blank=True,
-        default=None
+        default=None,
+        db_index=True
     )
 
     health_check = models.BooleanField(default=False)
@@ -1048,7 +1429,13 @@ class TestJob(RestrictedResource):
     def output_file(self):
         output_path = os.path.join(self.output_dir, 'output.txt')
         if os.path.exists(output_path):
-            return open(output_path)
+            try:
+                return open(output_path)
+            except IOError:
+                # compressed in the meantime
+                pass
+        if os.path.exists(output_path + '.gz'):
+            return CompressedLogFile(output_path + '.gz')
         elif self.log_file:
             log_file = self.log_file
             if log_file:
@@ -1060,6 +1447,58 @@ class TestJob(RestrictedResource):
         else:
             return None
 
+    def compress_output(self):
+        """
+        Compresses the log of a finished job, see compressed_log. Returns
+        True if the log was compressed.
+        """
+        if self.status not in [TestJob.COMPLETE, TestJob.INCOMPLETE,
+                               TestJob.CANCELED]:
+            return False
+        output_path = os.path.join(self.output_dir, 'output.txt')
+        if not os.path.exists(output_path):
+            return False
+        compress_log(output_path)
+        return True
+
+    def output_size(self):
+        """
+        Returns the size of the job log, without reading it, or None if
+        there is no log.
+        """
+        log_file = self.output_file()
+        if not log_file:
+            return None
+        with log_file:
+            log_file.seek(0, os.SEEK_END)
+            return log_file.tell()
+
+    def output_index(self):
+        """
+        Returns the LogIndex of the job log, brought up to date with the
+        log file, or None if there is no log.
+
+        The index of output.txt (or output.txt.gz once compressed) is kept
+        in output.idx so that only the new part of the log has to be parsed
+        on each call.
+        """
+        log_file = self.output_file()
+        if not log_file:
+            return None
+        index_path = os.path.join(self.output_dir, 'output.idx')
+        output_path = os.path.join(self.output_dir, 'output.txt')
+        persistent = (os.path.exists(output_path) or
+                      os.path.exists(output_path + '.gz'))
+        index = LogIndex.load(index_path) if persistent else LogIndex()
+        with log_file:
+            log_file.seek(0, os.SEEK_END)
+            size = log_file.tell()
+            final = self.status not in [TestJob.SUBMITTED, TestJob.RUNNING,
+                                        TestJob.CANCELING]
+            if index.update(log_file, size, final) and persistent:
+                index.save(index_path)
+        return index
+
     def archived_job_file(self):
         """Checks if the current job's log output file was archived.
         """
@@ -1154,7 +1593,8 @@ class TestJob(RestrictedResource):
         return ("lava.scheduler.job.detail", [self.display_id])
 
     @classmethod
-    def from_json_and_user(cls, json_data, user, health_check=False):
+    def from_json_and_user(cls, json_data, user, health_check=False,
+                           lookups=None):
         """
         Constructs one or more TestJob objects from a JSON data and a submitting
         user. Handles multinode jobs and creates one job for each target
@@ -1162,7 +1602,12 @@ class TestJob(RestrictedResource):
 
         For single node jobs, returns the job object created. For multinode
         jobs, returns an array of test objects.
+
+        lookups can be a SubmissionLookups shared between the submissions of
+        a batch of jobs.
         """
+        if lookups is None:
+            lookups = SubmissionLookups()
         job_data = simplejson.loads(json_data)
         validate_job_data(job_data)
         logger = logging.getLogger(__name__)
@@ -1177,28 +1622,25 @@ class TestJob(RestrictedResource):
             raise JSONDataError("Reserved parameters found in job data %s" %
                                 str([x for x in reserved_params_found]))
 
-        taglist = _get_tag_list(job_data.get('tags', []))
+        taglist = lookups.tag_list(job_data.get('tags', []))
 
         if 'target' in job_data:
             if 'device_type' in job_data:
                 del job_data['device_type']
             device_type = None
             try:
-                target = Device.objects.filter(
-                    ~models.Q(status=Device.RETIRED))\
-                    .get(hostname=job_data['target'])
-            except Device.DoesNotExist:
+                target = lookups.device(job_data['target'])
+            except DevicesUnavailableException:
                 logger.debug("Requested device %s is unavailable." % job_data['target'])
-                raise DevicesUnavailableException(
-                    "Requested device %s is unavailable." % job_data['target'])
-            _check_submit_to_device([target], user)
-            _check_tags_support(_check_tags(taglist, hostname=target), _check_submit_to_device([target], user))
+                raise
+            allow = lookups.check_submit_to_device([target], user)
+            _check_tags_support(lookups.check_tags(taglist, hostname=target), allow)
         elif 'device_type' in job_data:
             target = None
-            device_type = _get_device_type(user, job_data['device_type'])
-            allow = _check_submit_to_device(list(Device.objects.filter(
-                device_type=device_type)), user)
-            _check_tags_support(_check_tags(taglist, device_type=device_type), allow)
+            device_type = lookups.device_type(user, job_data['device_type'])
+            allow = lookups.check_submit_to_device(
+                lookups.devices_of_type(device_type), user)
+            _check_tags_support(lookups.check_tags(taglist, device_type=device_type), allow)
         elif 'device_group' in job_data:
             target = None
             device_type = None
@@ -1206,18 +1648,18 @@ class TestJob(RestrictedResource):
 
             # Check if the requested devices are available for job run.
             for device_group in job_data['device_group']:
-                device_type = _get_device_type(user, device_group['device_type'])
+                device_type = lookups.device_type(user, device_group['device_type'])
                 count = device_group['count']
-                taglist = _get_tag_list(device_group.get('tags', []))
-                allow = _check_submit_to_device(list(Device.objects.filter(
-                    device_type=device_type)), user)
-                _check_tags_support(_check_tags(taglist, device_type=device_type), allow)
+                taglist = lookups.tag_list(device_group.get('tags', []))
+                allow = lookups.check_submit_to_device(
+                    lookups.devices_of_type(device_type), user)
+                _check_tags_support(lookups.check_tags(taglist, device_type=device_type), allow)
                 if device_type in requested_devices:
                     requested_devices[device_type] += count
                 else:
                     requested_devices[device_type] = count
 
-            all_devices = _check_device_types(user)
+            all_devices = lookups.device_types(user)
             for board, count in requested_devices.iteritems():
                 if all_devices.get(board.name, None) and \
                         count <= all_devices[board.name]:
@@ -1241,8 +1683,8 @@ class TestJob(RestrictedResource):
                     "Device type '%s' is unavailable. %s" %
                     (vm_group['host']['device_type'], e))
             role = vm_group['host'].get('role', None)
-            allow = _check_submit_to_device(
-                list(Device.objects.filter(device_type=device_type)), user)
+            allow = lookups.check_submit_to_device(
+                lookups.devices_of_type(device_type), user)
             requested_devices[device_type.name] = (1, role)
 
             # Validate and get the list of vms requested. These are dynamic vms
@@ -1310,11 +1752,10 @@ class TestJob(RestrictedResource):
             if not action['command'].startswith('submit_results'):
                 continue
             stream = action['parameters']['stream']
-            try:
-                bundle_stream = BundleStream.objects.get(pathname=stream)
-            except BundleStream.DoesNotExist:
+            bundle_stream = lookups.bundle_stream(stream)
+            if bundle_stream is None:
                 raise ValueError("stream %s not found" % stream)
-            if not bundle_stream.can_upload(submitter):
+            if not lookups.can_upload(bundle_stream, submitter):
                 raise ValueError(
                     "you cannot submit to the stream %s" % stream)
             # NOTE: this *overwrites* the HTTP:Request.user with the BundleStream.user
@@ -1351,16 +1792,16 @@ class TestJob(RestrictedResource):
             for clients in job_data["device_group"]:
                 device_type = str(clients['device_type'])
                 if device_type not in allowed_devices:
-                    allowed_devices[device_type] = []
+                    group_ids = lookups.group_ids(submitter)
+                    allowed_devices[device_type] = [
+                        hostname for hostname
+                        in lookups.index.devices_of_type(device_type)
+                        if lookups.index.can_submit(hostname, submitter, group_ids)]
                 count = int(clients["count"])
                 if device_type not in device_count:
                     device_count[device_type] = 0
                 device_count[device_type] += count
 
-                device_list = Device.objects.filter(device_type=device_type)
-                for device in device_list:
-                    if device.can_submit(submitter):
-                        allowed_devices[device_type].append(device)
                 if len(allowed_devices[device_type]) < device_count[device_type]:
                     raise DevicesUnavailableException("Not enough devices of type %s are currently "
                                                       "available to user %s"
@@ -1404,10 +1845,9 @@ class TestJob(RestrictedResource):
                     job.save()
 
                     # Add tags as defined per role for each job.
-                    taglist = _get_tag_list(node_json[role][c].get("tags", []))
+                    taglist = lookups.tag_list(node_json[role][c].get("tags", []))
                     if taglist:
-                        for tag in Tag.objects.filter(name__in=taglist):
-                            job.tags.add(tag)
+                        job.tags.add(*taglist)
                     # This save is important though we have one few lines
                     # above, because, in order to add to the tags table we need
                     # a foreign key reference from the jobs table which happens
@@ -1416,6 +1856,7 @@ class TestJob(RestrictedResource):
                     job.save()
                     job_list.append(job)
                     child_id += 1
+            utils.notify_scheduler('submit')
             return job_list
 
         elif 'vm_group' in job_data:
@@ -1481,6 +1922,7 @@ class TestJob(RestrictedResource):
                     # Reset values if already set
                     device_type = None
                     target = None
+            utils.notify_scheduler('submit')
             return job_list
 
         else:
@@ -1495,8 +1937,9 @@ class TestJob(RestrictedResource):
                 health_check=health_check, user=user, group=group,
                 is_public=is_public, priority=priority)
             job.save()
-            for tag in Tag.objects.filter(name__in=taglist):
-                job.tags.add(tag)
+            if taglist:
+                job.tags.add(*taglist)
+            utils.notify_scheduler('submit')
             return job
 
     def _can_admin(self, user):
@@ -1545,6 +1988,7 @@ class TestJob(RestrictedResource):
         if user:
             self.failure_comment = "Canceled by %s" % user.username
         self.save()
+        utils.notify_scheduler('cancel')
 
     def _generate_summary_mail(self):
         domain = '???'
@@ -1720,12 +2164,190 @@ class DeviceStateTransition(models.Model):
     new_state = models.IntegerField(choices=Device.STATUS_CHOICES)
     message = models.TextField(null=True, blank=True)
 
+    class Meta:
+        index_together = [('device', 'created_on')]
+
     def __unicode__(self):
         return u"%s: %s -> %s (%s)" % (self.device.hostname,
                                        self.get_old_state_display(),
                                        self.get_new_state_display(),
                                        self.message)
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(DeviceStateTransition, self).save(*args, **kwargs)
+        if created and self.old_state not in Device.BUSY_STATES:
+            # The device instance is usually saved by the caller next, so
+            # it is kept in step as well as the database row.
+            self.device.last_stable_state = self.old_state
+            Device.objects.filter(pk=self.device_id).update(
+                last_stable_state=self.old_state)
+
     def update_message(self, message):
         self.message = message
         self.save()
+
+
+# Names of the Cortex cores from the CPU part of ARMv7 processors
+CORTEX_PARTS = {
+    0xc05: "Cortex A5",
+    0xc07: "Cortex A7",
+    0xc08: "Cortex A8",
+    0xc09: "Cortex A9",
+    0xc0f: "Cortex A15",
+}
+
+
+def hardware_capabilities(devices):
+    """
+    Summarizes the devices of the hardware context of a test run.
+    :param devices: the hardware_context devices of a bundle test run.
+    :return: dict of processor, models, cores, emulated and flags.
+    """
+    capability = {
+        'processor': None,
+        'models': None,
+        'cores': 0,
+        'emulated': False,
+        'flags': [],
+    }
+    hardware_flags = []
+    hardware_cpu_models = []
+    for device in devices:
+        attributes = device.get('attributes', {})
+        # multiple core cpus have multiple device.cpu entries, each with attributes.
+        if device.get('device_type') == 'device.cpu':
+            model = None
+            for name in 'cpu_type', 'cpu type', 'model name':
+                if name in attributes:
+                    model = attributes[name]
+            cpu_part = attributes.get('cpu_part', attributes.get('CPU part'))
+            if model and model.startswith("ARMv7") and cpu_part:
+                part = CORTEX_PARTS.get(int(cpu_part, 16))
+                if part:
+                    model = "%s - %s" % (model, part)
+            if model:
+                hardware_cpu_models.append(model)
+            for name in 'Features', 'flags', 'cpu flags':
+                if name in attributes:
+                    hardware_flags.append(attributes[name])
+                    break
+            if attributes.get('cpu_type', '').startswith("QEMU"):
+                capability['emulated'] = True
+            capability['cores'] += 1
+        if device.get('device_type') == 'device.board':
+            capability['processor'] = device.get('description')
+    if len(hardware_flags) == 0:
+        hardware_flags.append("None")
+    if len(hardware_cpu_models) == 0:
+        hardware_cpu_models.append("None")
+    capability['models'] = ", ".join(hardware_cpu_models)
+    capability['flags'] = ", ".join(hardware_flags)
+    return capability
+
+
+class DeviceCapabilities(models.Model):
+    """
+    Capabilities of a device, extracted from the hardware context of the
+    result bundle of its most recent health check once it is available.
+    """
+
+    device = models.OneToOneField(
+        Device, primary_key=True, related_name='capabilities')
+    job = models.ForeignKey(
+        TestJob, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+    capabilities_date = models.DateTimeField(null=True, blank=True)
+    processor = models.TextField(null=True, blank=True)
+    cpu_models = models.TextField(null=True, blank=True)
+    cores = models.IntegerField(default=0)
+    emulated = models.BooleanField(default=False)
+    flags = models.TextField(null=True, blank=True)
+
+    def __unicode__(self):
+        return u"%s capabilities" % self.device_id
+
+    @classmethod
+    def is_capability_job(cls, job):
+        """
+        Capabilities come from health checks, or from any job for device
+        types without health check.
+        """
+        device = job.actual_device
+        return (device is not None and job.status == TestJob.COMPLETE and
+                job.health_check == (device.device_type.health_check_job != ""))
+
+    @classmethod
+    def update_from_job(cls, job):
+        """
+        Stores the capabilities found in the results bundle of job, if it is
+        the latest job capabilities are taken from for its device.
+        :return: the DeviceCapabilities, or None if job was not used.
+        """
+        if not cls.is_capability_job(job) or job._results_bundle is None:
+            return None
+        try:
+            current = cls.objects.get(device=job.actual_device)
+        except cls.DoesNotExist:
+            current = cls(device=job.actual_device)
+        else:
+            if current.job_id and current.job_id != job.id and \
+                    current.job.submit_time > job.submit_time:
+                return None
+        current.job = job
+        current.capabilities_date = None
+        capability = {
+            'processor': None, 'models': None, 'cores': 0,
+            'emulated': False, 'flags': None,
+        }
+        bundle = job._results_bundle
+        try:
+            bundle.content.open('rb')
+            try:
+                test_runs = simplejson.load(bundle.content).get('test_runs')
+            finally:
+                bundle.content.close()
+        except (IOError, ValueError, AttributeError):
+            test_runs = None
+        if test_runs and 'hardware_context' in test_runs[0]:
+            capability = hardware_capabilities(
+                test_runs[0]['hardware_context'].get('devices', []))
+            current.capabilities_date = job.end_time
+        current.processor = capability['processor']
+        current.cpu_models = capability['models']
+        current.cores = capability['cores']
+        current.emulated = capability['emulated']
+        current.flags = capability['flags']
+        current.save()
+        return current
+
+    @classmethod
+    def for_device(cls, device):
+        """
+        Returns the capabilities of device, extracting them from its latest
+        health check the first time for devices which have none stored yet.
+        """
+        try:
+            return cls.objects.get(device=device)
+        except cls.DoesNotExist:
+            pass
+        use_health_job = device.device_type.health_check_job != ""
+        try:
+            job = TestJob.objects.filter(
+                actual_device=device,
+                health_check=use_health_job,
+                status=TestJob.COMPLETE).latest('submit_time')
+        except TestJob.DoesNotExist:
+            job = None
+        capabilities = None
+        if job is not None:
+            capabilities = cls.update_from_job(job)
+        if capabilities is None:
+            capabilities = cls.objects.create(device=device)
+        return capabilities
+
+
+@receiver(bundle_was_deserialized)
+def bundle_capabilities_handler(sender, bundle, **kwargs):
+    for job in TestJob.objects.filter(_results_bundle=bundle):
+        DeviceCapabilities.update_from_job(job)
@@ -0,0 +1,161 @@
+# Copyright (C) 2015 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Daily and weekly pass/fail reports of finished jobs.
+
+The number of finished jobs is counted per day, health check and status in
+a single grouped query, and the reports are built from those daily counts.
+Past days whose jobs are all finished are cached, so that a report page
+usually only queries the last few days.
+"""
+
+import datetime
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count, Min
+
+from lava_scheduler_app.models import TestJob
+
+FINISHED = (TestJob.COMPLETE, TestJob.INCOMPLETE,
+            TestJob.CANCELED, TestJob.CANCELING)
+
+# Number of days covered by the reports: ten weeks.
+REPORT_DAYS = 70
+REPORT_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# Days more recent than that are never cached, as they still get new jobs.
+# Older days are cached once none of their jobs is left unfinished.
+FINALIZED_AFTER = 2
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _cache_key(key, field, day):
+    return 'lava_scheduler_app.reports.%s.%s.%s' % (
+        field, key, day.isoformat())
+
+
+def daily_counts(jobs, key, field='start_time', days=REPORT_DAYS, today=None):
+    """
+    Counts the finished jobs of the jobs queryset per day of field.
+    :param jobs: TestJob queryset to count jobs from
+    :param key: unique name of the jobs queryset, for the cache
+    :param field: the TestJob date field jobs are sorted into days by
+    :param days: number of days to count, today included
+    :return: dict of the counts of each day, by (health_check, status)
+    """
+    if today is None:
+        today = datetime.date.today()
+    all_days = [today - datetime.timedelta(n) for n in reversed(range(days))]
+    final = today - datetime.timedelta(FINALIZED_AFTER)
+    keys = dict((day, _cache_key(key, field, day))
+                for day in all_days if day < final)
+    cached = cache.get_many(keys.values())
+    counts = {}
+    missing = []
+    for day in all_days:
+        if keys.get(day) in cached:
+            counts[day] = cached[keys[day]]
+        else:
+            missing.append(day)
+    if not missing:
+        return counts
+
+    qn = connection.ops.quote_name
+    column = '%s.%s' % (qn(TestJob._meta.db_table),
+                        qn(TestJob._meta.get_field(field).column))
+    start = datetime.datetime.combine(missing[0], datetime.time())
+    end = datetime.datetime.combine(
+        today + datetime.timedelta(1), datetime.time())
+    rows = jobs.filter(**{
+        '%s__gte' % field: start,
+        '%s__lt' % field: end,
+        'status__in': FINISHED,
+    }).extra(
+        select={'day': connection.ops.date_trunc_sql('day', column)}
+    ).values('day', 'health_check', 'status').annotate(
+        count=Count('id')).order_by()
+
+    fresh = dict((day, {}) for day in missing)
+    for row in rows:
+        day = _as_date(row['day'])
+        if day in fresh:
+            fresh[day][(row['health_check'], row['status'])] = row['count']
+    counts.update(fresh)
+    cacheable = [day for day in missing if day in keys]
+    if not cacheable:
+        return counts
+    # a job still queued or running would be missing from its day
+    unfinished = jobs.filter(**{
+        '%s__gte' % field: start,
+        '%s__lt' % field: datetime.datetime.combine(final, datetime.time()),
+    }).exclude(status__in=FINISHED).aggregate(day=Min(field))['day']
+    if unfinished is not None:
+        unfinished = _as_date(unfinished)
+    cache.set_many(dict((keys[day], fresh[day]) for day in cacheable
+                        if unfinished is None or day < unfinished),
+                   REPORT_CACHE_TIMEOUT)
+    return counts
+
+
+def count_jobs(counts, days, health_check, statuses):
+    """
+    Returns the number of jobs with one of statuses over days.
+    """
+    return sum(counts.get(day, {}).get((health_check, status), 0)
+               for day in days for status in statuses)
+
+
+def report_buckets(counts, health_check, failure_params, today=None):
+    """
+    Builds the daily report of the last 7 days and the weekly report of
+    the last 10 weeks, oldest first, from daily_counts.
+    :param failure_params: query string selecting the same jobs in the
+    failure report
+    :return: (day_report, week_report)
+    """
+    if today is None:
+        today = datetime.date.today()
+    url = reverse('lava.scheduler.failure_report')
+    failed = [status for status in FINISHED if status != TestJob.COMPLETE]
+
+    def bucket(days):
+        params = 'start_date=%s&end_date=%s&health_check=%d' % (
+            days[0].isoformat(), days[-1].isoformat(), health_check)
+        if failure_params:
+            params = '%s&%s' % (params, failure_params)
+        return {
+            'pass': count_jobs(counts, days, health_check, [TestJob.COMPLETE]),
+            'fail': count_jobs(counts, days, health_check, failed),
+            'date': days[0].strftime('%m-%d'),
+            'failure_url': '%s?%s' % (url, params),
+        }
+
+    day_report = [bucket([today - datetime.timedelta(day)])
+                  for day in reversed(range(7))]
+    week_report = [
+        bucket([today - datetime.timedelta(week * 7 + day)
+                for day in reversed(range(7))])
+        for week in reversed(range(10))]
+    return day_report, week_report
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent whenever something happened which may allow the scheduler daemon to
+# make progress: a job was submitted or cancelled, or a device changed state.
+scheduler_wakeup = Signal(providing_args=['reason'])
@@ -1,6 +1,7 @@
 import os
 import json
 from django.conf import settings
+from django.db import connection
 from django.template import defaultfilters as filters
 from django.utils.safestring import mark_safe
 from django.utils.html import escape
@@ -14,7 +15,6 @@ from lava_scheduler_app.models import (
 )
 from lava.utils.lavatable import LavaTable, LavaView
 from django.contrib.auth.models import User, Group
-from django.db.models import Q
 from datetime import datetime, timedelta
 from markupsafe import escape
 
@@ -49,7 +49,7 @@ class RestrictedIDLinkColumn(IDLinkColumn):
         else:
             device_type = record.requested_device_type
 
-        if len(device_type.devices_visible_to(table.context.get('request').user)) == 0:
+        if not device_type.is_visible_to(table.context.get('request').user):
             return "Unavailable"
         elif record.is_accessible_by(table.context.get('request').user):
             return pklink(record)
@@ -118,8 +118,8 @@ class RestrictedDeviceColumn(tables.Column):
 
 def all_jobs_with_custom_sort():
     jobs = TestJob.objects.select_related(
-        "actual_device",
-        "requested_device",
+        "actual_device__device_type",
+        "requested_device__device_type",
         "requested_device_type",
         "submitter",
         "user",
@@ -130,6 +130,43 @@ def all_jobs_with_custom_sort():
     return jobs.order_by('-submit_time')
 
 
+def with_device_table_data(devices):
+    """
+    Loads everything the device tables show about each device along with
+    the devices, so that rendering a page does not query once per row.
+    """
+    return devices.select_related(
+        "device_type",
+        "worker_host",
+        "user",
+        "group",
+        "current_job__submitter",
+        "last_health_report_job",
+    ).prefetch_related("tags")
+
+
+def with_last_transition_message(devices):
+    """
+    Adds the message of the latest transition of each device as
+    last_transition_message, for OnlineDeviceTable.
+    """
+    qn = connection.ops.quote_name
+    transitions = qn(DeviceStateTransition._meta.db_table)
+    return devices.extra(select={
+        'last_transition_message':
+            'SELECT %(transitions)s.%(message)s FROM %(transitions)s '
+            'WHERE %(transitions)s.%(device)s = %(devices)s.%(hostname)s '
+            'ORDER BY %(transitions)s.%(id)s DESC LIMIT 1' % {
+                'transitions': transitions,
+                'message': qn('message'),
+                'device': qn('device_id'),
+                'devices': qn(Device._meta.db_table),
+                'hostname': qn('hostname'),
+                'id': qn('id'),
+            }
+    })
+
+
 class DateColumn(tables.Column):
 
     def __init__(self, **kw):
@@ -172,7 +209,7 @@ class JobTable(LavaTable):
         else:
             device_type = record.requested_device_type
             retval = mark_safe('<i>%s</i>' % escape(record.requested_device_type.pk))
-        if len(device_type.devices_visible_to(self.context.get('request').user)) == 0:
+        if not device_type.is_visible_to(self.context.get('request').user):
             return "Unavailable"
         return retval
 
@@ -221,11 +258,12 @@ class JobTable(LavaTable):
             'owner_query': "submitter",  # submitter
             'job_status_query': 'status',
         }
-        # fields which can be searched with default __contains queries
+        # fields which can be searched with simple lookups, see TableQuery
         # note the enums cannot be searched this way.
+        # the lookups use the indexes of the job table
         searches = {
-            'id': 'contains',
-            'description': 'contains'
+            'id': 'exact',
+            'description': 'startswith'
         }
         # dedicated time-based search fields
         times = {
@@ -233,6 +271,8 @@ class JobTable(LavaTable):
             'end_time': 'hours',
             # 'duration': 'minutes' FIXME: needs a function call
         }
+        # keys of the job list pages, see lava.utils.keyset
+        keyset = ('-submit_time', '-id')
 
 
 class IndexJobTable(JobTable):
@@ -415,11 +455,7 @@ class DeviceTypeTable(LavaTable):
         return record.restricted if record.restricted > 0 else ""
 
     def render_queue(self, record):
-        count = TestJob.objects.filter(
-            Q(status=TestJob.SUBMITTED),
-            Q(requested_device_type=record.name) |
-            Q(requested_device__in=Device.objects.filter(device_type=record.name))).count()
-        return count if count > 0 else ""
+        return record.queue if record.queue > 0 else ""
 
     name = IDLinkColumn("name")
     idle = tables.Column()
@@ -625,6 +661,7 @@ class DeviceTransitionTable(LavaTable):
         searches = {}
         queries = {}
         times = {}
+        keyset = ('-created_on', '-id')
 
 
 class QueueJobsTable(JobTable):
@@ -678,10 +715,10 @@ class OnlineDeviceTable(DeviceTable):
         self.length = 25
 
     def render_status(self, record):
-        t = DeviceStateTransition.objects.filter(device=record).order_by('-id')
+        # see with_last_transition_message
         status = Device.STATUS_CHOICES[record.status][1]
-        if t:
-            return "%s (reason: %s)" % (status, t[0].message)
+        if record.last_transition_message:
+            return "%s (reason: %s)" % (status, record.last_transition_message)
         else:
             return status
 
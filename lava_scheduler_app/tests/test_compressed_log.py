@@ -0,0 +1,42 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django_testscenarios.ubertest import TestCase
+
+from lava_scheduler_app.compressed_log import (
+    CompressedLogFile,
+    compress_log,
+)
+
+
+class CompressedLogTest(TestCase):
+
+    def setUp(self):
+        super(CompressedLogTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.content = ''.join('line %d of the log\n' % i for i in range(1000))
+        path = os.path.join(self.tmpdir, 'output.txt')
+        with open(path, 'w') as f:
+            f.write(self.content)
+        self.gz_path = compress_log(path, block_size=100)
+        self.assertFalse(os.path.exists(path))
+
+    def test_is_plain_gzip(self):
+        with gzip.open(self.gz_path) as f:
+            self.assertEqual(self.content, f.read())
+
+    def test_read_at_offset(self):
+        with CompressedLogFile(self.gz_path) as log_file:
+            self.assertEqual(len(self.content), log_file.size)
+            log_file.seek(1234)
+            self.assertEqual(self.content[1234:1734], log_file.read(500))
+            self.assertEqual(1734, log_file.tell())
+            log_file.seek(-10, os.SEEK_END)
+            self.assertEqual(self.content[-10:], log_file.read())
+
+    def test_lines(self):
+        with CompressedLogFile(self.gz_path) as log_file:
+            self.assertEqual(self.content.splitlines(True), list(log_file))
@@ -0,0 +1,33 @@
+from django.core.cache import cache
+
+from lava_scheduler_app.counters import compute_counters, get_counters
+from lava_scheduler_app.models import Device, TestJob
+from lava_scheduler_app.tests.test_submission import TestCaseWithFactory
+
+
+class TestCounters(TestCaseWithFactory):
+
+    def setUp(self):
+        super(TestCounters, self).setUp()
+        cache.clear()
+
+    def test_device_and_queue_counters(self):
+        panda = self.factory.ensure_device_type(name='panda')
+        self.factory.make_device(device_type=panda, hostname='panda02',
+                                 status=Device.OFFLINE)
+        self.factory.make_device(device_type=panda, hostname='panda03',
+                                 status=Device.RETIRED)
+        self.factory.make_testjob(
+            definition=self.factory.make_job_json(device_type='panda'))
+        with self.assertNumQueries(3):
+            counters = compute_counters()
+        self.assertEqual(
+            {'idle': 1, 'offline': 1, 'busy': 0, 'restricted': 0, 'queue': 1},
+            counters['device_types']['panda'])
+        self.assertEqual(1, counters['num_online'])
+        self.assertEqual(2, counters['num_not_retired'])
+        self.assertEqual(0, counters['hc_total'])
+
+        get_counters()
+        with self.assertNumQueries(0):
+            get_counters()
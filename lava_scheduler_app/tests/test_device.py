@@ -1,4 +1,8 @@
-from lava_scheduler_app.models import Device, DeviceType
+from lava_scheduler_app.models import Device, DeviceType, hardware_capabilities
+from lava_scheduler_app.tables import (
+    with_device_table_data,
+    with_last_transition_message,
+)
 from django_testscenarios.ubertest import TestCase
 from django.contrib.auth.models import Group, Permission, User
 
@@ -79,3 +83,91 @@ class DeviceTest(TestCaseWithFactory):
         device.put_into_maintenance_mode(None, None)
 
         self.assertEqual(device.status, Device.OFFLINING, "should be offlining")
+
+    def test_hidden_type_visibility(self):
+        hidden = DeviceType(name="hidden", owners_only=True, health_check_job='')
+        hidden.save()
+        device = Device(device_type=hidden, hostname='hidden3', status=Device.IDLE)
+        user = self.factory.make_user()
+        device.user = user
+        device.save()
+        user2 = self.factory.make_user()
+        self.assertTrue(hidden.is_visible_to(user))
+        self.assertFalse(hidden.is_visible_to(user2))
+        self.assertFalse(hidden.is_visible_to(None))
+        self.assertEqual(
+            ['hidden'],
+            list(DeviceType.objects.visible_to(user).values_list('name', flat=True)))
+
+        # the cached visibility follows ownership and group changes
+        group = Group.objects.create(name='hidden-owners')
+        device.user = None
+        device.group = group
+        device.save()
+        self.assertFalse(hidden.is_visible_to(user))
+        user2.groups.add(group)
+        self.assertTrue(hidden.is_visible_to(user2))
+        self.assertTrue(device.is_visible_to(user2))
+
+    def test_previous_state_and_timeline(self):
+        foo = DeviceType(name='foo')
+        foo.save()
+        device = Device(device_type=foo, hostname='foo02', status=Device.OFFLINE)
+        device.save()
+        self.assertEqual(device.previous_state(), None)
+        device.state_transition_to(Device.IDLE)
+        device.state_transition_to(Device.RESERVED)
+        device.state_transition_to(Device.RUNNING)
+        self.assertEqual(device.previous_state(), Device.IDLE)
+        self.assertEqual(Device.objects.get(pk='foo02').previous_state(),
+                         Device.IDLE)
+        device.state_transition_to(Device.OFFLINING)
+        device.state_transition_to(Device.OFFLINE)
+        self.assertEqual(device.previous_state(), Device.IDLE)
+        device.state_transition_to(Device.OFFLINE)
+        self.assertEqual(device.previous_state(), Device.OFFLINE)
+        self.assertEqual(
+            [Device.OFFLINE, Device.IDLE, Device.RESERVED, Device.RUNNING,
+             Device.OFFLINING, Device.OFFLINE],
+            [state for state, since, until in device.state_timeline()])
+        self.assertEqual(None, device.state_timeline()[-1][2])
+
+    def test_hardware_capabilities(self):
+        devices = [
+            {'device_type': 'device.cpu',
+             'attributes': {'cpu_type': 'ARMv7 Processor rev 10 (v7l)',
+                            'cpu_part': '0xc09', 'Features': 'neon vfp'}},
+            {'device_type': 'device.cpu',
+             'attributes': {'cpu_type': 'ARMv7 Processor rev 10 (v7l)',
+                            'cpu_part': '0xc09', 'Features': 'neon vfp'}},
+            {'device_type': 'device.board', 'description': 'Panda',
+             'attributes': {}},
+        ]
+        capability = hardware_capabilities(devices)
+        self.assertEqual(capability['processor'], 'Panda')
+        self.assertEqual(capability['cores'], 2)
+        self.assertFalse(capability['emulated'])
+        self.assertEqual(
+            capability['models'],
+            'ARMv7 Processor rev 10 (v7l) - Cortex A9, '
+            'ARMv7 Processor rev 10 (v7l) - Cortex A9')
+        self.assertEqual(capability['flags'], 'neon vfp, neon vfp')
+        self.assertEqual(hardware_capabilities([])['models'], 'None')
+
+    def test_device_table_data(self):
+        foo = DeviceType(name='foo')
+        foo.save()
+        for hostname in ['foo01', 'foo02', 'foo03']:
+            Device(device_type=foo, hostname=hostname,
+                   status=Device.IDLE).save()
+        device = Device.objects.get(hostname='foo02')
+        device.put_into_maintenance_mode(None, 'first')
+        device.put_into_online_mode(None, 'second')
+        devices = with_last_transition_message(
+            with_device_table_data(Device.objects.order_by('hostname')))
+        # the devices and their tags, whatever the number of devices
+        with self.assertNumQueries(2):
+            messages = [(device.device_type.name, device.last_transition_message)
+                        for device in devices]
+        self.assertEqual(
+            [('foo', None), ('foo', 'second'), ('foo', None)], messages)
@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import tempfile
+import xmlrpclib
+
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from django.test.utils import override_settings
+from django_testscenarios.ubertest import TestCase
+
+from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.tests.test_submission import (
+    TestCaseWithFactory,
+    TestTransport,
+)
+from lava_scheduler_app.views import _parse_range
+
+LOG = ''.join('line %d of the log\n' % i for i in range(100))
+
+
+class TestLogViews(TestCaseWithFactory):
+
+    def setUp(self):
+        super(TestLogViews, self).setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        user = self.factory.make_user()
+        user.set_password('test')
+        user.save()
+        self.user = user
+        self.job = self.factory.make_testjob(submitter=user)
+        self.client = Client()
+        self.assertTrue(self.client.login(username=user.username,
+                                          password='test'))
+
+    def write_log(self, content):
+        os.makedirs(self.job.output_dir)
+        with open(os.path.join(self.job.output_dir, 'output.txt'), 'w') as f:
+            f.write(content)
+
+    @override_settings(LOG_SIZE_LIMIT=1)
+    def test_oversized_log_is_not_polled(self):
+        self.job.status = TestJob.RUNNING
+        self.job.save()
+        self.write_log('line of the log\n' * 70000)
+        pk = {'pk': self.job.pk}
+        for view in ('lava.scheduler.job.detail', 'lava.scheduler.job.log_file'):
+            response = self.client.get(reverse(view, kwargs=pk))
+            self.assertEqual(200, response.status_code)
+            self.assertTrue(response.context['size_warning'])
+            self.assertNotIn(reverse('lava.scheduler.job.log_tail', kwargs=pk),
+                             response.content)
+        # the log is not indexed either
+        self.assertFalse(os.path.exists(
+            os.path.join(self.job.output_dir, 'output.idx')))
+
+    def test_log_tail(self):
+        self.write_log(LOG)
+        url = reverse('lava.scheduler.job.log_tail', kwargs={'pk': self.job.pk})
+        # a queued job is not finished yet
+        data = json.loads(self.client.get(url).content)
+        self.assertFalse(data['finished'])
+        self.assertEqual(len(LOG), data['size'])
+        self.job.status = TestJob.COMPLETE
+        self.job.save()
+        data = json.loads(self.client.get(url, {'cursor': data['cursor']}).content)
+        self.assertTrue(data['finished'])
+        self.assertEqual(len(LOG), data['size'])
+        self.assertEqual(400, self.client.get(url, {'start': -1}).status_code)
+
+    def get_plain(self, byte_range=None):
+        headers = {'HTTP_RANGE': byte_range} if byte_range else {}
+        return self.client.get(
+            reverse('lava.scheduler.job.log_file.plain',
+                    kwargs={'pk': self.job.pk}), **headers)
+
+    def assertRange(self, byte_range, start, end):
+        response = self.get_plain(byte_range)
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(LOG[start:end], ''.join(response.streaming_content))
+        self.assertEqual('bytes %d-%d/%d' % (start, end - 1, len(LOG)),
+                         response['Content-Range'])
+        self.assertEqual(str(end - start), response['Content-Length'])
+
+    def test_plain_log_ranges(self):
+        self.write_log(LOG)
+        response = self.get_plain()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(LOG, ''.join(response.streaming_content))
+        self.assertEqual('bytes', response['Accept-Ranges'])
+        self.assertRange('bytes=10-19', 10, 20)
+        self.assertRange('bytes=10-100000', 10, len(LOG))
+        self.assertRange('bytes=-10', len(LOG) - 10, len(LOG))
+        self.assertRange('bytes=100-', 100, len(LOG))
+        for byte_range in ('bytes=%d-' % len(LOG), 'bytes=-0'):
+            response = self.get_plain(byte_range)
+            self.assertEqual(416, response.status_code)
+            self.assertEqual('bytes */%d' % len(LOG), response['Content-Range'])
+        # malformed and multiple ranges are ignored
+        for byte_range in ('bytes=a-', 'bytes=20-10', 'bytes=0-1,5-6',
+                           'lines=1-2'):
+            self.assertEqual(200, self.get_plain(byte_range).status_code)
+
+    def test_plain_empty_log(self):
+        self.write_log('')
+        self.assertEqual(200, self.get_plain().status_code)
+        for byte_range in ('bytes=0-', 'bytes=-10'):
+            response = self.get_plain(byte_range)
+            self.assertEqual(416, response.status_code)
+            self.assertEqual('bytes */0', response['Content-Range'])
+
+    def test_job_output_offset_and_length(self):
+        self.write_log(LOG)
+        server = xmlrpclib.ServerProxy(
+            'http://localhost/RPC2/',
+            transport=TestTransport(user=self.user.username, password='test'))
+        self.assertEqual(LOG, server.scheduler.job_output(self.job.pk).data)
+        self.assertEqual(LOG[100:],
+                         server.scheduler.job_output(self.job.pk, 100).data)
+        self.assertEqual(LOG[100:150],
+                         server.scheduler.job_output(self.job.pk, 100, 50).data)
+        self.assertEqual('', server.scheduler.job_output(
+            self.job.pk, len(LOG) + 10, 50).data)
+        try:
+            server.scheduler.job_output(self.job.pk, -1)
+        except xmlrpclib.Fault as f:
+            self.assertEqual(400, f.faultCode)
+        else:
+            self.fail("fault not raised")
+
+
+class TestParseRange(TestCase):
+
+    def test_ranges(self):
+        self.assertEqual((10, 20), _parse_range('bytes=10-19', 100))
+        self.assertEqual((90, 100), _parse_range('bytes=-10', 100))
+        self.assertEqual((0, 100), _parse_range('bytes=-1000', 100))
+        self.assertEqual((90, 100), _parse_range('bytes=90-', 100))
+        self.assertEqual(None, _parse_range(None, 100))
+        self.assertEqual(None, _parse_range('bytes=-', 100))
+        self.assertEqual(None, _parse_range('bytes=20-10', 100))
+        self.assertEqual(None, _parse_range('bytes=200-100', 100))
+        self.assertRaises(ValueError, _parse_range, 'bytes=100-', 100)
+        self.assertRaises(ValueError, _parse_range, 'bytes=-0', 100)
+        self.assertRaises(ValueError, _parse_range, 'bytes=0-', 0)
+        self.assertRaises(ValueError, _parse_range, 'bytes=-10', 0)
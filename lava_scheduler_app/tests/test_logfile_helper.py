@@ -0,0 +1,83 @@
+import StringIO
+
+from django_testscenarios.ubertest import TestCase
+
+from lava_scheduler_app.logfile_helper import (
+    LogClassifier,
+    LogIndex,
+    formatLogFile,
+    getDispatcherLogMessages,
+    message_levels,
+)
+
+LOG = (
+    "console output\r\n"
+    "<LAVA_DISPATCHER>2015-01-01 10:00:00 AM INFO: [ACTION-B] deploy is started\n"
+    "<LAVA_DISPATCHER>2015-01-01 10:00:01 AM DEBUG: downloading image\n"
+    "more console output\n"
+    "Traceback (most recent call last):\n"
+    "  File \"foo.py\", line 1, in <module>\n"
+    "CriticalError: Infrastructure Error: image not found\n"
+    "<LAVA_DISPATCHER>2015-01-01 10:00:02 AM ERROR: image not found\n"
+)
+
+
+class LogClassifierTest(TestCase):
+
+    def test_single_pass_results(self):
+        classifier = LogClassifier(keep_content=True)
+        classifier.classify(StringIO.StringIO(LOG))
+        self.assertEqual(
+            [('console', 1), ('log', 2), ('console', 1), ('traceback', 3),
+             ('log', 1)],
+            [(section[0], section[3]) for section in classifier.sections])
+        self.assertEqual(u'console output\n',
+                         classifier.formatted_sections()[0][2])
+        self.assertEqual(
+            [('INFO', u'10:00:00 AM INFO: [ACTION-B] deploy is started', 'action'),
+             ('DEBUG', u'10:00:01 AM DEBUG: downloading image', ''),
+             ('ERROR', u'10:00:02 AM ERROR: image not found', '')],
+            classifier.messages)
+        self.assertEqual(["Infrastructure Error: image not found\n"],
+                         classifier.errors)
+
+    def test_resume_from_section_type(self):
+        offset = LOG.index("  File")
+        first = LogClassifier()
+        self.assertEqual(offset, first.classify(
+            StringIO.StringIO(LOG[:offset]), final=False))
+        self.assertEqual('traceback', first.section_type)
+        classifier = LogClassifier(keep_content=True,
+                                   section_type=first.section_type)
+        classifier.classify(StringIO.StringIO(LOG[offset:]), offset)
+        self.assertEqual(
+            [('traceback', 2), ('log', 1)],
+            [(section[0], section[3]) for section in classifier.sections])
+
+
+class LogIndexTest(TestCase):
+
+    def test_index_matches_full_parse(self):
+        index = LogIndex()
+        index.update(StringIO.StringIO(LOG), len(LOG), final=True)
+        self.assertEqual(formatLogFile(StringIO.StringIO(LOG)),
+                         index.read_sections(StringIO.StringIO(LOG)))
+        messages = index.read_messages(StringIO.StringIO(LOG))
+        self.assertEqual(
+            getDispatcherLogMessages(StringIO.StringIO(LOG)), messages)
+        self.assertEqual(["Infrastructure Error: image not found\n"],
+                         index.errors)
+        self.assertEqual(1, dict(message_levels(messages))['ERROR'])
+        # the messages are read from the log, not kept in the index
+        self.assertEqual([], index.messages)
+
+    def test_incremental_update(self):
+        index = LogIndex()
+        # stop in the middle of the traceback, with a partial last line
+        partial = LOG[:LOG.index("  File") + 10]
+        index.update(StringIO.StringIO(partial), len(partial))
+        self.assertEqual(LOG.index("  File"), index.offset)
+        index.update(StringIO.StringIO(LOG), len(LOG))
+        self.assertEqual(len(LOG), index.offset)
+        self.assertEqual(formatLogFile(StringIO.StringIO(LOG)),
+                         index.read_sections(StringIO.StringIO(LOG)))
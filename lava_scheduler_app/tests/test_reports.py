@@ -0,0 +1,64 @@
+import datetime
+
+from django.core.cache import cache
+
+from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.reports import (
+    count_jobs,
+    daily_counts,
+    report_buckets,
+)
+from lava_scheduler_app.tests.test_submission import TestCaseWithFactory
+
+
+class TestReports(TestCaseWithFactory):
+
+    def setUp(self):
+        super(TestReports, self).setUp()
+        cache.clear()
+
+    def make_finished_job(self, status, days_ago, health_check=False):
+        job = self.factory.make_testjob()
+        job.status = status
+        job.health_check = health_check
+        job.start_time = datetime.datetime.now() - datetime.timedelta(days_ago)
+        job.save()
+        return job
+
+    def test_daily_and_weekly_buckets(self):
+        self.make_finished_job(TestJob.COMPLETE, 0)
+        self.make_finished_job(TestJob.INCOMPLETE, 0)
+        self.make_finished_job(TestJob.COMPLETE, 10)
+        self.make_finished_job(TestJob.CANCELED, 10, health_check=True)
+        today = datetime.datetime.now().date()
+        with self.assertNumQueries(2):
+            counts = daily_counts(TestJob.objects.all(), 'test')
+        day_report, week_report = report_buckets(counts, False, '', today)
+        self.assertEqual(7, len(day_report))
+        self.assertEqual(10, len(week_report))
+        self.assertEqual((1, 1), (day_report[-1]['pass'], day_report[-1]['fail']))
+        self.assertEqual((1, 0), (week_report[-2]['pass'], week_report[-2]['fail']))
+        self.assertEqual(1, count_jobs(counts, counts.keys(), True,
+                                       [TestJob.CANCELED]))
+
+        # days old enough are not counted again
+        with self.assertNumQueries(1):
+            self.assertEqual(counts, daily_counts(TestJob.objects.all(), 'test'))
+
+    def test_days_with_unfinished_jobs_are_not_cached(self):
+        job = self.factory.make_testjob()
+        job.health_check = True
+        job.submit_time = datetime.datetime.now() - datetime.timedelta(5)
+        job.save()
+        today = datetime.datetime.now().date()
+        day = today - datetime.timedelta(5)
+        counts = daily_counts(TestJob.objects.all(), 'test', field='submit_time')
+        self.assertEqual(0, count_jobs(counts, [day], True, [TestJob.COMPLETE]))
+        # the health check finishes days after it was submitted
+        job.status = TestJob.COMPLETE
+        job.save()
+        counts = daily_counts(TestJob.objects.all(), 'test', field='submit_time')
+        self.assertEqual(1, count_jobs(counts, [day], True, [TestJob.COMPLETE]))
+        with self.assertNumQueries(1):
+            self.assertEqual(counts, daily_counts(TestJob.objects.all(), 'test',
+                                                  field='submit_time'))
@@ -10,12 +10,14 @@ from dashboard_app.models import BundleStream
 from django.contrib.auth.models import Group, Permission, User
 from django.test import TransactionTestCase
 from django.test.client import Client
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django_testscenarios.ubertest import TestCase
 
 from linaro_django_xmlrpc.models import AuthToken
 
 from lava_scheduler_app.models import (
+    CapabilityIndex,
     Device,
     DeviceType,
     JSONDataError,
@@ -156,6 +158,9 @@ class TestCaseWithFactory(TestCase):
 
     def setUp(self):
         TestCase.setUp(self)
+        # the cached capability index and visibility outlive the database
+        # of each test
+        cache.clear()
         self.factory = ModelFactory()
 
 
@@ -254,6 +259,26 @@ class TestTestJob(TestCaseWithFactory):
         self.assertEqual(
             set(tag.name for tag in job.tags.all()), {'tag'})
 
+    def test_capability_index(self):
+        device_type = self.factory.ensure_device_type(name='panda')
+        tag = self.factory.ensure_tag('tag')
+        self.factory.make_device(device_type=device_type, hostname="panda1", tags=[tag])
+        retired = self.factory.make_device(device_type=device_type, hostname="panda2",
+                                           tags=[tag], status=Device.RETIRED)
+        index = CapabilityIndex.get()
+        self.assertEqual(['panda1'], index.devices_with_tags([tag.pk], device_type=device_type))
+        self.assertNotIn('panda2', index.devices_of_type(device_type))
+        self.assertEqual({'panda': 1}, index.device_type_counts())
+        with self.assertNumQueries(0):
+            CapabilityIndex.get()
+        retired.status = Device.IDLE
+        retired.save()
+        index = CapabilityIndex.get()
+        self.assertEqual(
+            ['panda1', 'panda2'],
+            sorted(index.devices_with_tags([tag.pk], device_type=device_type)))
+        self.assertEqual({'panda': 2}, index.device_type_counts())
+
     def test_from_json_and_user_sets_multiple_tag_from_device_tags(self):
         device_type = self.factory.ensure_device_type(name='panda')
         tag_list = [
@@ -718,6 +743,21 @@ class TestSchedulerAPI(TestCaseWithFactory):
         job = TestJob.objects.get(id=job_id)
         self.assertEqual(definition, job.definition)
 
+    def test_submit_jobs_reports_each_job(self):
+        user = User.objects.create_user('test', 'e@mail.invalid', 'test')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_testjob'))
+        user.save()
+        server = self.server_proxy('test', 'test')
+        definition = self.factory.make_job_json()
+        results = server.scheduler.submit_jobs([definition, "{", 1, definition])
+        self.assertEqual(4, len(results))
+        self.assertEqual(400, results[1]['code'])
+        self.assertEqual(400, results[2]['code'])
+        for result in results[0], results[3]:
+            job = TestJob.objects.get(id=result['id'])
+            self.assertEqual(definition, job.definition)
+
     def test_cancel_job_rejects_anonymous(self):
         job = self.factory.make_testjob()
         server = self.server_proxy()
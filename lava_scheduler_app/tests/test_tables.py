@@ -2,6 +2,7 @@ import logging
 import sys
 from django.contrib.auth.models import Group, Permission, User
 from django.test import TransactionTestCase
+from django.core.urlresolvers import reverse
 from django.test.client import Client
 from django_testscenarios.ubertest import TestCase
 from lava_scheduler_app.models import (
@@ -9,8 +10,10 @@ from lava_scheduler_app.models import (
     DeviceType,
     TestJob,
 )
-from lava_scheduler_app.views import filter_device_types
-from lava.utils.lavatable import LavaTable, LavaView
+from lava_scheduler_app.views import filter_device_types, JobTableView
+from lava_scheduler_app.tests.test_submission import TestCaseWithFactory
+from lava.utils.lavatable import LavaTable, LavaView, TableQuery
+from lava.utils.keyset import KeysetPaginator
 from lava_scheduler_app.tables import (
     JobTable,
     DeviceTable,
@@ -132,6 +135,82 @@ class TestPrefixJobTable(TestCase):
         self.assertEqual(table.prepare_times_data(view), {self.prefix: ['End time (hours)', 'Submit time (hours)']})
 
 
+class FakeRequest(object):
+
+    def __init__(self, user, **params):
+        self.user = user
+        self.GET = params
+
+
+class TestTableQuery(TestCaseWithFactory):
+
+    def search(self, **params):
+        request = FakeRequest(self.factory.make_user(), **params)
+        view = JobTableView(request, model=TestJob, table_class=TestJobTable)
+        return sorted(job.description for job in view.get_table_data()), view.terms
+
+    def test_compiled_once(self):
+        self.assertIs(TableQuery.compile(TestJobTable, TestJob),
+                      TableQuery.compile(TestJobTable, TestJob))
+
+    def test_searches(self):
+        smoke = self.factory.make_testjob(self.factory.make_job_json(job_name='panda-smoke'))
+        self.factory.make_testjob(self.factory.make_job_json(job_name='beagle-panda'))
+        self.assertEqual(['panda-smoke'], self.search(search='panda')[0])
+        self.assertEqual(['panda-smoke'], self.search(id=str(smoke.id))[0])
+        # not an id, so not a search of the id
+        self.assertEqual(2, len(self.search(id='smoke')[0]))
+        self.assertEqual(['beagle-panda'], self.search(description='beagle')[0])
+        self.assertEqual([], self.search(description='beagle', search='panda')[0])
+        jobs, terms = self.search(submit_time='1')
+        self.assertEqual(['beagle-panda', 'panda-smoke'], jobs)
+        self.assertEqual('submit_time within 1 hours', terms['submit_time'])
+        # invalid durations do not filter
+        self.assertEqual(2, len(self.search(end_time='soon')[0]))
+
+
+class TestKeysetPagination(TestCaseWithFactory):
+
+    def test_pages(self):
+        jobs = [self.factory.make_testjob() for job in range(5)]
+        jobs.sort(key=lambda job: (job.submit_time, job.id), reverse=True)
+        paginator = KeysetPaginator(TestJob.objects.all(), ('-submit_time', '-id'), 2)
+        page = paginator.page(1)
+        pages = [[job.id for job in page.object_list]]
+        while page.has_next():
+            page = paginator.page(page.next_page_number())
+            pages.append([job.id for job in page.object_list])
+        self.assertEqual([[job.id for job in jobs[index:index + 2]] for index in (0, 2, 4)], pages)
+        self.assertEqual((3, 3, False), (page.number, paginator.num_pages, paginator.estimated))
+        self.assertEqual('2:b%d' % jobs[4].id, page.previous_page_number())
+        page = paginator.page(page.previous_page_number())
+        self.assertEqual([jobs[2].id, jobs[3].id], [job.id for job in page.object_list])
+        self.assertTrue(page.has_previous())
+        self.assertEqual(1, page.previous_page_number())
+        # unknown rows lead back to the first page
+        self.assertEqual(1, paginator.page('4:a%d' % (jobs[0].id + 100)).number)
+
+    def test_view_follows_next_page(self):
+        jobs = [self.factory.make_testjob() for job in range(5)]
+        jobs.sort(key=lambda job: (job.submit_time, job.id), reverse=True)
+        client = Client()
+        response = client.get(reverse('lava.scheduler.job.list'), {'length': 2})
+        pages = []
+        while True:
+            table = response.context['alljobs_table']
+            pages.append((table.page.number, [job.id for job in table.page.object_list]))
+            if not table.page.has_next():
+                break
+            # the link of the Next button keeps the keyset token
+            token = table.page.next_page_number()
+            self.assertIn('page=%s' % token.replace(':', '%3A'), response.content)
+            response = client.get(reverse('lava.scheduler.job.list'),
+                                  {'length': 2, 'page': token})
+        self.assertEqual([(1, [jobs[0].id, jobs[1].id]),
+                          (2, [jobs[2].id, jobs[3].id]),
+                          (3, [jobs[4].id])], pages)
+
+
 class TestForDeviceTable(TestCase):
     """
     Device table tests using LavaTable and LavaView
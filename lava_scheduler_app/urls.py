@@ -51,6 +51,9 @@ urlpatterns = patterns(
     url(r'^device/(?P<pk>[-_a-zA-Z0-9.]+)/online$',
         'device_online',
         name='lava.scheduler.device.online'),
+    url(r'^device/(?P<pk>[-_a-zA-Z0-9.]+)/timeline$',
+        'device_timeline',
+        name='lava.scheduler.device.timeline'),
     url(r'^labhealth/$',
         'lab_health',
         name='lava.scheduler.labhealth'),
@@ -114,6 +117,9 @@ urlpatterns = patterns(
     url(r'^job/(?P<pk>[0-9]+)/full_log_incremental$',
         'job_full_log_incremental',
         name='lava.scheduler.job.full_log_incremental'),
+    url(r'^job/(?P<pk>[0-9]+)/log_tail$',
+        'job_log_tail',
+        name='lava.scheduler.job.log_tail'),
     url(r'^get-remote-json',
         'get_remote_json',
         name='lava.scheduler.get_remote_json'),
@@ -33,9 +33,14 @@ from collections import OrderedDict
 
 from django.contrib.sites.models import Site
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 
 from lava_server.settings.getsettings import Settings
 from lava_server.settings.config_file import ConfigFile
+from lava_scheduler_app.signals import scheduler_wakeup
+
+# PostgreSQL LISTEN/NOTIFY channel used to wake up the scheduler daemon.
+SCHEDULER_NOTIFY_CHANNEL = 'lava_scheduler'
 
 
 def get_fqdn():
@@ -448,6 +453,22 @@ def last_scheduler_tick():
     return __last_scheduler_tick
 
 
+def notify_scheduler(reason=None):
+    """Wakes up the scheduler daemon so that it runs a scheduling pass now
+    instead of waiting for its next poll.
+
+    On PostgreSQL this sends a NOTIFY on SCHEDULER_NOTIFY_CHANNEL, which is
+    only delivered once the current transaction commits, so the daemon sees
+    the change which caused it. The scheduler_wakeup signal is sent as well
+    for in-process listeners.
+    """
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_notify(%s, %s)",
+                       [SCHEDULER_NOTIFY_CHANNEL, reason or ''])
+    scheduler_wakeup.send(sender=None, reason=reason)
+
+
 def process_repeat_parameter(json_jobdata):
     new_json = {}
     new_actions = []
@@ -1,14 +1,13 @@
-from collections import defaultdict
 import copy
-import logging
 import os
 import simplejson
 import StringIO
 import datetime
+import time
 import urllib2
-from dateutil.relativedelta import relativedelta
 from django import forms
 
+from django.core import signing
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.db.models import Count
@@ -18,6 +17,7 @@ from django.http import (
     HttpResponseBadRequest,
     HttpResponseForbidden,
     HttpResponseNotAllowed,
+    StreamingHttpResponse,
 )
 from django.shortcuts import (
     get_object_or_404,
@@ -35,7 +35,6 @@ from django.db.models import Q
 from django_tables2 import (
     Column,
     TemplateColumn,
-    RequestConfig,
 )
 
 from lava_server.views import index as lava_index
@@ -45,12 +44,14 @@ from lava_server.bread_crumbs import (
 )
 
 from lava_scheduler_app.logfile_helper import (
+    LogClassifier,
     formatLogFile,
-    getDispatcherErrors,
-    getDispatcherLogMessages
+    getDispatcherLogMessages,
+    message_levels,
 )
 from lava_scheduler_app.models import (
     Device,
+    DeviceCapabilities,
     DeviceType,
     DeviceStateTransition,
     TestJob,
@@ -61,9 +62,15 @@ from lava_scheduler_app.models import (
     Worker,
 )
 from lava_scheduler_app import utils
+from lava_scheduler_app.counters import device_type_rows, get_counters
+from lava_scheduler_app.reports import (
+    count_jobs,
+    daily_counts,
+    report_buckets,
+)
 from dashboard_app.models import BundleStream
 
-from lava.utils.lavatable import LavaTable, LavaView
+from lava.utils.lavatable import LavaRequestConfig, LavaTable, LavaView
 
 from lava_scheduler_app.template_helper import expand_template
 from lava_scheduler_app.job_templates import (
@@ -90,6 +97,8 @@ from lava_scheduler_app.tables import (
     RestrictedIDLinkColumn,
     pklink,
     all_jobs_with_custom_sort,
+    with_device_table_data,
+    with_last_transition_message,
     IndexJobTable,
     FailedJobTable,
     DeviceTable,
@@ -224,6 +233,17 @@ class FailureTableView(JobTableView):
         if device:
             jobs = jobs.filter(actual_device__hostname=device)
 
+        start_date = self.request.GET.get('start_date', None)
+        end_date = self.request.GET.get('end_date', None)
+        if start_date and end_date:
+            try:
+                start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+                end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d')
+            except ValueError:
+                raise Http404("Invalid date")
+            jobs = jobs.filter(start_time__gte=start_date,
+                               start_time__lt=end_date + datetime.timedelta(1))
+
         start = self.request.GET.get('start', None)
         if start:
             now = datetime.datetime.now()
@@ -242,26 +262,6 @@ class WorkerView(JobTableView):
         return Worker.objects.filter(display=True).order_by('hostname')
 
 
-def health_jobs_in_hr(hr=-24):
-    return TestJob.objects.values('actual_device').filter(
-        health_check=True, start_time__gte=(datetime.datetime.now() +
-                                            relativedelta(hours=hr))).\
-        exclude(status__in=[TestJob.SUBMITTED, TestJob.RUNNING]).distinct()
-
-
-def _online_total():
-    """ returns a tuple of (num_online, num_not_retired) """
-    r = Device.objects.all().values('status').annotate(count=Count('status'))
-    offline = total = 0
-    for res in r:
-        if res['status'] in [Device.OFFLINE, Device.OFFLINING]:
-            offline += res['count']
-        if res['status'] != Device.RETIRED:
-            total += res['count']
-
-    return total - offline, total
-
-
 class IndexTableView(JobTableView):
 
     def get_queryset(self):
@@ -273,7 +273,7 @@ class DeviceTableView(JobTableView):
 
     def get_queryset(self):
         visible = filter_device_types(self.request.user)
-        return Device.objects.select_related("device_type").order_by(
+        return with_device_table_data(Device.objects).order_by(
             "hostname").filter(temporarydevice=None,
                                device_type__in=visible)
 
@@ -287,16 +287,17 @@ def index(request):
         index_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": index_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": index_table.length})
     config.configure(index_table)
 
     prefix = 'device_'
     dt_overview_data = DeviceTypeOverView(request, model=DeviceType, table_class=DeviceTypeTable)
+    counters = get_counters()
     dt_overview_table = DeviceTypeTable(
-        dt_overview_data.get_table_data(prefix),
+        device_type_rows(dt_overview_data.get_table_data(prefix), counters),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": dt_overview_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": dt_overview_table.length})
     config.configure(dt_overview_table)
 
     prefix = 'worker_'
@@ -305,7 +306,7 @@ def index(request):
         worker_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": worker_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": worker_table.length})
     config.configure(worker_table)
 
     search_data = index_table.prepare_search_data(index_data)
@@ -319,18 +320,16 @@ def index(request):
     discrete_data = index_table.prepare_discrete_data(index_data)
     discrete_data.update(dt_overview_table.prepare_discrete_data(dt_overview_data))
 
-    (num_online, num_not_retired) = _online_total()
-    health_check_completed = health_jobs_in_hr().filter(status=TestJob.COMPLETE).count()
-    health_check_total = health_jobs_in_hr().count()
     return render(
         request,
         "lava_scheduler_app/index.html",
         {
-            'device_status': "%d/%d" % _online_total(),
-            'num_online': num_online,
-            'num_not_retired': num_not_retired,
-            'hc_completed': health_check_completed,
-            'hc_total': health_check_total,
+            'device_status': "%d/%d" % (counters['num_online'],
+                                        counters['num_not_retired']),
+            'num_online': counters['num_online'],
+            'num_not_retired': counters['num_not_retired'],
+            'hc_completed': counters['hc_completed'],
+            'hc_total': counters['hc_total'],
             'device_type_table': dt_overview_table,
             'worker_table': worker_table,
             'active_jobs_table': index_table,
@@ -343,76 +342,11 @@ def index(request):
         })
 
 
-def type_report_data(start_day, end_day, dt, health_check):
-    now = datetime.datetime.now()
-    start_date = now + datetime.timedelta(start_day)
-    end_date = now + datetime.timedelta(end_day)
-
-    res = TestJob.objects.filter(actual_device__in=Device.objects.filter(device_type=dt),
-                                 health_check=health_check,
-                                 start_time__range=(start_date, end_date),
-                                 status__in=(TestJob.COMPLETE, TestJob.INCOMPLETE,
-                                             TestJob.CANCELED, TestJob.CANCELING),).values('status')
-    url = reverse('lava.scheduler.failure_report')
-    params = 'start=%s&end=%s&device_type=%s&health_check=%d' % (start_day, end_day, dt, health_check)
-    return {
-        'pass': res.filter(status=TestJob.COMPLETE).count(),
-        'fail': res.exclude(status=TestJob.COMPLETE).count(),
-        'date': start_date.strftime('%m-%d'),
-        'failure_url': '%s?%s' % (url, params),
-    }
-
-
-def device_report_data(start_day, end_day, device, health_check):
-    now = datetime.datetime.now()
-    start_date = now + datetime.timedelta(start_day)
-    end_date = now + datetime.timedelta(end_day)
-
-    res = TestJob.objects.filter(actual_device=device, health_check=health_check,
-                                 start_time__range=(start_date, end_date),
-                                 status__in=(TestJob.COMPLETE, TestJob.INCOMPLETE,
-                                             TestJob.CANCELED, TestJob.CANCELING),).values('status')
-    url = reverse('lava.scheduler.failure_report')
-    params = 'start=%s&end=%s&device=%s&health_check=%d' % (start_day, end_day, device.pk, health_check)
-    return {
-        'pass': res.filter(status=TestJob.COMPLETE).count(),
-        'fail': res.exclude(status=TestJob.COMPLETE).count(),
-        'date': start_date.strftime('%m-%d'),
-        'failure_url': '%s?%s' % (url, params),
-    }
-
-
-def job_report(start_day, end_day, health_check):
-    now = datetime.datetime.now()
-    start_date = now + datetime.timedelta(start_day)
-    end_date = now + datetime.timedelta(end_day)
-
-    res = TestJob.objects.filter(health_check=health_check,
-                                 start_time__range=(start_date, end_date),
-                                 status__in=(TestJob.COMPLETE, TestJob.INCOMPLETE,
-                                             TestJob.CANCELED, TestJob.CANCELING),).values('status')
-    url = reverse('lava.scheduler.failure_report')
-    params = 'start=%s&end=%s&health_check=%d' % (start_day, end_day, health_check)
-    return {
-        'pass': res.filter(status=TestJob.COMPLETE).count(),
-        'fail': res.exclude(status=TestJob.COMPLETE).count(),
-        'date': start_date.strftime('%m-%d'),
-        'failure_url': '%s?%s' % (url, params),
-    }
-
-
 @BreadCrumb("Reports", parent=lava_index)
 def reports(request):
-    health_day_report = []
-    health_week_report = []
-    job_day_report = []
-    job_week_report = []
-    for day in reversed(range(7)):
-        health_day_report.append(job_report(day * -1 - 1, day * -1, True))
-        job_day_report.append(job_report(day * -1 - 1, day * -1, False))
-    for week in reversed(range(10)):
-        health_week_report.append(job_report(week * -7 - 7, week * -7, True))
-        job_week_report.append(job_report(week * -7 - 7, week * -7, False))
+    counts = daily_counts(TestJob.objects.all(), 'all')
+    health_day_report, health_week_report = report_buckets(counts, True, '')
+    job_day_report, job_week_report = report_buckets(counts, False, '')
 
     long_running = TestJob.objects.filter(status__in=[TestJob.RUNNING,
                                                       TestJob.CANCELING]).order_by('start_time')[:5]
@@ -435,7 +369,7 @@ def failure_report(request):
 
     data = FailureTableView(request)
     ptable = FailedJobTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
 
     return render(
         request,
@@ -457,7 +391,7 @@ def device_list(request):
 
     data = DeviceTableView(request, model=Device, table_class=DeviceTable)
     ptable = DeviceTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/alldevices.html",
         {
@@ -476,7 +410,7 @@ def active_device_list(request):
 
     data = ActiveDeviceView(request, model=Device, table_class=DeviceTable)
     ptable = DeviceTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/activedevices.html",
         {
@@ -494,7 +428,9 @@ class OnlineDeviceView(DeviceTableView):
 
     def get_queryset(self):
         visible = filter_device_types(self.request.user)
-        return Device.objects.filter(device_type__in=visible)\
+        devices = with_device_table_data(Device.objects)
+        return with_last_transition_message(devices)\
+            .filter(device_type__in=visible)\
             .exclude(status=Device.RETIRED).order_by("status")
 
 
@@ -502,7 +438,7 @@ class OnlineDeviceView(DeviceTableView):
 def online_device_list(request):
     data = OnlineDeviceView(request, model=Device, table_class=OnlineDeviceTable)
     ptable = OnlineDeviceTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/onlinedevices.html",
         {
@@ -520,7 +456,7 @@ class PassingHealthTableView(JobTableView):
 
     def get_queryset(self):
         visible = filter_device_types(self.request.user)
-        return Device.objects.select_related("device_type")\
+        return with_device_table_data(Device.objects)\
             .order_by("-health_status", "device_type", "hostname")\
             .filter(temporarydevice=None, device_type__in=visible)\
             .exclude(status=Device.RETIRED)
@@ -531,7 +467,7 @@ def passing_health_checks(request):
     data = PassingHealthTableView(request, model=Device,
                                   table_class=PassingHealthTable)
     ptable = PassingHealthTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/passinghealthchecks.html",
         {
@@ -548,7 +484,8 @@ def passing_health_checks(request):
 class MyDeviceView(DeviceTableView):
 
     def get_queryset(self):
-        return Device.objects.owned_by_principal(self.request.user).order_by('hostname')
+        return with_device_table_data(
+            Device.objects.owned_by_principal(self.request.user)).order_by('hostname')
 
 
 @BreadCrumb("My Devices", parent=index)
@@ -556,7 +493,7 @@ def mydevice_list(request):
 
     data = MyDeviceView(request, model=Device, table_class=DeviceTable)
     ptable = DeviceTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/mydevices.html",
         {
@@ -580,8 +517,8 @@ def mydevice_type_health_history_log(request):
         mydthhistory_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request,
-                           paginate={"per_page": mydthhistory_table.length})
+    config = LavaRequestConfig(request,
+                               paginate={"per_page": mydthhistory_table.length})
     config.configure(mydthhistory_table)
 
     return render_to_response(
@@ -604,7 +541,7 @@ def get_restricted_job(user, pk):
         device_type = job.requested_device.device_type
     else:
         device_type = job.requested_device_type
-    if len(device_type.devices_visible_to(user)) == 0:
+    if not device_type.is_visible_to(user):
             raise Http404()
     if not job.is_accessible_by(user) and not user.is_superuser:
         raise PermissionDenied()
@@ -617,14 +554,11 @@ def filter_device_types(user):
     Filters the available DeviceType names to exclude DeviceTypes
     which are hidden from this user.
     :param user: User to check
-    :return: A list of DeviceType.name which all contain
-    at least one device this user can see.
+    :return: A queryset of DeviceType.name which all contain
+    at least one device this user can see, to be used as a filter.
     """
-    visible = []
-    for device_type in DeviceType.objects.filter(display=True):
-        if len(device_type.devices_visible_to(user)) > 0:
-            visible.append(device_type.name)
-    return visible
+    return DeviceType.objects.visible_to(user).filter(
+        display=True).values_list('name', flat=True)
 
 
 class SumIfSQL(models.sql.aggregates.Aggregate):
@@ -645,32 +579,25 @@ class ActiveDeviceView(DeviceTableView):
 
     def get_queryset(self):
         visible = filter_device_types(self.request.user)
-        return Device.objects.filter(device_type__in=visible)\
+        return with_device_table_data(Device.objects)\
+            .filter(device_type__in=visible)\
             .exclude(status=Device.RETIRED).order_by("hostname")
 
 
 class DeviceTypeOverView(JobTableView):
 
     def get_queryset(self):
-        visible = filter_device_types(self.request.user)
-        devices = DeviceType.objects.filter(name__in=visible)\
-            .annotate(idle=SumIf('device', condition='status=%s' % Device.IDLE),
-                      offline=SumIf('device', condition='status in (%s,%s)' %
-                                                        (Device.OFFLINE, Device.OFFLINING)),
-                      busy=SumIf('device', condition='status in (%s,%s)' %
-                                                     (Device.RUNNING, Device.RESERVED)),
-                      restricted=SumIf('device', condition='is_public is False and status not in (%s)' %
-                                                           Device.RETIRED),
-                      ).order_by('name')
-        return devices
+        # the device counters are set by device_type_rows
+        return DeviceType.objects.visible_to(self.request.user).filter(
+            display=True).order_by('name')
 
 
 class NoDTDeviceView(DeviceTableView):
 
     def get_queryset(self):
-        return Device.objects.filter(Q(temporarydevice=None) and
-                                     ~Q(status__in=[Device.RETIRED])
-                                     ).order_by('hostname')
+        return with_device_table_data(Device.objects).filter(
+            Q(temporarydevice=None) and ~Q(status__in=[Device.RETIRED])
+        ).order_by('hostname')
 
 
 def populate_capabilities(device_name):
@@ -681,87 +608,17 @@ def populate_capabilities(device_name):
     the returned dict contains a full set of empty values if no
     capabilities could be determined.
     """
-    capability = {
-        'capabilities_date': None,
-        'processor': None,
-        'models': None,
-        'cores': 0,
-        'emulated': False,
-        'flags': [],
+    device = Device.objects.select_related('device_type').get(
+        hostname=device_name)
+    capabilities = DeviceCapabilities.for_device(device)
+    return {
+        'capabilities_date': capabilities.capabilities_date,
+        'processor': capabilities.processor,
+        'models': capabilities.cpu_models,
+        'cores': capabilities.cores,
+        'emulated': capabilities.emulated,
+        'flags': capabilities.flags or [],
     }
-    hardware_flags = []
-    hardware_cpu_models = []
-    device = Device.objects.get(hostname=device_name)
-    use_health_job = device.device_type.health_check_job != ""
-    try:
-        health_job = TestJob.objects.filter(
-            actual_device=device,
-            health_check=use_health_job,
-            status=TestJob.COMPLETE).latest('submit_time')
-    except TestJob.DoesNotExist:
-        return capability
-    if not health_job:
-        return capability
-    job = TestJob.objects.filter(id=health_job.id)[0]
-    if not job:
-        return capability
-    bundle = job._results_bundle
-    if not bundle:
-        return capability
-    bundle_json = bundle.get_sanitized_bundle().get_human_readable_json()
-    if not bundle_json:
-        return capability
-    bundle_data = simplejson.loads(bundle_json)
-    if 'hardware_context' not in bundle_data['test_runs'][0]:
-        return capability
-    # ok, we finally have a hardware_context for this device type, populate.
-    devices = bundle_data['test_runs'][0]['hardware_context']['devices']
-    capability['capabilities_date'] = job.end_time
-    for device in devices:
-        # multiple core cpus have multiple device.cpu entries, each with attributes.
-        if device['device_type'] == 'device.cpu':
-            if 'cpu_type' in device['attributes']:
-                model = device['attributes']['cpu_type']
-            if 'cpu type' in device['attributes']:
-                    model = device['attributes']['cpu type']
-            if 'model name' in device['attributes']:
-                model = device['attributes']['model name']
-            if 'cpu_part' in device['attributes']:
-                cpu_part = int(device['attributes']['cpu_part'], 16)
-            elif 'CPU part' in device['attributes']:
-                cpu_part = int(device['attributes']['CPU part'], 16)
-            else:
-                cpu_part = None
-            if model.startswith("ARMv7") and cpu_part:
-                if hex(cpu_part) == hex(0xc05):
-                    model = "%s - %s" % (model, "Cortex A5")
-                if hex(cpu_part) == hex(0xc07):
-                    model = "%s - %s" % (model, "Cortex A7")
-                if hex(cpu_part) == hex(0xc08):
-                    model = "%s - %s" % (model, "Cortex A8")
-                if hex(cpu_part) == hex(0xc09):
-                    model = "%s - %s" % (model, "Cortex A9")
-                if hex(cpu_part) == hex(0xc0f):
-                    model = "%s - %s" % (model, "Cortex A15")
-            hardware_cpu_models.append(model)
-            if 'Features' in device['attributes']:
-                hardware_flags.append(device['attributes']['Features'])
-            elif 'flags' in device['attributes']:
-                hardware_flags.append(device['attributes']['flags'])
-            elif 'cpu flags' in device['attributes']:
-                hardware_flags.append(device['attributes']['cpu flags'])
-            if device['attributes']['cpu_type'].startswith("QEMU"):
-                capability['emulated'] = True
-            capability['cores'] += 1
-        if device['device_type'] == 'device.board':
-            capability['processor'] = device['description']
-    if len(hardware_flags) == 0:
-        hardware_flags.append("None")
-    if len(hardware_cpu_models) == 0:
-        hardware_cpu_models.append("None")
-    capability['models'] = ", ".join(hardware_cpu_models)
-    capability['flags'] = ", ".join(hardware_flags)
-    return capability
 
 
 @BreadCrumb("Device Type {pk}", parent=index, needs=['pk'])
@@ -771,42 +628,23 @@ def device_type_detail(request, pk):
         visible = filter_device_types(request.user)
         if dt.name not in visible:
             raise Http404('No device type matches the given query.')
-    daily_complete = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=1)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.COMPLETE).count()
-    daily_failed = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=1)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.INCOMPLETE).count()
-    weekly_complete = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=7)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.COMPLETE).count()
-    weekly_failed = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=7)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.INCOMPLETE).count()
-    monthly_complete = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=30)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.COMPLETE).count()
-    monthly_failed = TestJob.objects.filter(
-        actual_device__in=Device.objects.filter(device_type=dt),
-        health_check=True,
-        submit_time__gte=(datetime.datetime.now().date() - datetime.timedelta(days=30)),
-        submit_time__lt=datetime.datetime.now().date(),
-        status=TestJob.INCOMPLETE).count()
+    # health checks submitted over the last full days, today excluded
+    counts = daily_counts(
+        TestJob.objects.filter(actual_device__device_type=dt),
+        'device_type.%s' % dt.pk, field='submit_time', days=31)
+    today = datetime.date.today()
+
+    def health_checks(days, status):
+        return count_jobs(
+            counts, [today - datetime.timedelta(day) for day in range(1, days + 1)],
+            True, [status])
+
+    daily_complete = health_checks(1, TestJob.COMPLETE)
+    daily_failed = health_checks(1, TestJob.INCOMPLETE)
+    weekly_complete = health_checks(7, TestJob.COMPLETE)
+    weekly_failed = health_checks(7, TestJob.INCOMPLETE)
+    monthly_complete = health_checks(30, TestJob.COMPLETE)
+    monthly_failed = health_checks(30, TestJob.INCOMPLETE)
     health_summary_data = [{
         "Duration": "24hours",
         "Complete": daily_complete,
@@ -828,7 +666,7 @@ def device_type_detail(request, pk):
         filter(device_type=dt),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": no_dt_ptable.length})
+    config = LavaRequestConfig(request, paginate={"per_page": no_dt_ptable.length})
     config.configure(no_dt_ptable)
 
     prefix = "dt_"
@@ -839,7 +677,7 @@ def device_type_detail(request, pk):
         .filter(actual_device__in=Device.objects.filter(device_type=dt)),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": dt_jobs_ptable.length})
+    config = LavaRequestConfig(request, paginate={"per_page": dt_jobs_ptable.length})
     config.configure(dt_jobs_ptable)
 
     prefix = 'health_'
@@ -847,7 +685,7 @@ def device_type_detail(request, pk):
         health_summary_data,
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": health_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": health_table.length})
     config.configure(health_table)
 
     search_data = no_dt_ptable.prepare_search_data(no_dt_data)
@@ -900,8 +738,8 @@ def device_type_health_history_log(request, pk):
         dthhistory_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request,
-                           paginate={"per_page": dthhistory_table.length})
+    config = LavaRequestConfig(request,
+                               paginate={"per_page": dthhistory_table.length})
     config.configure(dthhistory_table)
 
     return render_to_response(
@@ -917,16 +755,12 @@ def device_type_health_history_log(request, pk):
 @BreadCrumb("{pk} device type report", parent=device_type_detail, needs=['pk'])
 def device_type_reports(request, pk):
     device_type = get_object_or_404(DeviceType, pk=pk)
-    health_day_report = []
-    health_week_report = []
-    job_day_report = []
-    job_week_report = []
-    for day in reversed(range(7)):
-        health_day_report.append(type_report_data(day * -1 - 1, day * -1, device_type, True))
-        job_day_report.append(type_report_data(day * -1 - 1, day * -1, device_type, False))
-    for week in reversed(range(10)):
-        health_week_report.append(type_report_data(week * -7 - 7, week * -7, device_type, True))
-        job_week_report.append(type_report_data(week * -7 - 7, week * -7, device_type, False))
+    counts = daily_counts(
+        TestJob.objects.filter(actual_device__device_type=device_type),
+        'device_type.%s' % device_type.pk)
+    params = 'device_type=%s' % device_type.pk
+    health_day_report, health_week_report = report_buckets(counts, True, params)
+    job_day_report, job_week_report = report_buckets(counts, False, params)
 
     long_running = TestJob.objects.filter(
         actual_device__in=Device.objects.filter(device_type=device_type),
@@ -951,7 +785,7 @@ def device_type_reports(request, pk):
 def lab_health(request):
     data = DeviceTableView(request, model=Device, table_class=DeviceHealthTable)
     ptable = DeviceHealthTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/labhealth.html",
         {
@@ -970,7 +804,7 @@ def health_job_list(request, pk):
     device = get_object_or_404(Device, pk=pk)
     trans_data = TransitionView(request, device)
     trans_table = DeviceTransitionTable(trans_data.get_table_data())
-    config = RequestConfig(request, paginate={"per_page": trans_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": trans_table.length})
     config.configure(trans_table)
 
     health_data = AllJobsView(request)
@@ -1054,7 +888,7 @@ def job_list(request):
 
     data = AllJobsView(request, model=TestJob, table_class=JobTable)
     ptable = JobTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
 
     return render_to_response(
         "lava_scheduler_app/alljobs.html",
@@ -1321,12 +1155,8 @@ def job_detail(request, pk):
         'is_favorite': is_favorite,
     }
 
-    log_file = job.output_file()
-    if log_file:
-        with job.output_file() as f:
-            f.seek(0, 2)
-            job_file_size = f.tell()
-
+    job_file_size = job.output_size()
+    if job_file_size is not None:
         if job_file_size >= job.size_limit:
             data.update({
                 'job_file_present': True,
@@ -1338,26 +1168,25 @@ def job_detail(request, pk):
             return render_to_response(
                 "lava_scheduler_app/job.html", data, RequestContext(request))
 
+        log_index = job.output_index()
+        with job.output_file() as log_file:
+            job_log_messages = log_index.read_messages(log_file)
+
         if not job.failure_comment:
-            job_errors = getDispatcherErrors(job.output_file())
+            job_errors = log_index.errors
             if len(job_errors) > 0:
                 msg = job_errors[-1]
                 if msg != "ErrorMessage: None":
                     job.failure_comment = msg
                     job.save()
 
-        job_log_messages = getDispatcherLogMessages(job.output_file())
-        levels = defaultdict(int)
-        for kl in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
-            levels[kl] = 0
-        for level, msg, _ in job_log_messages:
-            levels[level] += 1
-        levels = sorted(levels.items(), key=lambda (k, v): logging._levelNames.get(k))
         data.update({
             'job_file_present': True,
             'job_log_messages': job_log_messages,
-            'levels': levels,
-            'job_file_size': job_file_size,
+            'levels': message_levels(job_log_messages),
+            'job_file_size': log_index.size,
+            'log_cursor': log_tail_cursor(log_index.offset,
+                                          log_index.section_type),
         })
     else:
         data.update({
@@ -1473,7 +1302,7 @@ def myjobs(request):
     user = get_object_or_404(User, pk=request.user.id)
     data = MyJobsView(request, model=TestJob, table_class=JobTable)
     ptable = JobTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/myjobs.html",
         {
@@ -1496,7 +1325,7 @@ def favorite_jobs(request, username=None):
     data = FavoriteJobsView(request, model=TestJob,
                             table_class=JobTable, user=user)
     ptable = JobTable(data.get_table_data())
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/favorite_jobs.html",
         {
@@ -1511,23 +1340,29 @@ def favorite_jobs(request, username=None):
         RequestContext(request))
 
 
+LOG_CHUNK_SIZE = 512 * 1024
+NEWLINE_SCAN_SIZE = 80
+
+
 @BreadCrumb("Complete log", parent=job_detail, needs=['pk'])
 def job_log_file(request, pk):
     job = get_restricted_job(request.user, pk)
-    log_file = job.output_file()
-    if not log_file:
+    job_file_size = job.output_size()
+    if job_file_size is None:
         raise Http404
 
-    with job.output_file() as f:
-        f.seek(0, 2)
-        job_file_size = f.tell()
-
     size_warning = 0
     if job_file_size >= job.size_limit:
         size_warning = job.size_limit
         content = None
+        log_cursor = log_tail_cursor(job_file_size)
     else:
-        content = formatLogFile(job.output_file())
+        log_index = job.output_index()
+        with job.output_file() as log_file:
+            content = log_index.read_sections(log_file)
+        job_file_size = log_index.size
+        log_cursor = log_tail_cursor(log_index.offset,
+                                     log_index.section_type)
 
     return render_to_response(
         "lava_scheduler_app/job_log_file.html",
@@ -1539,6 +1374,7 @@ def job_log_file(request, pk):
             'sections': content,
             'size_warning': size_warning,
             'job_file_size': job_file_size,
+            'log_cursor': log_cursor,
             'bread_crumb_trail': BreadCrumbTrail.leading_to(job_log_file, pk=pk),
             'show_failure': job.can_annotate(request.user),
             'context_help': BreadCrumbTrail.leading_to(job_detail, pk='detail'),
@@ -1546,12 +1382,84 @@ def job_log_file(request, pk):
         RequestContext(request))
 
 
+def _parse_range(header, size):
+    """
+    Parses a single range HTTP Range header (RFC 7233) for a file of the
+    given size.
+
+    Returns a (start, end) tuple, end being exclusive, or None if the
+    header should be ignored (missing, malformed or multiple ranges).
+    Raises ValueError if the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = header[len('bytes='):].strip()
+    if ',' in ranges or '-' not in ranges:
+        return None
+    first, last = [value.strip() for value in ranges.split('-', 1)]
+    if not (first or last) or (first and not first.isdigit()) or \
+            (last and not last.isdigit()):
+        return None
+    if not first:
+        # suffix range: the last bytes of the file
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - length, 0), size
+    start = int(first)
+    if last and int(last) < start:
+        # not a valid range
+        return None
+    end = int(last) + 1 if last else size
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size)
+
+
+def _stream_file(log_file, start, end, chunk_size=LOG_CHUNK_SIZE):
+    """
+    Yields the content of log_file between start and end in chunks of at
+    most chunk_size bytes, closing the file afterwards.
+    """
+    try:
+        log_file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = log_file.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        log_file.close()
+
+
 def job_log_file_plain(request, pk):
     job = get_restricted_job(request.user, pk)
     log_file = job.output_file()
     if not log_file:
         raise Http404
-    response = HttpResponse(log_file, content_type='text/plain; charset=utf-8')
+    log_file.seek(0, os.SEEK_END)
+    size = log_file.tell()
+    try:
+        byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        log_file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    if byte_range is None:
+        start, end = 0, size
+    else:
+        start, end = byte_range
+    response = StreamingHttpResponse(
+        _stream_file(log_file, start, end),
+        content_type='text/plain; charset=utf-8')
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, size)
+    response['Content-Length'] = str(end - start)
+    response['Accept-Ranges'] = 'bytes'
     response['Content-Transfer-Encoding'] = 'quoted-printable'
     response['Content-Disposition'] = "attachment; filename=job_%d.log" % job.id
     return response
@@ -1590,8 +1498,127 @@ def job_full_log_incremental(request, pk):
     return response
 
 
-LOG_CHUNK_SIZE = 512 * 1024
-NEWLINE_SCAN_SIZE = 80
+# Longest time a log tail request waits for new content, in seconds. Each
+# waiting request holds a worker, so this stays short: the job pages do not
+# wait at all and poll every second instead.
+LOG_TAIL_MAX_WAIT = 5
+# Longest time a log tail event stream stays open, in seconds. EventSource
+# reconnects on its own, resuming from the last event id.
+LOG_TAIL_STREAM_DURATION = 15
+LOG_TAIL_POLL_INTERVAL = 1
+LOG_TAIL_SALT = 'lava_scheduler_app.views.job_log_tail'
+
+
+def log_tail_cursor(offset, section_type=None):
+    """
+    Returns the cursor to give to job_log_tail to get the log from offset
+    onwards, section_type being the type of the section the line before
+    offset belongs to.
+    """
+    return signing.dumps([offset, section_type], salt=LOG_TAIL_SALT)
+
+
+def _read_log_tail(job, offset, section_type):
+    """
+    Classifies at most LOG_CHUNK_SIZE bytes of the log of job from offset.
+    Only complete lines are returned, unless the job has finished.
+    """
+    finished = job.status not in [TestJob.SUBMITTED, TestJob.RUNNING,
+                                  TestJob.CANCELING]
+    data = ''
+    log_file = job.output_file()
+    if log_file:
+        with log_file:
+            log_file.seek(offset)
+            data = log_file.read(LOG_CHUNK_SIZE)
+    more = len(data) == LOG_CHUNK_SIZE
+    classifier = LogClassifier(keep_content=True, section_type=section_type)
+    # a line longer than a chunk is returned in pieces
+    end = classifier.classify(
+        StringIO.StringIO(data), offset,
+        final=(finished and not more) or (more and '\n' not in data))
+    return {
+        'cursor': log_tail_cursor(end, classifier.section_type),
+        'size': end,
+        'messages': classifier.messages,
+        'sections': classifier.formatted_sections(),
+        'more': more,
+        'finished': finished and not more,
+    }
+
+
+def _job_status(job):
+    job.status = TestJob.objects.filter(pk=job.pk).values_list(
+        'status', flat=True)[0]
+    return job
+
+
+def _log_tail_events(job, offset, section_type, duration):
+    deadline = time.time() + duration
+    while True:
+        tail = _read_log_tail(job, offset, section_type)
+        if tail['size'] != offset or tail['finished']:
+            yield "id: %s\nevent: log\ndata: %s\n\n" % (
+                tail['cursor'], simplejson.dumps(tail))
+            offset, section_type = signing.loads(
+                tail['cursor'], salt=LOG_TAIL_SALT)
+        if tail['finished'] or time.time() >= deadline:
+            return
+        if not tail['more']:
+            time.sleep(LOG_TAIL_POLL_INTERVAL)
+            _job_status(job)
+
+
+def job_log_tail(request, pk):
+    """
+    Returns the part of the job log after the given cursor, as JSON, with
+    the dispatcher log messages and the log sections found there and the
+    cursor to use for the next call.
+
+    Without a cursor, the log is returned from the start offset (0 by
+    default). At most LOG_CHUNK_SIZE bytes are returned per call, 'more'
+    tells whether there is more to read straight away. When there is
+    nothing new yet, the request waits for up to 'wait' seconds (at most
+    LOG_TAIL_MAX_WAIT) for the log to grow.
+
+    Requests accepting text/event-stream get server-sent events instead,
+    one 'log' event per new piece of log, the event id being the cursor so
+    that EventSource resumes where it stopped when reconnecting. The stream
+    is closed after LOG_TAIL_STREAM_DURATION seconds.
+    """
+    job = get_restricted_job(request.user, pk)
+    cursor = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('cursor')
+    try:
+        if cursor:
+            offset, section_type = signing.loads(cursor, salt=LOG_TAIL_SALT)
+        else:
+            offset, section_type = int(request.GET.get('start', 0)), None
+        wait = min(int(request.GET.get('wait', 0)), LOG_TAIL_MAX_WAIT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return HttpResponseBadRequest("invalid cursor")
+    if offset < 0:
+        return HttpResponseBadRequest("invalid cursor")
+
+    if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        response = StreamingHttpResponse(
+            _log_tail_events(job, offset, section_type,
+                             LOG_TAIL_STREAM_DURATION),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    deadline = time.time() + wait
+    tail = _read_log_tail(job, offset, section_type)
+    while tail['size'] == offset and not tail['finished'] \
+            and time.time() < deadline:
+        time.sleep(LOG_TAIL_POLL_INTERVAL)
+        tail = _read_log_tail(_job_status(job), offset, section_type)
+    response = HttpResponse(simplejson.dumps(tail),
+                            content_type='application/json')
+    response['X-Current-Size'] = str(tail['size'])
+    if tail['finished']:
+        response['X-Is-Finished'] = '1'
+    return response
 
 
 def job_output(request, pk):
@@ -1840,11 +1867,11 @@ def edit_transition(request):
 def transition_detail(request, pk):
     transition = get_object_or_404(DeviceStateTransition, id=pk)
     device_type = transition.device.device_type
-    if len(device_type.devices_visible_to(request.user)) == 0:
+    if not device_type.is_visible_to(request.user):
         raise Http404()
     trans_data = TransitionView(request, transition.device, model=DeviceStateTransition, table_class=DeviceTransitionTable)
     trans_table = DeviceTransitionTable(trans_data.get_table_data())
-    config = RequestConfig(request, paginate={"per_page": trans_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": trans_table.length})
     config.configure(trans_table)
 
     return render_to_response(
@@ -1864,6 +1891,36 @@ def transition_detail(request, pk):
         RequestContext(request))
 
 
+def device_timeline(request, pk):
+    """
+    Returns the compacted state history of a device as JSON, a list of
+    periods with the state of the device, as a number and as text, and the
+    time it entered and left it. Only the last 'days' days (30 by default)
+    are returned, days=0 returns the whole history.
+    """
+    device = get_object_or_404(Device, pk=pk)
+    if not device.device_type.is_visible_to(request.user):
+        raise Http404('No device matches the given query.')
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return HttpResponseBadRequest("invalid number of days")
+    start = None
+    if days > 0:
+        start = datetime.datetime.now() - datetime.timedelta(days=days)
+    states = dict(Device.STATUS_CHOICES)
+    timeline = [
+        {
+            'state': state,
+            'state_display': states[state],
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat() if until else None,
+        }
+        for state, since, until in device.state_timeline(start=start)]
+    return HttpResponse(simplejson.dumps(timeline),
+                        content_type='application/json')
+
+
 class RecentJobsView(JobTableView):
 
     def __init__(self, request, device, **kwargs):
@@ -1872,8 +1929,8 @@ class RecentJobsView(JobTableView):
 
     def get_queryset(self):
         return TestJob.objects.select_related(
-            "actual_device",
-            "requested_device",
+            "actual_device__device_type",
+            "requested_device__device_type",
             "requested_device_type",
             "submitter",
             "user",
@@ -1995,7 +2052,7 @@ def device_detail(request, pk):
         prefix=prefix,
     )
 
-    config = RequestConfig(request, paginate={"per_page": recent_ptable.length})
+    config = LavaRequestConfig(request, paginate={"per_page": recent_ptable.length})
     config.configure(recent_ptable)
 
     prefix = "transition_"
@@ -2004,7 +2061,7 @@ def device_detail(request, pk):
         trans_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request, paginate={"per_page": trans_table.length})
+    config = LavaRequestConfig(request, paginate={"per_page": trans_table.length})
     config.configure(trans_table)
 
     search_data = recent_ptable.prepare_search_data(recent_data)
@@ -2066,16 +2123,11 @@ def device_detail(request, pk):
 @BreadCrumb("{pk} device report", parent=device_detail, needs=['pk'])
 def device_reports(request, pk):
     device = get_object_or_404(Device, pk=pk)
-    health_day_report = []
-    health_week_report = []
-    job_day_report = []
-    job_week_report = []
-    for day in reversed(range(7)):
-        health_day_report.append(device_report_data(day * -1 - 1, day * -1, device, True))
-        job_day_report.append(device_report_data(day * -1 - 1, day * -1, device, False))
-    for week in reversed(range(10)):
-        health_week_report.append(device_report_data(week * -7 - 7, week * -7, device, True))
-        job_week_report.append(device_report_data(week * -7 - 7, week * -7, device, False))
+    counts = daily_counts(TestJob.objects.filter(actual_device=device),
+                          'device.%s' % device.pk)
+    params = 'device=%s' % device.pk
+    health_day_report, health_week_report = report_buckets(counts, True, params)
+    job_day_report, job_week_report = report_buckets(counts, False, params)
 
     long_running = TestJob.objects.filter(
         actual_device=device,
@@ -2196,8 +2248,8 @@ def device_health_history_log(request, pk):
         hhistory_data.get_table_data(prefix),
         prefix=prefix,
     )
-    config = RequestConfig(request,
-                           paginate={"per_page": hhistory_table.length})
+    config = LavaRequestConfig(request,
+                               paginate={"per_page": hhistory_table.length})
     config.configure(hhistory_table)
 
     return render_to_response(
@@ -2215,7 +2267,7 @@ def worker_detail(request, pk):
     worker = get_object_or_404(Worker, pk=pk)
     data = DeviceTableView(request)
     ptable = NoWorkerDeviceTable(data.get_table_data().filter(worker_host=worker).order_by('hostname'))
-    RequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
+    LavaRequestConfig(request, paginate={"per_page": ptable.length}).configure(ptable)
     return render_to_response(
         "lava_scheduler_app/worker.html",
         {
@@ -2272,7 +2324,7 @@ def queue(request):
     queue_ptable = QueueJobsTable(
         queue_data.get_table_data(),
     )
-    config = RequestConfig(request, paginate={"per_page": queue_ptable.length})
+    config = LavaRequestConfig(request, paginate={"per_page": queue_ptable.length})
     config.configure(queue_ptable)
 
     return render_to_response(
@@ -5,6 +5,7 @@ import shutil
 import urlparse
 import copy
 import socket
+from collections import OrderedDict
 
 from dashboard_app.models import Bundle
 
@@ -12,7 +13,7 @@ from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
 from django.db import connection
 from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.db.utils import DatabaseError
 
 from linaro_django_xmlrpc.models import AuthToken
@@ -27,16 +28,20 @@ import lava_dispatcher.config as dispatcher_config
 
 from lava_scheduler_app.models import (
     Device,
+    DeviceCapabilities,
     TestJob,
     TemporaryDevice,
 )
 from lava_scheduler_app import utils
+from lava_scheduler_app.counters import refresh_counters
 from lava_scheduler_daemon.worker import WorkerData
 from lava_scheduler_daemon.jobsource import IJobSource
 import signal
 import platform
 
 MAX_RETRIES = 3
+# Seconds between two refreshes of the front page counters.
+COUNTERS_REFRESH_INTERVAL = 20
 
 
 try:
@@ -49,26 +54,114 @@ except ImportError:
         pass
 
 
+class DeviceMatcher(object):
+    """
+    Matches queued jobs against a list of available devices in memory.
+
+    The tags of all the jobs and devices and the group membership of the
+    submitters are loaded once, when the matcher is created, using a fixed
+    number of queries. Matching a job afterwards does not touch the
+    database, whatever the size of the queue or the number of devices.
+
+    Devices are kept indexed by hostname and by device type, in the order
+    in which they were given, so the precedence is the same as walking
+    the device list: the requested device first, then the first suitable
+    device of the requested type.
+    """
+
+    def __init__(self, jobs, devices):
+        self.jobs = list(jobs)
+        self.devices = list(devices)
+        self._by_hostname = {}
+        self._by_type = {}
+        self._taken = set()
+        for device in self.devices:
+            self._by_hostname[device.hostname] = device
+            self._by_type.setdefault(device.device_type_id, []).append(device)
+
+        self._device_tags = self._tag_sets(
+            Device.tags.through.objects.filter(
+                device__in=self._by_hostname.keys()).values_list(
+                    'device_id', 'tag_id'))
+        self._job_tags = self._tag_sets(
+            TestJob.tags.through.objects.filter(
+                testjob__in=[job.id for job in self.jobs]).values_list(
+                    'testjob_id', 'tag_id'))
+
+        self._groups = {}
+        if any(device.group_id is not None for device in self.devices):
+            memberships = User.groups.through.objects.filter(
+                user__in=set(job.submitter_id for job in self.jobs))
+            for user_id, group_id in memberships.values_list('user_id',
+                                                             'group_id'):
+                self._groups.setdefault(user_id, set()).add(group_id)
+
+    @staticmethod
+    def _tag_sets(rows):
+        tags = {}
+        for key, tag_id in rows:
+            tags.setdefault(key, set()).add(tag_id)
+        return dict((key, frozenset(value)) for key, value in tags.items())
+
+    def can_submit(self, device, user):
+        """
+        In-memory equivalent of Device.can_submit, using the prefetched
+        group membership instead of querying user.groups.
+        """
+        if device.status == Device.RETIRED:
+            return False
+        if device.is_public:
+            return True
+        if user.username == "lava-health":
+            return True
+        if not user.is_active:
+            return False
+        if device.user_id is not None:
+            return device.user_id == user.id
+        return device.group_id in self._groups.get(user.id, ())
+
+    def _suitable(self, job, device):
+        job_tags = self._job_tags.get(job.id, frozenset())
+        device_tags = self._device_tags.get(device.hostname, frozenset())
+        return self.can_submit(device, job.submitter) and \
+            job_tags <= device_tags
+
+    def find_device_for_job(self, job):
+        """
+        If the device has the same tags as the job or all the tags required
+        for the job and some others which the job does not explicitly specify,
+        check if this device be assigned to this job for this user.
+        """
+        if job.health_check is True:
+            if job.requested_device.status == Device.OFFLINE and \
+                    job.requested_device_id not in self._taken:
+                return job.requested_device
+        device = self._by_hostname.get(job.requested_device_id)
+        if device is not None and self._suitable(job, device):
+            return device
+        for device in self._by_type.get(job.requested_device_type_id, []):
+            if self._suitable(job, device):
+                return device
+        return None
+
+    def remove(self, device):
+        """
+        Marks the device as no longer available for the following jobs.
+        """
+        self._taken.add(device.hostname)
+        device = self._by_hostname.pop(device.hostname, None)
+        if device is not None:
+            self._by_type[device.device_type_id].remove(device)
+            self.devices.remove(device)
+
+
 def find_device_for_job(job, device_list):
     """
     If the device has the same tags as the job or all the tags required
     for the job and some others which the job does not explicitly specify,
     check if this device be assigned to this job for this user.
     """
-    if job.health_check is True:
-        if job.requested_device.status == Device.OFFLINE:
-            return job.requested_device
-    for device in device_list:
-        if device == job.requested_device:
-            if device.can_submit(job.submitter) and\
-                    set(job.tags.all()) & set(device.tags.all()) == set(job.tags.all()):
-                return device
-    for device in device_list:
-        if device.device_type == job.requested_device_type:
-            if device.can_submit(job.submitter) and\
-                    set(job.tags.all()) & set(device.tags.all()) == set(job.tags.all()):
-                return device
-    return None
+    return DeviceMatcher([job], device_list).find_device_for_job(job)
 
 
 def get_configured_devices():
@@ -103,6 +196,7 @@ class DatabaseJobSource(object):
             self.my_devices = get_configured_devices
         else:
             self.my_devices = my_devices
+        self._counters_refreshed = None
 
     deferToThread = staticmethod(deferToThread)
 
@@ -158,29 +252,79 @@ class DatabaseJobSource(object):
                 self.logger.warn('retrying transaction %s', err)
                 continue
 
+    def _get_health_check_devices(self):
+        """
+        Returns the devices which need a health check job, in one query:
+
+        - IDLE devices whose device type has a health check job
+        - with an unknown or looping health status, no finished health
+          check job or a health check older than a day
+        - which do not already have a health check job queued or running
+        """
+        day_ago = datetime.datetime.now() - datetime.timedelta(days=1)
+        pending = TestJob.objects.filter(
+            health_check=True,
+            status__in=[TestJob.SUBMITTED, TestJob.RUNNING])
+
+        devices = Device.objects.filter(status=Device.IDLE)
+        devices = devices.exclude(device_type__health_check_job=None)
+        devices = devices.exclude(device_type__health_check_job='')
+        devices = devices.filter(
+            Q(health_status__in=[Device.HEALTH_UNKNOWN,
+                                 Device.HEALTH_LOOPING]) |
+            Q(last_health_report_job=None) |
+            Q(last_health_report_job__end_time=None) |
+            Q(last_health_report_job__end_time__lt=day_ago))
+        # NULLs in a NOT IN subquery would exclude every device.
+        devices = devices.exclude(hostname__in=pending.exclude(
+            requested_device=None).values('requested_device'))
+        devices = devices.exclude(hostname__in=pending.exclude(
+            actual_device=None).values('actual_device'))
+        return devices.select_related('device_type').order_by('hostname')
+
+    def _copy_health_check_job(self, job, device):
+        """
+        Returns an unsaved copy of the health check job targeted at device.
+        """
+        definition = simplejson.loads(job.definition)
+        definition['target'] = device.hostname
+        original_definition = simplejson.loads(job.original_definition)
+        original_definition['target'] = device.hostname
+        return TestJob(
+            definition=simplejson.dumps(definition, sort_keys=True,
+                                        indent=4 * ' '),
+            original_definition=simplejson.dumps(original_definition,
+                                                 sort_keys=True,
+                                                 indent=4 * ' '),
+            submitter=job.submitter, requested_device=device,
+            description=job.description, health_check=True,
+            user=job.user, group=job.group, is_public=job.is_public,
+            priority=job.priority)
+
     def _submit_health_check_jobs(self):
         """
         Checks which devices need a health check job and submits the needed
         health checks.
-        """
 
-        for device in Device.objects.filter(status=Device.IDLE):
-            if not device.device_type.health_check_job:
-                run_health_check = False
-            elif device.health_status == Device.HEALTH_UNKNOWN:
-                run_health_check = True
-            elif device.health_status == Device.HEALTH_LOOPING:
-                run_health_check = True
-            elif not device.last_health_report_job:
-                run_health_check = True
-            elif not device.last_health_report_job.end_time:
-                run_health_check = True
-            else:
-                run_health_check = device.last_health_report_job.end_time < \
-                    datetime.datetime.now() - datetime.timedelta(days=1)
-
-            if run_health_check:
-                device.initiate_health_check_job()
+        The health check of the first device of each device type is
+        submitted (and validated) as usual, the jobs for the other devices of
+        that type are copies of it, created in bulk. Health checks using tags
+        depend on the tags of each device, so these are submitted one by one.
+        """
+        device_types = OrderedDict()
+        for device in self._get_health_check_devices():
+            device_types.setdefault(device.device_type, []).append(device)
+
+        for device_type, devices in device_types.iteritems():
+            job = devices[0].initiate_health_check_job()
+            if job.tags.exists():
+                for device in devices[1:]:
+                    device.initiate_health_check_job()
+                continue
+            with transaction.atomic():
+                TestJob.objects.bulk_create([
+                    self._copy_health_check_job(job, device)
+                    for device in devices[1:]])
 
     def _get_job_queue(self):
         """
@@ -218,27 +362,32 @@ class DatabaseJobSource(object):
         return devices
 
     def _assign_jobs(self):
-        jobs = list(self._get_job_queue())
-        devices = list(self._get_available_devices())
-        for job in jobs:
-            device = find_device_for_job(job, devices)
+        jobs = self._get_job_queue().select_related(
+            'requested_device', 'submitter')
+        devices = self._get_available_devices().select_related('device_type')
+        matcher = DeviceMatcher(jobs, devices)
+        tokens = {}
+        for job in matcher.jobs:
+            device = matcher.find_device_for_job(job)
             if device:
                 try:
                     # Make this sequence atomic
                     with transaction.atomic():
                         job.actual_device = device
-                        try:
-                            job.submit_token = AuthToken.objects.filter(
-                                user=job.submitter)[0]
-                        except IndexError:
-                            job.submit_token = AuthToken.objects.create(
-                                user=job.submitter)
+                        job.submit_token = tokens.get(job.submitter_id)
+                        if job.submit_token is None:
+                            try:
+                                job.submit_token = AuthToken.objects.filter(
+                                    user=job.submitter)[0]
+                            except IndexError:
+                                job.submit_token = AuthToken.objects.create(
+                                    user=job.submitter)
                         device.current_job = job
                         device.state_transition_to(Device.RESERVED, message="Reserved for job %s" % job.display_id)
                         job.save()
                         device.save()
-                    if device in devices:
-                        devices.remove(device)
+                    tokens[job.submitter_id] = job.submit_token
+                    matcher.remove(device)
                     self.logger.info('%s reserved for job %s', device.hostname,
                                      job.id)
                 except IntegrityError:
@@ -262,6 +411,47 @@ class DatabaseJobSource(object):
                     self.logger.info("Unable to kill process group %d: %s", pgid, e)
                     os.unlink(pidrecord)
 
+    def _get_ready_jobs(self, jobs):
+        """
+        Returns the jobs which are ready to start, same as filtering on
+        TestJob.is_ready_to_start but with a single query for all the
+        multinode and vm groups: a group is blocked while one of its sub jobs
+        is neither reserved nor running.
+        """
+        def ready(job):
+            return job.status == TestJob.SUBMITTED and job.actual_device_id is not None
+
+        jobs = [job for job in jobs if ready(job)]
+        target_groups = set(job.target_group for job in jobs if job.is_multinode)
+        vm_groups = set(job.vm_group for job in jobs
+                        if not job.is_multinode and job.is_vmgroup)
+        if not target_groups and not vm_groups:
+            return jobs
+
+        blocked = TestJob.objects.filter(
+            Q(target_group__in=target_groups) | Q(vm_group__in=vm_groups))
+        blocked = blocked.exclude(
+            status__in=[TestJob.SUBMITTED, TestJob.RUNNING],
+            actual_device__isnull=False)
+        blocked = blocked.values('target_group', 'vm_group').annotate(
+            not_ready=Count('id')).order_by()
+        blocked_target_groups = set()
+        blocked_vm_groups = set()
+        for group in blocked:
+            blocked_target_groups.add(group['target_group'])
+            blocked_vm_groups.add(group['vm_group'])
+
+        ready_jobs = []
+        for job in jobs:
+            if job.is_multinode:
+                if job.target_group in blocked_target_groups:
+                    continue
+            elif job.is_vmgroup:
+                if job.vm_group in blocked_vm_groups:
+                    continue
+            ready_jobs.append(job)
+        return ready_jobs
+
     def getJobList_impl(self):
         """
         This method is called in a loop by the scheduler daemon service.
@@ -279,11 +469,27 @@ class DatabaseJobSource(object):
             actual_device_id__in=my_devices,
         )
 
-        my_ready_jobs = filter(lambda job: job.is_ready_to_start, my_submitted_jobs)
+        my_ready_jobs = self._get_ready_jobs(my_submitted_jobs)
+
+        if utils.is_master():
+            self._refresh_counters()
 
         self._commit_transaction(src='getJobList_impl')
         return my_ready_jobs
 
+    def _refresh_counters(self):
+        """
+        Refreshes the front page counters, at most every
+        COUNTERS_REFRESH_INTERVAL seconds.
+        """
+        now = datetime.datetime.now()
+        if self._counters_refreshed is not None and \
+                now - self._counters_refreshed < datetime.timedelta(
+                    seconds=COUNTERS_REFRESH_INTERVAL):
+            return
+        self._counters_refreshed = now
+        refresh_counters()
+
     def getJobList(self):
         return self.deferForDB(self.getJobList_impl)
 
@@ -456,6 +662,13 @@ class DatabaseJobSource(object):
 
         device.save()
         job.save()
+        try:
+            with transaction.atomic():
+                DeviceCapabilities.update_from_job(job)
+        except Exception:
+            self.logger.exception(
+                'updating capabilities of %s from job %r failed',
+                device.hostname, job.pk)
         self._commit_transaction(src='jobCompleted_impl')
         self.logger.info('job %s completed on %s', job.id, device.hostname)
 
@@ -483,6 +696,71 @@ class DatabaseJobSource(object):
     def jobCheckForCancellation(self, board_name):
         return self.deferForDB(self.jobCheckForCancellation_impl, board_name)
 
+    def jobsCheckForCancellation_impl(self, board_names):
+        """
+        Returns the boards, among board_names, whose job is no longer
+        running, e.g. because it was canceled.
+        """
+        return list(Device.objects.filter(
+            hostname__in=board_names, current_job__isnull=False).exclude(
+            current_job__status=TestJob.RUNNING).values_list(
+            'hostname', flat=True))
+
+    def jobsCheckForCancellation(self, board_names):
+        return self.deferForDB(self.jobsCheckForCancellation_impl,
+                               board_names)
+
+    def _run_by_monitor(self, job):
+        """
+        Whether the lava-dispatch of job runs under a schedulermonitor,
+        which finishes the job by itself. The monitor leads the process
+        group recorded in the jobpid file.
+        """
+        pidrecord = os.path.join(job.output_dir, "jobpid")
+        try:
+            with open(pidrecord) as f:
+                pgid = int(f.read())
+            with open('/proc/%d/cmdline' % pgid) as f:
+                cmdline = f.read().split('\0')
+        except (IOError, ValueError):
+            return False
+        return 'schedulermonitor' in cmdline
+
+    def recoverJobs_impl(self):
+        """
+        Finishes the jobs left running on the devices of this worker by a
+        previous run of a daemon supervising its dispatchers: they are no
+        longer its children, so nothing would ever handle their completion,
+        timeout or cancellation. Their dispatchers are killed and the jobs
+        marked incomplete. Jobs run by a schedulermonitor are left alone.
+
+        Returns the ids of the jobs finished.
+        """
+        jobs = TestJob.objects.filter(
+            status=TestJob.RUNNING,
+            actual_device_id__in=get_temporary_devices(self.my_devices()))
+        recovered = []
+        for job in jobs:
+            if self._run_by_monitor(job):
+                continue
+            self.logger.warning("job %s was left running on %s",
+                                job.id, job.actual_device.hostname)
+            self._kill_canceling(job)
+            pidrecord = os.path.join(job.output_dir, "jobpid")
+            if os.path.exists(pidrecord):
+                os.unlink(pidrecord)
+            job.failure_comment = ("The scheduler daemon restarted while "
+                                   "the job was running.")
+            job.save()
+            self._commit_transaction(src='recoverJobs_impl')
+            self.jobCompleted_impl(job.id, job.actual_device.hostname, 1,
+                                   None)
+            recovered.append(job.id)
+        return recovered
+
+    def recoverJobs(self):
+        return self.deferForDB(self.recoverJobs_impl)
+
     def _handle_cancelling_jobs(self):
         cancel_list = TestJob.objects.filter(status=TestJob.CANCELING)
         # Pick up TestJob objects in Canceling and ensure that the cancel completes.
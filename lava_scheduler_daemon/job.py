@@ -109,7 +109,7 @@ def argChecker(arg):
 class Job(object):
 
     def __init__(self, job_id, job_data, dispatcher, source, board_name,
-                 reactor, daemon_options):
+                 reactor, daemon_options, supervisor=None):
         self.job_id = job_id
         self.job_data = job_data
         self.dispatcher = dispatcher
@@ -128,6 +128,8 @@ class Job(object):
         self._pidrecord = None
         self._device_config = None
         self.output_dir = None
+        # JobSupervisor checking the cancellation of the job, if any
+        self.supervisor = supervisor
 
     def _checkCancel(self):
         if self._killing:
@@ -201,17 +203,51 @@ class Job(object):
         # See https://twistedmatrix.com/documents/14.0.1/core/howto/process.html#running-another-process for details.
         self._protocol = DispatcherProcessProtocol(d, self)
 
+        executable = self.dispatcher
+        childFDs = None
+        files = []
+        if self.supervisor is not None:
+            # Without a schedulermonitor in between, the dispatcher needs a
+            # session of its own, or killing its process group would kill
+            # the daemon.
+            executable = 'setsid'
+            args.insert(0, executable)
+            # Pipes to the daemon would break when it restarts and take the
+            # dispatcher down. The dispatcher writes its log to output.txt
+            # itself, its standard output being a copy of it, so only its
+            # errors are kept, at the end of output.txt.
+            os.mkdir(output_dir)
+            files = [open(os.devnull, 'r+'),
+                     open(os.path.join(output_dir, 'output.txt'), 'a')]
+            childFDs = {0: files[0].fileno(), 1: files[0].fileno(),
+                        2: files[1].fileno()}
+
         self.logger.info('executing "%s"', ' '.join(args))
 
-        ret = self.reactor.spawnProcess(self._protocol, self.dispatcher,
-                                        args=args, env=None)
+        try:
+            ret = self.reactor.spawnProcess(self._protocol, executable,
+                                            args=args, env=None,
+                                            childFDs=childFDs)
+        finally:
+            for f in files:
+                f.close()
         if ret:
             self.logger.debug("reactor spawned process with status: %s", ret.status)
-            os.mkdir(output_dir)
+            if not os.path.isdir(output_dir):
+                os.mkdir(output_dir)
             self._pidrecord = os.path.join(output_dir, "jobpid")
+            if self.supervisor is not None:
+                # setsid may not have run yet, but it execs in place, so
+                # the pid of the child is its process group
+                pgid = ret.pid
+            else:
+                pgid = os.getpgid(ret.pid)
             with open(self._pidrecord, 'w') as f:
-                f.write("%s\n" % os.getpgid(ret.pid))
-        self._checkCancel_call.start(10)
+                f.write("%s\n" % pgid)
+        if self.supervisor is None:
+            self._checkCancel_call.start(10)
+        else:
+            self.supervisor.add(self)
         timeout = max(
             json_data['timeout'], self.daemon_options['MIN_JOB_TIMEOUT'])
         self._time_limit_call = self.reactor.callLater(
@@ -231,7 +267,10 @@ class Job(object):
             self.logger.info("job complete")
         if self._time_limit_call is not None:
             self._time_limit_call.cancel()
-        self._checkCancel_call.stop()
+        if self.supervisor is None:
+            self._checkCancel_call.stop()
+        else:
+            self.supervisor.remove(self)
         return self._source_lock.run(
             self.source.jobCompleted,
             self.job_id,
@@ -323,14 +362,17 @@ class JobRunner(object):
         self.logger = logging.getLogger(__name__ + '.JobRunner.' + str(job.id))
 
     def start(self):
+        """
+        Returns a Deferred firing once the job finished or failed to start.
+        """
         self.logger.debug("processing job")
         if self.job is None:
             self.logger.debug("no job found for processing")
             return
-        self.source.jobStarted(self.job).addCallback(self._prepareJob)
+        return self.source.jobStarted(self.job).addCallback(self._prepareJob)
 
     def _prepareJob(self, status):  # pylint: disable=unused-argument
-        self.source.getJobDetails(self.job).addCallbacks(
+        return self.source.getJobDetails(self.job).addCallbacks(
             self._startJob, self._ebStartJob)
 
     def _startJob(self, job_data):
@@ -344,7 +386,7 @@ class JobRunner(object):
             self.reactor, self.daemon_options)
         d = self.running_job.run()
         if d:
-            d.addCallbacks(self._cbJobFinished, self._ebJobFinished)
+            return d.addCallbacks(self._cbJobFinished, self._ebJobFinished)
         else:
             self.logger.info("Job failed to start")
 
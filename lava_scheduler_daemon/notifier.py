@@ -0,0 +1,168 @@
+# Copyright (C) 2015 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Wake-up notifiers for the scheduler daemon.
+
+A notifier calls back into the JobQueue whenever lava_scheduler_app.utils.
+notify_scheduler() was called, so that the daemon can schedule straight away
+instead of waiting for its next poll.
+"""
+
+import logging
+
+from django.db import connection
+
+from lava_scheduler_app.signals import scheduler_wakeup
+from lava_scheduler_app.utils import SCHEDULER_NOTIFY_CHANNEL
+
+
+class LocalNotifier(object):
+    """Notifier listening to the in-process scheduler_wakeup signal.
+
+    Only sees notifications sent from the daemon process itself, this is
+    mostly useful for testing and for databases without LISTEN/NOTIFY.
+    """
+
+    def __init__(self, reactor):
+        self.logger = logging.getLogger(__name__ + '.LocalNotifier')
+        self.reactor = reactor
+        self.callback = None
+
+    def start(self, callback):
+        self.callback = callback
+        scheduler_wakeup.connect(
+            self._received, dispatch_uid='lava_scheduler_daemon.notifier')
+
+    def stop(self):
+        scheduler_wakeup.disconnect(
+            dispatch_uid='lava_scheduler_daemon.notifier')
+        self.callback = None
+
+    def notify(self, reason=None):
+        if self.callback is not None:
+            self.callback(reason)
+
+    def _received(self, sender, reason=None, **kwargs):
+        # The signal may be sent from a database thread.
+        self.reactor.callFromThread(self.notify, reason)
+
+
+class PostgresNotifier(object):
+    """Notifier using PostgreSQL LISTEN on SCHEDULER_NOTIFY_CHANNEL.
+
+    Uses a dedicated autocommit connection which is watched by the reactor,
+    so no thread is blocked waiting for notifications. If the connection is
+    lost the notifier reconnects after RECONNECT_DELAY seconds, the regular
+    poll of the JobQueue keeps scheduling in the meantime.
+    """
+
+    RECONNECT_DELAY = 30
+
+    def __init__(self, reactor):
+        self.logger = logging.getLogger(__name__ + '.PostgresNotifier')
+        self.reactor = reactor
+        self.callback = None
+        self._conn = None
+        self._reconnect_call = None
+
+    def start(self, callback):
+        self.callback = callback
+        self._connect()
+
+    def stop(self):
+        self.callback = None
+        if self._reconnect_call is not None and self._reconnect_call.active():
+            self._reconnect_call.cancel()
+        self._reconnect_call = None
+        self._disconnect()
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+        self._reconnect_call = None
+        try:
+            self._conn = psycopg2.connect(**connection.get_connection_params())
+            self._conn.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cursor = self._conn.cursor()
+            cursor.execute('LISTEN "%s"' % SCHEDULER_NOTIFY_CHANNEL)
+        except psycopg2.Error as exc:
+            self.logger.error("Unable to LISTEN for scheduler events: %s", exc)
+            self._retry()
+            return
+        self.reactor.addReader(self)
+        self.logger.info("Listening for scheduler events")
+        # Anything which happened while we were not listening is missed.
+        self.notify('connected')
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        self.reactor.removeReader(self)
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _retry(self):
+        self._disconnect()
+        if self.callback is not None:
+            self._reconnect_call = self.reactor.callLater(
+                self.RECONNECT_DELAY, self._connect)
+
+    def notify(self, reason=None):
+        if self.callback is not None:
+            self.callback(reason)
+
+    # IReadDescriptor
+
+    def fileno(self):
+        if self._conn is None:
+            return -1
+        return self._conn.fileno()
+
+    def doRead(self):
+        import psycopg2
+        try:
+            self._conn.poll()
+        except psycopg2.Error as exc:
+            self.logger.error("Lost scheduler events connection: %s", exc)
+            self._retry()
+            return
+        reasons = [notify.payload for notify in self._conn.notifies]
+        del self._conn.notifies[:]
+        if reasons:
+            self.logger.debug("Scheduler events: %s", ', '.join(reasons))
+            self.notify(reasons[-1])
+
+    def connectionLost(self, reason):
+        self.logger.error("Scheduler events connection lost")
+        self._retry()
+
+    def logPrefix(self):
+        return 'PostgresNotifier'
+
+
+def get_notifier(reactor, daemon_options):
+    """Returns the notifier the scheduler daemon should use, or None if
+    the daemon should only poll.
+    """
+    if not daemon_options.get('USE_NOTIFY', True):
+        return None
+    if connection.vendor == 'postgresql':
+        return PostgresNotifier(reactor)
+    return LocalNotifier(reactor)
@@ -25,21 +25,38 @@ from twisted.internet.task import LoopingCall
 
 from lava_scheduler_app import utils
 from lava_scheduler_daemon.job import JobRunner, catchall_errback
+from lava_scheduler_daemon.supervisor import JobSupervisor
 from lava_scheduler_daemon.worker import WorkerData
 
 
 class JobQueue(Service):
 
-    def __init__(self, source, dispatcher, reactor, daemon_options):
+    # Notifications usually come in bursts (e.g. a multinode submission),
+    # wait this many seconds so that a single pass handles all of them.
+    WAKEUP_DELAY = 1
+
+    def __init__(self, source, dispatcher, reactor, daemon_options,
+                 notifier=None):
         self.logger = logging.getLogger(__name__ + '.JobQueue')
         self.source = source
         self.dispatcher = dispatcher
         self.reactor = reactor
         self.daemon_options = daemon_options
+        self.notifier = notifier
+        self._heartbeat_call = LoopingCall(self._heartbeat)
+        self._heartbeat_call.clock = reactor
         self._check_job_call = LoopingCall(self._checkJobs)
         self._check_job_call.clock = reactor
+        self._wakeup_call = None
+        self._checking = False
+        self._pending = False
+        self.supervisor = None
+        if daemon_options.get('SUPERVISE_JOBS'):
+            self.supervisor = JobSupervisor(
+                source, dispatcher, reactor, daemon_options,
+                wakeup=self._wakeup)
 
-    def _checkJobs(self):
+    def _heartbeat(self):
         # Update Worker Heartbeat
         #
         # NOTE: This will recide here till we finalize scheduler refactoring
@@ -55,11 +72,37 @@ class JobQueue(Service):
         except (xmlrpclib.Fault, xmlrpclib.ProtocolError) as err:
             worker.logger.error("Heartbeat update failed!")
 
+    def _checkJobs(self):
+        if self._checking:
+            # Run again once the current pass is done, it may have missed
+            # whatever caused this call.
+            self._pending = True
+            return
+        self._checking = True
+        self._pending = False
         self.logger.debug("Refreshing jobs")
-        return self.source.getJobList().addCallback(
+        d = self.source.getJobList().addCallback(
             self._startJobs).addErrback(catchall_errback(self.logger))
+        d.addBoth(self._checkDone)
+
+    def _checkDone(self, result):
+        self._checking = False
+        if self._pending:
+            self._checkJobs()
+        return result
+
+    def _wakeup(self, reason=None):
+        self.logger.debug("Woken up: %s", reason)
+        if self._wakeup_call is None or not self._wakeup_call.active():
+            self._wakeup_call = self.reactor.callLater(
+                self.WAKEUP_DELAY, self._checkJobs)
 
     def _startJobs(self, jobs):
+        if self.supervisor is not None:
+            for job in self.supervisor.select(jobs):
+                self.logger.info("Starting Job: %d ", job.id)
+                self.supervisor.run(job)
+            return
         for job in jobs:
             new_job = JobRunner(self.source, job, self.dispatcher,
                                 self.reactor, self.daemon_options)
@@ -69,8 +112,41 @@ class JobQueue(Service):
 
     def startService(self):
         self.logger.info("\n\nLAVA Scheduler starting\n\n")
-        self._check_job_call.start(20)
+        poll_interval = self.daemon_options.get('POLL_INTERVAL', 20)
+        self._heartbeat_call.start(poll_interval)
+        if self.notifier is not None:
+            # Scheduling is driven by notifications, keep polling slowly
+            # in case one gets lost.
+            self.notifier.start(self._wakeup)
+            poll_interval = self.daemon_options.get(
+                'FALLBACK_POLL_INTERVAL', 120)
+        if self.supervisor is None:
+            self._check_job_call.start(poll_interval)
+            return
+        self.supervisor.start()
+        # The dispatchers of a previous daemon are not children of this
+        # one, their jobs are finished before any other starts.
+        d = self.source.recoverJobs()
+        d.addCallback(self._recovered)
+        d.addErrback(catchall_errback(self.logger))
+        d.addCallback(self._startChecking, poll_interval)
+
+    def _recovered(self, job_ids):
+        for job_id in job_ids:
+            self.logger.warning("Job %d left running by a previous daemon "
+                                "marked incomplete", job_id)
+
+    def _startChecking(self, result, poll_interval):
+        self._check_job_call.start(poll_interval)
 
     def stopService(self):
-        self._check_job_call.stop()
+        if self.notifier is not None:
+            self.notifier.stop()
+        if self._wakeup_call is not None and self._wakeup_call.active():
+            self._wakeup_call.cancel()
+        self._heartbeat_call.stop()
+        if self._check_job_call.running:
+            self._check_job_call.stop()
+        if self.supervisor is not None:
+            self.supervisor.stop()
         return None
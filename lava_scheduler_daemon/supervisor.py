@@ -0,0 +1,179 @@
+# Copyright (C) 2015 Linaro Limited
+#
+# This file is part of LAVA Scheduler.
+#
+# LAVA Scheduler is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License version 3 as
+# published by the Free Software Foundation
+#
+# LAVA Scheduler is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA Scheduler.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Supervision of the dispatchers by the scheduler daemon itself.
+
+By default the daemon starts a schedulermonitor process for every job,
+which loads Django and Twisted only to run one lava-dispatch and check
+every 10 seconds whether its job was canceled. With SUPERVISE_JOBS set in
+SCHEDULER_DAEMON_OPTIONS, the daemon runs the dispatchers as its own
+children instead:
+
+- at most MAX_RUNNING_JOBS jobs run at the same time (0 for no limit), the
+  others stay queued on their reserved device until a job finishes;
+- the cancellation of all the running jobs is checked with one query
+  every CANCEL_CHECK_INTERVAL seconds;
+- each dispatcher still runs in its own session, as under a monitor, so
+  that it can be killed with its process group without affecting the
+  daemon or the other jobs, and the errors of the supervision of one job
+  are logged without stopping the others;
+- the dispatchers are not connected to the daemon by pipes, so that they
+  survive it. The jobs a previous daemon left running are finished as
+  incomplete when the daemon starts, see DatabaseJobSource.recoverJobs,
+  and the size of their log is checked on output.txt.
+"""
+
+import logging
+import os
+
+from twisted.internet.task import LoopingCall
+
+from lava_scheduler_daemon.job import Job, JobRunner, catchall_errback
+
+
+class JobSupervisor(object):
+
+    def __init__(self, source, dispatcher, reactor, daemon_options,
+                 wakeup=None):
+        self.logger = logging.getLogger(__name__ + '.JobSupervisor')
+        self.source = source
+        self.dispatcher = dispatcher
+        self.reactor = reactor
+        self.daemon_options = daemon_options
+        self.max_jobs = daemon_options.get('MAX_RUNNING_JOBS', 0)
+        self.log_size_limit = daemon_options.get('LOG_FILE_SIZE_LIMIT')
+        # called when a job finished, so that queued jobs can start
+        self.wakeup = wakeup
+        # ids of the jobs started by the supervisor and not finished yet
+        self.job_ids = set()
+        # running Job of each board
+        self.jobs = {}
+        self._cancel_call = LoopingCall(self._checkCancel)
+        self._cancel_call.clock = reactor
+
+    def start(self):
+        self._cancel_call.start(
+            self.daemon_options.get('CANCEL_CHECK_INTERVAL', 10), now=False)
+
+    def stop(self):
+        if self._cancel_call.running:
+            self._cancel_call.stop()
+        if self.jobs:
+            self.logger.warning(
+                "stopping while jobs are running on %s",
+                ", ".join(sorted(self.jobs)))
+
+    def _groups(self, jobs):
+        """
+        Splits jobs into the groups which have to start together: the sub
+        jobs of a multinode or vm group, and single jobs.
+        """
+        groups = []
+        by_name = {}
+        for job in jobs:
+            name = job.target_group if job.is_multinode else job.vm_group
+            if not name:
+                groups.append([job])
+            elif name in by_name:
+                by_name[name].append(job)
+            else:
+                by_name[name] = [job]
+                groups.append(by_name[name])
+        return groups
+
+    def select(self, jobs):
+        """
+        Returns the jobs which can start now: jobs not started yet, within
+        the MAX_RUNNING_JOBS limit. A group larger than the limit starts on
+        its own once nothing else runs, so that it is not blocked forever.
+        """
+        jobs = [job for job in jobs if job.id not in self.job_ids]
+        if not self.max_jobs:
+            return jobs
+        selected = []
+        running = len(self.job_ids)
+        for group in self._groups(jobs):
+            if running + len(group) <= self.max_jobs or running == 0:
+                selected.extend(group)
+                running += len(group)
+        if len(selected) < len(jobs):
+            self.logger.debug("%d jobs waiting for a free slot",
+                              len(jobs) - len(selected))
+        return selected
+
+    def run(self, job):
+        self.job_ids.add(job.id)
+        runner = JobRunner(self.source, job, self.dispatcher, self.reactor,
+                           self.daemon_options, job_cls=self._make_job)
+        d = runner.start()
+        if d is None:
+            self._finished(None, job.id)
+            return
+        d.addErrback(catchall_errback(self.logger))
+        d.addBoth(self._finished, job.id)
+
+    def _make_job(self, job, job_data, dispatcher, source, board_name,
+                  reactor, daemon_options):
+        return Job(job.id, job_data, dispatcher, source, board_name, reactor,
+                   daemon_options, supervisor=self)
+
+    def _finished(self, result, job_id):
+        self.job_ids.discard(job_id)
+        if self.wakeup is not None:
+            self.wakeup('job %s finished' % job_id)
+
+    def add(self, job):
+        """
+        Called by Job when its dispatcher started.
+        """
+        self.jobs[job.board_name] = job
+
+    def remove(self, job):
+        """
+        Called by Job when its dispatcher exited.
+        """
+        if self.jobs.get(job.board_name) is job:
+            del self.jobs[job.board_name]
+
+    def _checkCancel(self):
+        boards = []
+        for board_name, job in self.jobs.items():
+            if job._killing:
+                # carry on killing with the next signal
+                job.cancel()
+            elif self._log_too_large(job):
+                job.cancel("exceeded log size limit")
+            else:
+                boards.append(board_name)
+        if not boards:
+            return
+        return self.source.jobsCheckForCancellation(boards).addCallback(
+            self._cancel).addErrback(catchall_errback(self.logger))
+
+    def _log_too_large(self, job):
+        if not self.log_size_limit or not job.output_dir:
+            return False
+        try:
+            size = os.path.getsize(os.path.join(job.output_dir, 'output.txt'))
+        except OSError:
+            return False
+        return size > self.log_size_limit
+
+    def _cancel(self, boards):
+        for board_name in boards:
+            job = self.jobs.get(board_name)
+            if job is not None and not job._killing:
+                job.cancel("killing job by user request")
@@ -1,6 +1,11 @@
 from contextlib import contextmanager
 import datetime
 import os
+import shutil
+import simplejson
+import subprocess
+import tempfile
+from django.test.utils import override_settings
 from django_testscenarios.ubertest import TestCase
 
 from lava_scheduler_app.models import (
@@ -11,7 +16,11 @@ from lava_scheduler_app.models import (
     DevicesUnavailableException,
 )
 from lava_scheduler_app.tests.test_submission import TestCaseWithFactory
-from lava_scheduler_daemon.dbjobsource import DatabaseJobSource, find_device_for_job
+from lava_scheduler_daemon.dbjobsource import (
+    DatabaseJobSource,
+    DeviceMatcher,
+    find_device_for_job,
+)
 
 
 class DatabaseJobSourceTest(TestCaseWithFactory):
@@ -173,6 +182,27 @@ class DatabaseJobSourceTest(TestCaseWithFactory):
         multinode_job2 = TestJob.objects.get(pk=multinode_job2.id)  # reload
         self.assertTrue(all([job.actual_device is not None for job in [multinode_job1, multinode_job2]]))
 
+    def test_multinode_group_ready_when_all_jobs_reserved(self):
+        client, server = self.submit_job(
+            device_group=[
+                {"device_type": "panda", "count": 1, "role": "client"},
+                {"device_type": "panda", "count": 1, "role": "server"},
+            ]
+        )
+        single = self.submit_job(device_type='arndale')
+        single.actual_device = self.arndale01
+        single.save()
+        client.actual_device = self.panda01
+        client.save()
+
+        jobs = [client, server, single]
+        with self.assertNumQueries(1):
+            self.assertEqual([single], self.master._get_ready_jobs(jobs))
+
+        server.actual_device = self.panda02
+        server.save()
+        self.assertEqual(jobs, self.master._get_ready_jobs(jobs))
+
     def test_health_check(self):
 
         self.panda.health_check_job = self.factory.make_job_json(health_check='true')
@@ -185,6 +215,21 @@ class DatabaseJobSourceTest(TestCaseWithFactory):
         self.assertTrue(len(panda_jobs) > 0)
         self.assertTrue(all([job.actual_device is not None for job in panda_jobs]))
 
+    def test_health_checks_submitted_for_each_device(self):
+        self.panda.health_check_job = self.factory.make_job_json(health_check='true')
+        self.panda.save()
+
+        self.master._submit_health_check_jobs()
+        self.master._submit_health_check_jobs()
+
+        health_checks = TestJob.objects.filter(health_check=True)
+        self.assertEqual(
+            ['panda01', 'panda02'],
+            sorted(job.requested_device.hostname for job in health_checks))
+        for job in health_checks:
+            self.assertEqual(job.requested_device.hostname,
+                             simplejson.loads(job.definition)['target'])
+
     def test_one_worker_does_not_mess_with_jobs_from_the_others(self):
         # simulate a worker with no devices configured
         worker = DatabaseJobSource(lambda: [])
@@ -196,6 +241,32 @@ class DatabaseJobSourceTest(TestCaseWithFactory):
         self.assertEqual([], scheduled_jobs)
         self.assertTrue(all([job.status == TestJob.SUBMITTED for job in TestJob.objects.all()]))
 
+    def test_recover_jobs_left_running(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        job = self.submit_job(device_type='panda')
+        self.scheduler_tick()
+        job = TestJob.objects.get(pk=job.pk)
+        self.assertEqual(TestJob.RUNNING, job.status)
+        # a dispatcher of the previous daemon, in a session of its own
+        dispatcher = subprocess.Popen(['sleep', '60'], preexec_fn=os.setsid)
+        self.addCleanup(dispatcher.wait)
+        os.makedirs(job.output_dir)
+        with open(os.path.join(job.output_dir, 'jobpid'), 'w') as f:
+            f.write("%d\n" % dispatcher.pid)
+
+        self.assertEqual([job.id], self.master.recoverJobs_impl())
+        self.assertEqual(-15, dispatcher.wait())
+        job = TestJob.objects.get(pk=job.pk)
+        self.assertEqual(TestJob.INCOMPLETE, job.status)
+        self.assertTrue(job.failure_comment)
+        self.assertIsNone(Device.objects.get(pk=job.actual_device.pk).current_job)
+        self.assertFalse(os.path.exists(os.path.join(job.output_dir, 'jobpid')))
+        self.assertEqual([], self.master.recoverJobs_impl())
+
     def test_multinode_job_across_different_workers(self):
         master = self.master
         worker = DatabaseJobSource(lambda: ['arndale01'])
@@ -455,6 +526,31 @@ class DatabaseJobSourceTest(TestCaseWithFactory):
         chosen_device = find_device_for_job(job, devices)
         self.assertEqual(self.black02, chosen_device)
 
+    def test_device_matcher_does_not_query_per_job(self):
+        """
+        tests that the matcher loads everything it needs up front and
+        keeps the same precedence as find_device_for_job.
+        """
+        group = self.factory.make_group()
+        self.user.groups.add(group)
+        self.black03.is_public = False
+        self.black03.group = group
+        self.black03.save()
+        jobs = [
+            self.submit_job(device_type='beaglebone', tags=[self.common_tag.name]),
+            self.submit_job(device_type='beaglebone', tags=[self.exclusion_tag.name]),
+            self.submit_job(target='panda01', device_type='panda'),
+            self.submit_job(device_type='arndale'),
+        ]
+        devices = [self.panda02, self.panda01, self.black01, self.black02, self.black03]
+        matcher = DeviceMatcher(jobs, devices)
+        with self.assertNumQueries(0):
+            chosen = [matcher.find_device_for_job(job) for job in jobs]
+        self.assertEqual([self.black01, self.black03, self.panda01, None], chosen)
+
+        matcher.remove(self.black01)
+        self.assertEqual(self.black02, matcher.find_device_for_job(jobs[0]))
+
     def test_find_device_with_single_job_tag(self):
         """
         tests handling of jobs with less tags than supported but still
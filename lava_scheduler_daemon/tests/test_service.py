@@ -0,0 +1,47 @@
+from django.test import SimpleTestCase
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from lava_scheduler_daemon.notifier import LocalNotifier
+from lava_scheduler_daemon.service import JobQueue
+
+
+class FakeJobSource(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def getJobList(self):
+        d = defer.Deferred()
+        self.calls.append(d)
+        return d
+
+
+class JobQueueWakeupTest(SimpleTestCase):
+
+    def setUp(self):
+        super(JobQueueWakeupTest, self).setUp()
+        self.clock = Clock()
+        self.source = FakeJobSource()
+        self.notifier = LocalNotifier(self.clock)
+        self.queue = JobQueue(self.source, 'lava-dispatch', self.clock, {},
+                              notifier=self.notifier)
+        self.notifier.start(self.queue._wakeup)
+        self.addCleanup(self.notifier.stop)
+
+    def test_notifications_are_coalesced(self):
+        self.notifier.notify('submit')
+        self.notifier.notify('device panda01')
+        self.assertEqual(self.source.calls, [])
+        self.clock.advance(JobQueue.WAKEUP_DELAY)
+        self.assertEqual(len(self.source.calls), 1)
+
+    def test_notification_during_pass_runs_again(self):
+        self.queue._checkJobs()
+        self.notifier.notify('cancel')
+        self.clock.advance(JobQueue.WAKEUP_DELAY)
+        self.assertEqual(len(self.source.calls), 1)
+        self.source.calls[0].callback([])
+        self.assertEqual(len(self.source.calls), 2)
+        self.source.calls[1].callback([])
+        self.assertEqual(len(self.source.calls), 2)
@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.test import SimpleTestCase
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from lava_scheduler_daemon.job import Job
+from lava_scheduler_daemon.supervisor import JobSupervisor
+
+
+class FakeTestJob(object):
+
+    def __init__(self, job_id, target_group=None):
+        self.id = job_id
+        self.target_group = target_group
+        self.is_multinode = target_group is not None
+        self.vm_group = None
+
+
+class FakeJob(object):
+
+    def __init__(self, board_name, output_dir=None):
+        self.board_name = board_name
+        self.output_dir = output_dir
+        self._killing = False
+        self.canceled = []
+
+    def cancel(self, reason=None):
+        self._killing = True
+        self.canceled.append(reason)
+
+
+class FakeJobSource(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def jobsCheckForCancellation(self, board_names):
+        d = defer.Deferred()
+        self.calls.append((board_names, d))
+        return d
+
+
+class JobSupervisorTest(SimpleTestCase):
+
+    def setUp(self):
+        super(JobSupervisorTest, self).setUp()
+        self.clock = Clock()
+        self.source = FakeJobSource()
+        self.supervisor = JobSupervisor(
+            self.source, 'lava-dispatch', self.clock,
+            {'MAX_RUNNING_JOBS': 3, 'CANCEL_CHECK_INTERVAL': 10})
+
+    def test_select_limits_running_jobs(self):
+        self.supervisor.job_ids.add(1)
+        jobs = [FakeTestJob(1), FakeTestJob(2),
+                FakeTestJob(3, 'group'), FakeTestJob(4, 'group'),
+                FakeTestJob(5)]
+        # the group does not fit next to jobs 1 and 2
+        self.assertEqual([2, 5], [job.id for job in
+                                  self.supervisor.select(jobs)])
+
+    def test_select_large_group_when_idle(self):
+        jobs = [FakeTestJob(n, 'group') for n in range(4)]
+        self.assertEqual(4, len(self.supervisor.select(jobs)))
+
+    def test_cancellation_is_checked_in_one_call(self):
+        jobs = dict((name, FakeJob(name)) for name in ['panda01', 'panda02'])
+        for job in jobs.values():
+            self.supervisor.add(job)
+        self.supervisor.start()
+        self.addCleanup(self.supervisor.stop)
+        self.clock.advance(10)
+        self.assertEqual(1, len(self.source.calls))
+        boards, d = self.source.calls[0]
+        self.assertEqual(['panda01', 'panda02'], sorted(boards))
+        d.callback(['panda02'])
+        self.assertEqual([], jobs['panda01'].canceled)
+        self.assertEqual(["killing job by user request"],
+                         jobs['panda02'].canceled)
+
+        # the job being killed gets the next signal without a query
+        self.clock.advance(10)
+        self.assertEqual(2, len(self.source.calls))
+        self.assertEqual(['panda01'], self.source.calls[1][0])
+        self.assertEqual(2, len(jobs['panda02'].canceled))
+
+    def test_log_size_limit(self):
+        self.supervisor.log_size_limit = 10
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(tmpdir, 'output.txt'), 'w') as f:
+            f.write('more than ten bytes\n')
+        job = FakeJob('panda01', tmpdir)
+        self.supervisor.add(job)
+        self.supervisor._checkCancel()
+        self.assertEqual(["exceeded log size limit"], job.canceled)
+        self.assertEqual([], self.source.calls)
+
+
+class FakeProcess(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.status = None
+
+
+class FakeReactor(Clock):
+
+    def __init__(self, child):
+        Clock.__init__(self)
+        self.child = child
+
+    def spawnProcess(self, protocol, executable, args, env=None,
+                     childFDs=None):
+        self.spawned = (executable, args)
+        self.childFDs = childFDs
+        # like a child which has not called setsid yet, still in our group
+        return FakeProcess(self.child.pid)
+
+
+class SupervisedJobTest(SimpleTestCase):
+
+    def test_jobpid_is_not_the_daemon_group(self):
+        child = subprocess.Popen(['sleep', '60'])
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+        reactor = FakeReactor(child)
+        supervisor = JobSupervisor(FakeJobSource(), 'lava-dispatch', reactor,
+                                   {})
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        job = Job(1, {'timeout': 60}, 'lava-dispatch', None, 'panda01',
+                  reactor, {'MIN_JOB_TIMEOUT': 60}, supervisor=supervisor)
+        job._run(os.path.join(tmpdir, 'output'))
+        self.addCleanup(os.unlink, job._json_file)
+        self.assertEqual('setsid', reactor.spawned[0])
+        # no pipe to the daemon, the errors go to the log
+        self.assertEqual([0, 1, 2], sorted(reactor.childFDs))
+        self.assertTrue(all(isinstance(fd, int)
+                            for fd in reactor.childFDs.values()))
+        self.assertTrue(os.path.exists(os.path.join(tmpdir, 'output',
+                                                    'output.txt')))
+        self.assertIs(job, supervisor.jobs['panda01'])
+        with open(job._pidrecord) as f:
+            self.assertNotEqual(int(f.read()), os.getpgrp())
@@ -69,6 +69,8 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    # only active with DEBUG
+    'lava.utils.debug.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'lava_server.urls'
@@ -247,6 +249,11 @@ LOGGING = {
             'handlers': ['logfile'],
             'level': 'INFO',
             'propagate': True,
+        },
+        'lava.utils.debug': {
+            'handlers': ['logfile'],
+            'level': 'WARNING',
+            'propagate': True,
         }
     }
 }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+#  logfile-benchmark.py
+#
+#  Copyright 2015 Linaro Limited
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the single pass LogClassifier of lava_scheduler_app.logfile_helper
+with the previous implementation, which parsed the log once for the errors,
+once for the log messages and once for the sections, on a synthetic job log.
+
+Run from the top of the source tree:
+
+ $ python share/logfile-benchmark.py --size 100
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lava_scheduler_app.logfile_helper import LogClassifier  # noqa
+
+
+ERROR_TYPES = ["Infrastructure Error:",
+               "Bootloader Error:",
+               "Kernel Error:",
+               "Userspace Error:",
+               "Test Shell Error:",
+               "Master Image Error:",
+               "OperationFailed:"]
+
+
+def reference_errors(logfile):
+    errors = []
+    for line in logfile:
+        for error in ERROR_TYPES:
+            index = line.find(error)
+            if index != -1:
+                errors.append(line[index:])
+    return list(set(errors))
+
+
+def reference_messages(logfile):
+    logs = []
+    log_prefix = '<LAVA_DISPATCHER>'
+    action_begin = '[ACTION-B]'
+    level_pattern = re.compile('....-..-.. (..:..:.. .. ([A-Z]+): .*)')
+    for line in logfile:
+        pos = line.find(log_prefix)
+        if pos == -1:
+            continue
+        if pos > 0:
+            line = line[pos:-1]
+        line = line[len(log_prefix):].strip()
+        match = level_pattern.match(line)
+        if not match:
+            continue
+        line = match.group(1)
+        if len(line) > 120:
+            line = line[:120] + '...'
+        if line.find(action_begin) != -1:
+            logs.append((match.group(2), line, "action"))
+        else:
+            logs.append((match.group(2), line, ""))
+    return logs
+
+
+def reference_sections(logfile):
+    sections = []
+    cur_type = None
+    cur = []
+    for line in logfile:
+        line = line.replace('\r', '')
+        line = unicode(line, 'ascii', 'replace')
+        if not line:
+            continue
+        if line == 'Traceback (most recent call last):\n':
+            section_type = 'traceback'
+        elif cur_type == 'traceback':
+            section_type = 'traceback'
+        elif line.find("<LAVA_DISPATCHER>") != -1 \
+                or line.find("lava_dispatcher") != -1 \
+                or line.find("CriticalError:") != -1:
+            section_type = 'log'
+        else:
+            section_type = 'console'
+        if section_type != cur_type:
+            if cur_type is not None:
+                sections.append((cur_type, len(cur), ''.join(cur)))
+            cur_type = section_type
+            cur = []
+        cur.append(line)
+        if section_type == 'traceback' and line != 'Traceback (most recent call last):\n' \
+                and not line.startswith(' '):
+            sections.append((cur_type, len(cur), ''.join(cur)))
+            cur_type = None
+            cur = []
+    if cur_type is not None:
+        sections.append((cur_type, len(cur), ''.join(cur)))
+    return sections
+
+
+def make_log(path, size):
+    random.seed(42)
+    console = [
+        "[    1.234567] usb 1-1: new high-speed USB device number 2\r\n",
+        "root@linaro:~# ls /lava/bin\r\n",
+        "Loading kernel modules... done.\r\n",
+    ]
+    dispatcher = [
+        "<LAVA_DISPATCHER>2015-01-01 10:00:00 AM DEBUG: expect (120): 'root@linaro'\n",
+        "<LAVA_DISPATCHER>2015-01-01 10:00:00 AM INFO: [ACTION-B] lava_test_shell is started with args: {}\n",
+        "<LAVA_DISPATCHER>2015-01-01 10:00:00 AM ERROR: Infrastructure Error: network down\n",
+    ]
+    written = 0
+    with open(path, 'w') as f:
+        while written < size:
+            # console output comes in runs, between bursts of dispatcher
+            # messages.
+            if random.random() < 0.3:
+                lines = [random.choice(dispatcher)
+                         for _ in range(random.randint(1, 10))]
+            else:
+                lines = [random.choice(console)
+                         for _ in range(random.randint(1, 50))]
+            data = ''.join(lines)
+            f.write(data)
+            written += len(data)
+
+
+def timed(label, func, path):
+    start = time.time()
+    with open(path) as logfile:
+        func(logfile)
+    elapsed = time.time() - start
+    print("%-32s %8.2fs" % (label, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=100,
+                        help="size of the synthetic log, in MB")
+    parser.add_argument('--log', help="use this log instead of a synthetic one")
+    args = parser.parse_args()
+
+    path = args.log
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        print("Writing a %d MB synthetic log to %s" % (args.size, path))
+        make_log(path, args.size * 1024 * 1024)
+    try:
+        reference = sum([
+            timed("getDispatcherErrors (old)", reference_errors, path),
+            timed("getDispatcherLogMessages (old)", reference_messages, path),
+            timed("formatLogFile (old)", reference_sections, path),
+        ])
+        print("%-32s %8.2fs" % ("three passes", reference))
+        single = timed("LogClassifier (one pass)",
+                       lambda logfile: LogClassifier(keep_content=True).classify(logfile),
+                       path)
+        print("speedup: %.1fx" % (reference / single))
+    finally:
+        if args.log is None:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()